@@ -0,0 +1,88 @@
+"""
+Benchmark do "quem trabalhou?" para o servidor inteiro:
+motor em lote (bot.attendance, uma consulta + NumPy) contra o caminho atual
+por usuário (timeline.durations_between: duas consultas + loop por janela).
+
+Cria um banco temporário com dados sintéticos, confere que os dois caminhos
+dão o mesmo resultado e imprime os tempos.
+
+Uso (na raiz do repositório):
+  python -m bench.attendance_bench --users 500 --days 30 --windows 1 --repeat 5
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from bot import attendance, db, timeline
+
+GUILD = 1
+DAY = 86400
+
+def populate(users: int, days: int, seed: int) -> int:
+    rng = random.Random(seed)
+    end = db.now_ts()
+    start = end - days * DAY
+    rows = []
+    for uid in range(1, users + 1):
+        t = start + rng.randint(0, 3600)
+        while t < end:
+            rows.append((uid, f"user{uid}", rng.choice(("online", "idle", "dnd", "offline")), t, GUILD))
+            t += rng.randint(300, 4 * 3600)
+    rows.sort(key=lambda r: r[3])
+    for i in range(0, len(rows), 50000):
+        db.log_presence_many(rows[i:i + 50000])
+    return len(rows)
+
+def best_of(repeat: int, fn):
+    best, result = float("inf"), None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=500)
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--windows", type=int, default=1, help="quantas janelas diárias (últimos N dias)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--repeat", type=int, default=5, help="rodadas por caminho (vale a melhor)")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.init_db(os.path.join(tmp, "bench.db"))
+        n = populate(args.users, args.days, args.seed)
+
+        now = db.now_ts()
+        windows = [(now - (i + 1) * DAY + 8 * 3600, now - (i + 1) * DAY + 18 * 3600) for i in range(args.windows)]
+        windows.reverse()
+        users = list(range(1, args.users + 1))
+
+        def per_user():
+            return {
+                uid: [timeline.durations_between(GUILD, uid, a, b) for a, b in windows]
+                for uid in users
+            }
+
+        # melhor de N (a primeira rodada aquece o cache de páginas do SQLite)
+        t_user, ref = best_of(args.repeat, per_user)
+        t_batch, got = best_of(args.repeat, lambda: attendance.attendance_table(GUILD, users, windows))
+
+        diff = max(
+            abs(ref[u][w][k] - got[u][w][k])
+            for u in users for w in range(len(windows)) for k in timeline.STATUS_KEYS
+        )
+        db.close_db()
+
+    print(f"linhas: {n} | usuários: {args.users} | janelas: {args.windows}")
+    print(f"por usuário: {t_user * 1000:.1f} ms ({2 * args.users * args.windows} consultas)")
+    print(f"em lote:     {t_batch * 1000:.1f} ms (1 consulta) | speedup {t_user / t_batch:.1f}x")
+    print(f"maior diferença: {diff:.6f}s (numpy {np.__version__})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Gerador de presence_log sintético com padrão de expediente.
+
+Cada usuário tem um perfil próprio (horário de chegada/saída, almoço,
+pausas e reuniões) em WORK_TZ: em dia útil fica online no expediente, idle
+no almoço e nas pausas, dnd nas reuniões e offline fora do horário (às vezes
+volta à noite); no fim de semana aparece pouco. Os eventos são as mudanças
+de status, como o cog Presence grava; com --sample-every, cada membro também
+ganha uma linha a cada N segundos, como o sampler no modo "full" (é isso que
+leva a dezenas de milhões de linhas).
+
+O banco é gerado dia a dia (NumPy para as amostras, inserção em lotes em
+ordem de tempo), então a memória fica no tamanho de um dia de dados, de
+milhares até ~100M linhas.
+
+Uso (na raiz do repositório):
+  python -m bench.generate --out bench.db --guilds 2 --users 500 --days 30
+  python -m bench.generate --out big.db --users 2000 --days 35 --sample-every 60 --rollup
+"""
+import argparse
+import os
+import random
+import time
+from datetime import date, timedelta
+from typing import List, Tuple
+
+import numpy as np
+
+from bot import db, rollup, worktime
+
+DAY = 86400
+INSERT_ROWS = 100000
+ONLINE, IDLE, DND, OFFLINE = (db.STATUS_CODES[k] for k in ("online", "idle", "dnd", "offline"))
+
+def guild_ids(guilds: int) -> List[int]:
+    return [100000000000000000 + g for g in range(1, guilds + 1)]
+
+def user_ids(guild_index: int, users: int) -> List[int]:
+    return [200000000000000000 + guild_index * 10000000 + u for u in range(1, users + 1)]
+
+class Profile:
+    """Hábitos de um usuário (fixos para a série inteira)."""
+
+    def __init__(self, rng: random.Random):
+        self.worker = rng.random() < 0.9
+        self.arrive = rng.gauss(8.5, 0.5) * 3600    # segundos desde a meia-noite local
+        self.leave = rng.gauss(17.75, 0.5) * 3600
+        self.lunch = rng.gauss(12.25, 0.4) * 3600
+        self.breaks = rng.uniform(0.5, 3.0)         # pausas idle por dia (média)
+        self.meetings = rng.uniform(0.0, 2.5)       # reuniões dnd por dia (média)
+        self.evening = rng.uniform(0.0, 0.3)        # chance de voltar à noite
+        self.weekend = rng.uniform(0.0, 0.15)       # chance de aparecer no fim de semana
+
+def _day_segments(
+    p: Profile, rng: random.Random, nrng: np.random.Generator, midnight: int, workday: bool
+) -> List[Tuple[int, int]]:
+    """Mudanças de status (instante, código) de um dia, a partir de offline à meia-noite."""
+    ev: List[Tuple[int, int]] = []
+    if workday and p.worker and rng.random() > 0.05:  # 5% de faltas
+        start = midnight + int(p.arrive + rng.gauss(0, 900))
+        end = midnight + int(p.leave + rng.gauss(0, 1200))
+        ev.append((start, ONLINE))
+        busy: List[Tuple[int, int, int]] = []
+        lunch = midnight + int(p.lunch + rng.gauss(0, 900))
+        busy.append((lunch, lunch + int(rng.uniform(45, 75) * 60), IDLE))
+        for _ in range(nrng.poisson(p.meetings)):
+            s = rng.randint(start, max(start, end - 1800))
+            busy.append((s, s + rng.choice((30, 30, 45, 60)) * 60, DND))
+        for _ in range(nrng.poisson(p.breaks)):
+            s = rng.randint(start, max(start, end - 600))
+            busy.append((s, s + int(rng.uniform(5, 25) * 60), IDLE))
+        busy.sort()
+        t = start
+        for s, e, code in busy:
+            s, e = max(s, t), min(e, end)
+            if e <= s:
+                continue
+            ev.append((s, code))
+            ev.append((e, ONLINE))
+            t = e
+        ev.append((end, OFFLINE))
+        if rng.random() < p.evening:
+            s = midnight + int(rng.uniform(19.5, 22.5) * 3600)
+            ev.append((s, ONLINE))
+            ev.append((min(midnight + DAY - 60, s + int(rng.uniform(10, 90) * 60)), OFFLINE))
+    elif rng.random() < p.weekend:
+        s = midnight + int(rng.uniform(10, 20) * 3600)
+        ev.append((s, ONLINE))
+        ev.append((s + int(rng.uniform(10, 120) * 60), OFFLINE))
+    return ev
+
+def generate(
+    guilds: int,
+    users: int,
+    days: int,
+    sample_every: int,
+    seed: int,
+    progress: bool = True,
+) -> int:
+    """Preenche o banco já aberto (db.init_db). Devolve o número de linhas inseridas."""
+    rng = random.Random(seed)
+    nrng = np.random.default_rng(seed)
+    gids = guild_ids(guilds)
+    members = {g: user_ids(i, users) for i, g in enumerate(gids, start=1)}
+    profiles = {(g, u): Profile(rng) for g in gids for u in members[g]}
+    workdays = {int(x) for x in os.getenv("WORK_DAYS", "0,1,2,3,4").split(",") if x.strip() != ""}
+
+    with db.write_conn() as conn, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO users (user_id, username) VALUES (?, ?)",
+            [(u, f"user{u % 10000000}") for g in gids for u in members[g]],
+        )
+
+    today = worktime.local_date(db.now_ts())
+    first = today - timedelta(days=days - 1)
+    last_status = {key: OFFLINE for key in profiles}
+    horizon = db.now_ts()  # hoje só até agora: nada no futuro
+    total = 0
+    t0 = time.perf_counter()
+    for i in range(days):
+        d: date = first + timedelta(days=i)
+        midnight = worktime.day_bounds(d)[0]
+        next_midnight = min(worktime.day_bounds(d)[3], horizon)
+        workday = d.weekday() in workdays
+        ts_parts, g_parts, u_parts, c_parts = [], [], [], []
+        for (g, u), p in profiles.items():
+            segs = sorted(
+                (ts, c) for ts, c in _day_segments(p, rng, nrng, midnight, workday) if midnight <= ts < next_midnight
+            )
+            if segs:
+                ts_arr = np.fromiter((ts for ts, _ in segs), dtype=np.int64, count=len(segs))
+                c_arr = np.fromiter((c for _, c in segs), dtype=np.int64, count=len(segs))
+                ts_parts.append(ts_arr)
+                c_parts.append(c_arr)
+                g_parts.append(np.full(len(segs), g, dtype=np.int64))
+                u_parts.append(np.full(len(segs), u, dtype=np.int64))
+            if sample_every > 0:
+                # amostras do sampler: o status vigente em cada instante
+                phase = (u * 7919) % sample_every
+                samples = np.arange(midnight + phase, next_midnight, sample_every, dtype=np.int64)
+                if segs:
+                    starts = ts_arr
+                    idx = np.searchsorted(starts, samples, side="right") - 1
+                    codes = np.where(idx >= 0, c_arr[np.maximum(idx, 0)], last_status[(g, u)])
+                else:
+                    codes = np.full(len(samples), last_status[(g, u)], dtype=np.int64)
+                ts_parts.append(samples)
+                c_parts.append(codes.astype(np.int64))
+                g_parts.append(np.full(len(samples), g, dtype=np.int64))
+                u_parts.append(np.full(len(samples), u, dtype=np.int64))
+            if segs:
+                last_status[(g, u)] = segs[-1][1]
+        if not ts_parts:
+            continue
+        ts_all = np.concatenate(ts_parts)
+        order = np.argsort(ts_all, kind="stable")
+        cols = [np.concatenate(parts)[order] for parts in (g_parts, u_parts, c_parts)]
+        ts_all = ts_all[order]
+        n = len(ts_all)
+        with db.write_conn() as conn:
+            for lo in range(0, n, INSERT_ROWS):
+                hi = lo + INSERT_ROWS
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO presence_log (guild_id, user_id, status, timestamp) VALUES (?, ?, ?, ?)",
+                        zip(cols[0][lo:hi].tolist(), cols[1][lo:hi].tolist(), cols[2][lo:hi].tolist(), ts_all[lo:hi].tolist()),
+                    )
+        total += n
+        if progress:
+            rate = total / max(1e-9, time.perf_counter() - t0)
+            print(f"[generate] {d} {n} linhas (total {total}, {rate:,.0f} linhas/s)")
+    return total
+
+def build_rollup(batch: int = 200000) -> None:
+    """Consolida o rollup diário inteiro (como o cog Rollup faria aos poucos)."""
+    while rollup.process_pending(batch) >= batch:
+        pass
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--out", required=True, help="arquivo SQLite a criar (não pode existir)")
+    ap.add_argument("--guilds", type=int, default=1)
+    ap.add_argument("--users", type=int, default=500, help="membros por servidor")
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--sample-every", type=int, default=0, help="linha do sampler a cada N s por membro (0 = só mudanças)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--rollup", action="store_true", help="consolida presence_daily no fim")
+    args = ap.parse_args()
+
+    if os.path.exists(args.out):
+        raise SystemExit(f"{args.out} já existe")
+    # carga inicial: sem fsync por transação
+    db.init_db(args.out, synchronous="OFF", readers=1)
+    t0 = time.perf_counter()
+    try:
+        n = generate(args.guilds, args.users, args.days, args.sample_every, args.seed)
+        print(f"[generate] {n} linhas em {time.perf_counter() - t0:.1f}s -> {args.out}")
+        if args.rollup:
+            t1 = time.perf_counter()
+            build_rollup()
+            print(f"[generate] rollup consolidado em {time.perf_counter() - t1:.1f}s")
+    finally:
+        db.close_db()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+Benchmark dos caminhos consulta + cálculo dos comandos, sem Discord.
+
+Roda sobre um banco gerado por bench.generate (ou uma cópia do banco de
+produção, já migrada: o banco é aberto só para leitura) as mesmas funções
+que os comandos chamam no executor:
+  durations_in_window       !trabalhou / !ausente (uma janela, um usuário)
+  business_overlap_x1000    _business_overlap_seconds, 1000 intervalos
+  business_durations        !time_status (7 dias úteis, um usuário)
+  leaderboard / stats       !leaderboard / !stats (7 dias)
+  report                    !report (totais por status + top 10)
+  export_csv                !export_csv 7 dias (contagens, .csv.gz)
+  export_csv_raw            !export_csv bruto (1 dia, todos os eventos)
+  trabalhou_todos           !trabalhou_todos (servidor inteiro, 1 janela)
+Cada caso roda --iterations vezes (usuário/janela sorteados com --seed) e
+uma vez a mais sob tracemalloc para o pico de memória do Python. O
+resultado sai em JSON (p50/p99/média em ms, pico em KiB) para comparar builds:
+
+  python -m bench.queries_bench --db bench.db --out antes.json
+  python -m bench.queries_bench --db bench.db --out depois.json
+  python -m bench.queries_bench --compare antes.json depois.json
+
+Os casos dos cogs (durations_in_window, business_*) importam os módulos dos
+cogs e precisam das dependências do bot instaladas (discord.py).
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from bot import attendance, counts, db, export, rollup, worktime
+
+try:
+    import resource  # só Unix: pico de RSS do processo
+except ImportError:
+    resource = None
+
+DAY = 86400
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Percentil por posição mais próxima (q em 0..100)."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(q / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+def run_case(fn: Callable[[], object], iterations: int) -> dict:
+    fn()  # aquece o cache de páginas do SQLite e os imports
+    times = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    times.sort()
+    return {
+        "n": iterations,
+        "p50_ms": round(percentile(times, 50), 3),
+        "p99_ms": round(percentile(times, 99), 3),
+        "mean_ms": round(sum(times) / len(times), 3),
+        "min_ms": round(times[0], 3),
+        "max_ms": round(times[-1], 3),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+def _git_rev() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def build_cases(guild_id: int, users: List[int], rng: random.Random, tmp: str) -> Dict[str, Callable[[], object]]:
+    now = db.now_ts()
+    since = now - 7 * DAY
+    today = worktime.local_date(now)
+    # janelas úteis dos últimos 14 dias (o expediente de hoje pode não ter começado)
+    windows = [worktime.day_bounds(today - timedelta(days=i))[1:3] for i in range(1, 15)]
+    windows = [w for w in windows if worktime.local_date(w[0]).weekday() in worktime.BIZ_DAYS] or windows
+
+    def pick_user() -> int:
+        return rng.choice(users)
+
+    def pick_window():
+        return rng.choice(windows)
+
+    cases: Dict[str, Callable[[], object]] = {}
+    try:
+        from bot.cogs import duration, workcheck
+    except ImportError as e:
+        print(f"[bench] casos dos cogs ignorados ({e})", file=sys.stderr)
+    else:
+        def durations_in_window():
+            a, b = pick_window()
+            return workcheck._durations_in_window(
+                guild_id, pick_user(),
+                datetime.fromtimestamp(a, timezone.utc), datetime.fromtimestamp(b, timezone.utc),
+            )
+
+        def business_overlap_x1000():
+            total = 0.0
+            for _ in range(1000):
+                a = now - rng.uniform(0, 30 * DAY)
+                b = a + rng.uniform(60, 3 * DAY)
+                total += duration._business_overlap_seconds(
+                    datetime.fromtimestamp(a, timezone.utc), datetime.fromtimestamp(b, timezone.utc)
+                )
+            return total
+
+        def business_durations():
+            end = datetime.fromtimestamp(now, timezone.utc)
+            return duration._business_durations(guild_id, pick_user(), end - timedelta(days=7), end)
+
+        cases["durations_in_window"] = durations_in_window
+        cases["business_overlap_x1000"] = business_overlap_x1000
+        cases["business_durations"] = business_durations
+
+    cases["leaderboard"] = lambda: counts.leaderboard(guild_id, since, 10)
+    cases["stats"] = lambda: counts.user_status_counts(guild_id, pick_user(), since)
+    cases["report"] = lambda: (counts.guild_status_counts(guild_id, since), counts.top_users(guild_id, since, 10))
+
+    def export_csv():
+        out = tempfile.mkdtemp(dir=tmp)
+        return export.export_totals(guild_id, since, out, "bench", 25 * 1024 * 1024)
+
+    def export_csv_raw():
+        d = today - timedelta(days=1)
+        out = tempfile.mkdtemp(dir=tmp)
+        start, _, _, end = worktime.day_bounds(d)
+        return export.export_raw(guild_id, start, end, None, out, "bench", 25 * 1024 * 1024)
+
+    def trabalhou_todos():
+        return attendance.attendance_table(guild_id, users, [pick_window()])
+
+    cases["export_csv"] = export_csv
+    cases["export_csv_raw"] = export_csv_raw
+    cases["trabalhou_todos"] = trabalhou_todos
+    return cases
+
+def open_read_only(path: str) -> None:
+    """
+    Abre o banco só para leitura: sem conexão de escrita nem migrações, para
+    não alterar (nem cronometrar a migração de) uma cópia do banco de produção.
+    """
+    if not os.path.exists(path):
+        sys.exit(f"[bench] banco não encontrado: {path} (gere um com python -m bench.generate)")
+    db.init_db(path, readers=1, read_only=True)
+    try:
+        with db.read_conn() as conn:
+            version = db.schema_version(conn)
+    except sqlite3.OperationalError:
+        version = 0
+    if version < db.latest_schema_version():
+        db.close_db()
+        sys.exit(
+            f"[bench] {path} está no schema {version} (atual: {db.latest_schema_version()}). "
+            "Migre uma cópia antes (suba o bot apontando para ela, ou "
+            "python -c \"from bot import db; db.init_db('copia.db')\") ou gere um banco com bench.generate."
+        )
+
+def run(args) -> dict:
+    open_read_only(args.db)
+    try:
+        total_rows = db.fetch_one("SELECT COUNT(*) FROM presence_log")[0]
+        guild_id = args.guild or db.fetch_one("SELECT guild_id FROM presence_log LIMIT 1")[0]
+        users = [u for (u,) in db.fetch_all(
+            "SELECT DISTINCT user_id FROM presence_log WHERE guild_id = ?", (guild_id,)
+        )]
+        rng = random.Random(args.seed)
+        results = {}
+        with tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+            cases = build_cases(guild_id, users, rng, tmp)
+            only = set(args.cases.split(",")) if args.cases else None
+            for name, fn in cases.items():
+                if only and name not in only:
+                    continue
+                results[name] = run_case(fn, args.iterations)
+                r = results[name]
+                print(f"[bench] {name:24s} p50 {r['p50_ms']:>10.2f} ms | p99 {r['p99_ms']:>10.2f} ms | "
+                      f"pico {r['peak_kib']:>10.1f} KiB", file=sys.stderr)
+    finally:
+        db.close_db()
+    return {
+        "meta": {
+            "db": os.path.abspath(args.db),
+            "db_bytes": os.path.getsize(args.db),
+            "rows": total_rows,
+            "guild_id": guild_id,
+            "users": len(users),
+            "iterations": args.iterations,
+            "seed": args.seed,
+            "rollup_enabled": rollup.ENABLED,
+            "git": _git_rev(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+def compare(old_path: str, new_path: str) -> None:
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)["results"]
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)["results"]
+    print(f"{'caso':24s} {'p50 antes':>12s} {'p50 depois':>12s} {'razão':>8s} {'p99 razão':>10s}")
+    for name in sorted(set(old) & set(new)):
+        a, b = old[name], new[name]
+        r50 = b["p50_ms"] / a["p50_ms"] if a["p50_ms"] else float("inf")
+        r99 = b["p99_ms"] / a["p99_ms"] if a["p99_ms"] else float("inf")
+        print(f"{name:24s} {a['p50_ms']:>10.2f}ms {b['p50_ms']:>10.2f}ms {r50:>7.2f}x {r99:>9.2f}x")
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", help="banco gerado por bench.generate")
+    ap.add_argument("--guild", type=int, default=0, help="servidor a medir (padrão: o primeiro do log)")
+    ap.add_argument("--iterations", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--cases", default="", help="lista separada por vírgula (padrão: todos)")
+    ap.add_argument("--out", help="arquivo JSON de saída (padrão: stdout)")
+    ap.add_argument("--compare", nargs=2, metavar=("ANTES", "DEPOIS"), help="compara dois JSON de resultado")
+    args = ap.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if not args.db:
+        ap.error("--db é obrigatório")
+    report = run(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,538 @@
+"""
+Replay de eventos do gateway contra os cogs reais, sem Discord.
+
+Monta servidores e membros falsos (com discord.Status de verdade), instancia
+os cogs Presence e Sampler como o run.py faz e entrega a eles um fluxo de
+presence_update / message / member_join / member_remove no ritmo pedido,
+com uma task por listener como o dispatch do discord.py. O caminho medido é
+o de produção: listener -> db.queue_presence -> PresenceWriter -> SQLite
+(num banco temporário, com os PRAGMAs e o escritor configurados pelo .env).
+
+Fontes de eventos:
+  gerado (padrão)   --guilds x --members, --rate eventos/s por --duration s
+  --events A.jsonl  gravado, uma linha por evento:
+                      {"t": 0.25, "type": "presence", "guild": 1, "user": 7, "status": "idle"}
+                      {"t": 0.30, "type": "message", "guild": 1, "user": 7}
+                      {"type": "join" | "remove", "guild": 1, "user": 8, "status": "online"}
+                      {"type": "guild", "guild": 1, "members": [[7, "online"], [9, "dnd", true]]}
+                    ("t" em segundos desde o início; sem --rate, o ritmo é o de "t" / --speed)
+  --from-db B.db    as mudanças de status gravadas num presence_log (do bot ou de
+                    bench.generate), em ordem de tempo, como presence_update
+
+Mede: vazão sustentada (eventos entregues e linhas gravadas por segundo),
+latência evento -> commit das linhas do Presence (p50/p95/p99), latência dos
+handlers e atraso do event loop. O resultado sai em JSON (--out).
+
+Uso (na raiz do repositório):
+  python -m bench.replay --rate 5000 --duration 60 --guilds 4 --members 5000
+  python -m bench.replay --from-db bench.db --rate 20000 --out replay.json
+  SAMPLE_MODE=changes SAMPLE_EVERY_SECONDS=10 python -m bench.replay --rate 2000
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# o Config exige um token; aqui nada se conecta ao Discord
+os.environ.setdefault("DISCORD_BOT_TOKEN", "replay")
+
+import discord
+
+from bench.queries_bench import _git_rev, percentile
+from bot import cache, chunking, db, livecounts, logs, metrics
+from bot.cogs.presence import Presence
+from bot.cogs.sampler import Sampler
+from bot.config import Config
+
+log = logging.getLogger("bot.replay")
+
+STATUSES = {s: discord.Status(s) for s in ("online", "idle", "dnd", "offline")}
+# distribuição inicial de status nos servidores gerados (horário comercial)
+INITIAL_WEIGHTS = {"online": 0.55, "idle": 0.15, "dnd": 0.10, "offline": 0.20}
+
+# ---------------------------------------------------------------------------
+# Objetos falsos do discord.py (só o que os cogs leem)
+# ---------------------------------------------------------------------------
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.name = f"guild{guild_id}"
+        self.chunked = True
+        self._members: Dict[int, "FakeMember"] = {}
+
+    @property
+    def members(self) -> List["FakeMember"]:
+        return list(self._members.values())
+
+    @property
+    def member_count(self) -> int:
+        return len(self._members)
+
+    def get_member(self, user_id: int) -> Optional["FakeMember"]:
+        return self._members.get(user_id)
+
+    async def chunk(self, cache: bool = True) -> List["FakeMember"]:
+        return self.members  # o roster já está todo em memória
+
+class FakeMember:
+    __slots__ = ("id", "name", "discriminator", "bot", "status", "guild")
+
+    def __init__(self, user_id: int, guild: FakeGuild, status: discord.Status, bot: bool = False):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.discriminator = "0"
+        self.bot = bot
+        self.status = status
+        self.guild = guild
+
+    def _copy(self) -> "FakeMember":
+        return FakeMember(self.id, self.guild, self.status, self.bot)
+
+class FakeMessage:
+    __slots__ = ("author", "guild", "content")
+
+    def __init__(self, author: FakeMember):
+        self.author = author
+        self.guild = author.guild
+        self.content = "replay"
+
+class ReplayBot:
+    """O mínimo de commands.Bot que os cogs usam, com dispatch no estilo do discord.py."""
+
+    def __init__(self):
+        self._guilds: Dict[int, FakeGuild] = {}
+        self._listeners: Dict[str, list] = {}
+        self._tasks: set = set()
+        self.handler_errors = 0
+        self.max_pending = 0
+
+    @property
+    def guilds(self) -> List[FakeGuild]:
+        return list(self._guilds.values())
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return self._guilds.get(guild_id)
+
+    def guild(self, guild_id: int) -> FakeGuild:
+        g = self._guilds.get(guild_id)
+        if g is None:
+            g = self._guilds[guild_id] = FakeGuild(guild_id)
+        return g
+
+    async def wait_until_ready(self) -> None:
+        return None  # o roster é montado antes dos cogs
+
+    def add_cog(self, cog) -> None:
+        for name, method in cog.get_listeners():
+            self._listeners.setdefault(name, []).append(method)
+
+    def dispatch(self, event: str, *args, on_done=None) -> None:
+        """Uma task por listener; `on_done(listener)` roda quando ele termina sem erro."""
+        loop = asyncio.get_running_loop()
+        for method in self._listeners.get("on_" + event, ()):
+            task = loop.create_task(self._run_event(method, args, on_done), name=f"replay: {event}")
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if len(self._tasks) > self.max_pending:
+            self.max_pending = len(self._tasks)
+
+    async def _run_event(self, method, args, on_done) -> None:
+        try:
+            await method(*args)
+        except Exception as e:
+            self.handler_errors += 1
+            log.error(f"erro em {method.__qualname__}: {type(e).__name__}: {e}")
+        else:
+            if on_done is not None:
+                on_done(method)
+
+    async def drain(self, timeout: float) -> int:
+        """Espera os handlers pendentes; devolve quantos não terminaram no prazo."""
+        if self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            return len(pending)
+        return 0
+
+# ---------------------------------------------------------------------------
+# Fontes de eventos
+# ---------------------------------------------------------------------------
+
+class Event(NamedTuple):
+    t: Optional[float]  # segundos desde o início (None = só o ritmo de --rate)
+    kind: str           # presence / message / join / remove
+    guild_id: int
+    user_id: int
+    status: str = "online"
+
+def build_roster(bot: ReplayBot, guilds: int, members: int, bots_ratio: float, rng: random.Random) -> None:
+    names, weights = zip(*INITIAL_WEIGHTS.items())
+    for gi in range(1, guilds + 1):
+        g = bot.guild(100000000000000000 + gi)
+        for ui in range(1, members + 1):
+            uid = 200000000000000000 + gi * 10000000 + ui
+            status = STATUSES[rng.choices(names, weights)[0]]
+            g._members[uid] = FakeMember(uid, g, status, bot=rng.random() < bots_ratio)
+
+def generated_events(
+    bot: ReplayBot, rng: random.Random, messages: float, same_status: float, churn: float
+) -> Iterator[Event]:
+    """
+    Fluxo infinito sobre o roster: membros sorteados uniformemente, mix de
+    mensagens, entradas/saídas (`churn`) e presence_update — parte deles só
+    de atividade (`same_status`), que o gateway manda sem troca de status.
+    """
+    rosters = [(g.id, list(g._members)) for g in bot.guilds]
+    sizes = [len(ids) for _, ids in rosters]
+    names = list(STATUSES)
+    next_uid = 300000000000000000
+    while True:
+        gid, ids = rng.choices(rosters, sizes)[0]
+        uid = ids[rng.randrange(len(ids))]
+        r = rng.random()
+        if r < churn / 2:
+            next_uid += 1
+            ids.append(next_uid)
+            yield Event(None, "join", gid, next_uid, rng.choice(names))
+        elif r < churn:
+            i = ids.index(uid)
+            ids[i] = ids[-1]
+            ids.pop()
+            yield Event(None, "remove", gid, uid)
+        elif r < churn + messages:
+            yield Event(None, "message", gid, uid)
+        else:
+            member = bot.get_guild(gid).get_member(uid)
+            current = str(member.status) if member is not None else "offline"
+            if rng.random() < same_status:
+                yield Event(None, "presence", gid, uid, current)
+            else:
+                yield Event(None, "presence", gid, uid, rng.choice([s for s in names if s != current]))
+
+def jsonl_events(bot: ReplayBot, path: str) -> Iterator[Event]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            ev = json.loads(line)
+            kind = ev.get("type", "presence")
+            if kind == "guild":
+                g = bot.guild(int(ev["guild"]))
+                for m in ev.get("members", ()):
+                    uid, status = int(m[0]), m[1] if len(m) > 1 else "offline"
+                    g._members[uid] = FakeMember(uid, g, STATUSES.get(status, STATUSES["offline"]), bool(m[2]) if len(m) > 2 else False)
+                continue
+            yield Event(ev.get("t"), kind, int(ev["guild"]), int(ev["user"]), ev.get("status", "online"))
+
+def presence_log_events(path: str, guild_id: int = 0) -> Iterator[Event]:
+    """Mudanças de status de um presence_log (amostras repetidas do sampler são puladas)."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        where, params = ("WHERE guild_id = ?", (guild_id,)) if guild_id else ("", ())
+        cur = conn.execute(f"SELECT guild_id, user_id, status, timestamp FROM presence_log {where} ORDER BY timestamp, id", params)
+        last: Dict[Tuple[int, int], int] = {}
+        first_ts = None
+        for gid, uid, code, ts in cur:
+            if last.get((gid, uid)) == code:
+                continue
+            last[(gid, uid)] = code
+            if first_ts is None:
+                first_ts = ts
+            yield Event(float(ts - first_ts), "presence", gid, uid, db.STATUS_KEY.get(code, "offline"))
+    finally:
+        conn.close()
+
+def apply_event(bot: ReplayBot, ev: Event, on_written) -> None:
+    """Atualiza o cache falso como o discord.py faz e despacha o evento aos cogs."""
+    g = bot.guild(ev.guild_id)
+    status = STATUSES.get(ev.status, STATUSES["offline"])
+    member = g.get_member(ev.user_id)
+    if ev.kind == "presence":
+        if member is None:
+            member = g._members[ev.user_id] = FakeMember(ev.user_id, g, STATUSES["offline"])
+        before = member._copy()
+        member.status = status
+        bot.dispatch("presence_update", before, member, on_done=on_written(before, member))
+    elif ev.kind == "message":
+        if member is not None:
+            bot.dispatch("message", FakeMessage(member))
+    elif ev.kind == "join":
+        member = g._members[ev.user_id] = FakeMember(ev.user_id, g, status)
+        bot.dispatch("member_join", member)
+    elif ev.kind == "remove":
+        if member is not None:
+            del g._members[ev.user_id]
+            bot.dispatch("member_remove", member)
+
+# ---------------------------------------------------------------------------
+# Medição
+# ---------------------------------------------------------------------------
+
+class CommitLog:
+    """
+    Sink do escritor que grava com log_presence_many e anota, por lote, o
+    total acumulado de linhas e o instante do commit. Como o escritor é uma
+    fila única FIFO, a linha de índice i (writer.enqueued logo depois do
+    put) está gravada no primeiro lote cujo acumulado chega a i.
+    """
+
+    def __init__(self):
+        self.seen = 0
+        self.marks: List[Tuple[int, Optional[float]]] = []  # (acumulado, perf_counter do commit ou None)
+        self._lock = threading.Lock()
+
+    def __call__(self, batch) -> None:
+        ok = False
+        try:
+            db.log_presence_many(batch)
+            ok = True
+        finally:
+            with self._lock:
+                self.seen += len(batch)
+                self.marks.append((self.seen, time.perf_counter() if ok else None))
+
+    def latencies_ms(self, events: List[Tuple[int, float]]) -> List[float]:
+        cums = [c for c, _ in self.marks]
+        out = []
+        for idx, t0 in events:
+            k = bisect.bisect_left(cums, idx)
+            if k < len(self.marks) and self.marks[k][1] is not None:
+                out.append((self.marks[k][1] - t0) * 1000.0)
+        return out
+
+async def loop_lag_sampler(interval: float, out: List[float]) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        out.append(max(0.0, loop.time() - t0 - interval) * 1000.0)
+
+def summary(values: List[float]) -> dict:
+    values = sorted(values)
+    if not values:
+        return {"n": 0}
+    return {
+        "n": len(values),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(values[-1], 3),
+        "mean": round(sum(values) / len(values), 3),
+    }
+
+# ---------------------------------------------------------------------------
+# Execução
+# ---------------------------------------------------------------------------
+
+async def replay(args, db_path: str) -> dict:
+    config = Config.from_env()
+    db.init_db(
+        db_path,
+        journal_mode=config.db_journal_mode,
+        synchronous=config.db_synchronous,
+        mmap_size=config.db_mmap_size,
+        cache_size=config.db_cache_size,
+        busy_timeout_ms=config.db_busy_timeout_ms,
+        readers=config.db_readers,
+        query_timeout=config.db_query_timeout,
+    )
+    commits = CommitLog()
+    writer = db.start_writer(
+        batch_size=config.writer_batch_size,
+        flush_interval=config.writer_flush_seconds,
+        max_queue=config.writer_max_queue,
+        sink=commits,
+    )
+    db.add_write_listener(cache.on_presence_written)
+
+    rng = random.Random(args.seed)
+    bot = ReplayBot()
+    if args.events:
+        events = jsonl_events(bot, args.events)
+    elif args.from_db:
+        events = presence_log_events(args.from_db, args.guild)
+    else:
+        build_roster(bot, args.guilds, args.members, args.bots, rng)
+        events = generated_events(bot, rng, args.messages, args.same_status, args.churn)
+    # fontes gravadas: o roster (linhas "guild") vem antes do primeiro evento
+    first = next(events, None)
+
+    for guild in bot.guilds:
+        await chunking.ensure_chunked(guild)
+        livecounts.seed(guild)
+    presence = Presence(bot, config)
+    bot.add_cog(presence)
+    sampler = None
+    if not args.no_sampler:
+        sampler = Sampler(bot, config)
+        bot.add_cog(sampler)
+
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = await metrics.serve("127.0.0.1", args.metrics_port)
+        log.info(f"métricas em http://127.0.0.1:{args.metrics_port}/metrics")
+
+    # (índice da linha no escritor, instante da entrega) de cada presence_update que grava
+    written: List[Tuple[int, float]] = []
+    handler_ms: List[float] = []
+
+    def on_written(before: FakeMember, after: FakeMember):
+        if after.bot or before.status == after.status:
+            return None  # o Presence não grava nada
+        t0 = time.perf_counter()
+
+        def done(method) -> None:
+            # o status do membro pode ter mudado de novo antes do handler rodar: sem índice repetido
+            if getattr(method, "__self__", None) is presence and (not written or writer.enqueued > written[-1][0]):
+                written.append((writer.enqueued, t0))
+                handler_ms.append((time.perf_counter() - t0) * 1000.0)
+        return done
+
+    lags: List[float] = []
+    lag_task = asyncio.get_running_loop().create_task(loop_lag_sampler(args.lag_interval, lags))
+    counts = dict.fromkeys(("presence", "message", "join", "remove"), 0)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    t_start = time.perf_counter()
+    sent = 0
+    ev = first
+    while ev is not None:
+        if args.rate > 0:
+            due = sent / args.rate
+        elif ev.t is not None:
+            due = ev.t / args.speed
+        else:
+            due = 0.0
+        if args.duration and due >= args.duration:
+            break
+        ahead = due - (loop.time() - start)
+        if ahead > 0.002:
+            await asyncio.sleep(ahead)
+        elif sent % 100 == 0:
+            await asyncio.sleep(0)  # atrasado: ainda assim deixa os handlers rodarem
+        apply_event(bot, ev, on_written)
+        counts[ev.kind] = counts.get(ev.kind, 0) + 1
+        sent += 1
+        ev = next(events, None)
+    dispatch_s = time.perf_counter() - t_start
+
+    stuck = await bot.drain(args.drain_timeout)
+    await presence.cog_unload()
+    if sampler is not None:
+        await sampler.cog_unload()
+    await db.stop_writer()  # grava o que restou na fila
+    total_s = time.perf_counter() - t_start
+    lag_task.cancel()
+    if metrics_server is not None:
+        await metrics_server.close()
+
+    wstats = writer.stats()
+    sampler_lag = {}
+    if sampler is not None:
+        per_guild = sampler.lag_stats().values()
+        sampler_lag = {
+            "cycles": sum(s["cycles"] for s in per_guild),
+            "max_lag_s": max((s["max_lag"] for s in per_guild), default=0.0),
+        }
+    return {
+        "meta": {
+            "source": args.events or args.from_db or "gerado",
+            "target_rate": args.rate,
+            "duration_s": round(dispatch_s, 3),
+            "guilds": len(bot.guilds),
+            "members": sum(g.member_count for g in bot.guilds),
+            "sampler": None if sampler is None else os.getenv("SAMPLE_MODE", "full"),
+            "writer_batch": writer.batch_size,
+            "writer_flush_s": writer.flush_interval,
+            "writer_max_queue": writer.max_queue,
+            "db_synchronous": config.db_synchronous,
+            "seed": args.seed,
+            "git": _git_rev(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+        "throughput": {
+            "events": sent,
+            "by_type": counts,
+            "events_per_s": round(sent / dispatch_s, 1) if dispatch_s else 0.0,
+            "rows_written": wstats["written"],
+            "rows_per_s": round(wstats["written"] / total_s, 1) if total_s else 0.0,
+            "presence_rows": len(written),
+            "sampler_rows": max(0, wstats["enqueued"] - len(written)),
+            "drain_s": round(total_s - dispatch_s, 3),
+            "max_pending_handlers": bot.max_pending,
+            "handler_errors": bot.handler_errors,
+            "stuck_handlers": stuck,
+        },
+        "commit_latency_ms": summary(commits.latencies_ms(written)),
+        "handler_latency_ms": summary(handler_ms),
+        "loop_lag_ms": summary(lags),
+        "writer": wstats,
+        "sampler": sampler_lag,
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    src = ap.add_mutually_exclusive_group()
+    src.add_argument("--events", help="fluxo gravado em JSONL (formato acima)")
+    src.add_argument("--from-db", help="presence_log de onde tirar as mudanças de status")
+    ap.add_argument("--guild", type=int, default=0, help="com --from-db: só este servidor")
+    ap.add_argument("--rate", type=float, default=5000, help="eventos/s (0 = ritmo do campo t das fontes gravadas)")
+    ap.add_argument("--speed", type=float, default=1.0, help="com --rate 0: acelera o relógio gravado")
+    ap.add_argument("--duration", type=float, default=30, help="segundos de envio (0 = até o fim da fonte)")
+    ap.add_argument("--guilds", type=int, default=2, help="gerado: servidores")
+    ap.add_argument("--members", type=int, default=5000, help="gerado: membros por servidor")
+    ap.add_argument("--bots", type=float, default=0.01, help="gerado: fração de membros bot")
+    ap.add_argument("--messages", type=float, default=0.2, help="gerado: fração de mensagens")
+    ap.add_argument("--same-status", type=float, default=0.3, help="gerado: presence_update sem troca de status")
+    ap.add_argument("--churn", type=float, default=0.001, help="gerado: fração de entradas + saídas")
+    ap.add_argument("--no-sampler", action="store_true", help="não carrega o cog Sampler")
+    ap.add_argument("--db", help="banco a usar (padrão: temporário, apagado no fim)")
+    ap.add_argument("--lag-interval", type=float, default=0.01, help="período do medidor de atraso do loop (s)")
+    ap.add_argument("--drain-timeout", type=float, default=60, help="espera máxima pelos handlers no fim (s)")
+    ap.add_argument("--metrics-port", type=int, default=0, help="expõe /metrics durante o replay")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="arquivo JSON de saída (padrão: stdout)")
+    args = ap.parse_args()
+    if args.rate <= 0 and args.speed <= 0:
+        ap.error("--speed precisa ser > 0")
+    if not (args.events or args.from_db) and args.duration <= 0:
+        ap.error("o fluxo gerado não termina: use --duration > 0")
+
+    logs.setup_logging("replay")
+    with tempfile.TemporaryDirectory(prefix="replay_") as tmp:
+        db_path = args.db or os.path.join(tmp, "replay.db")
+        try:
+            report = asyncio.run(replay(args, db_path))
+        finally:
+            db.close_db()
+    t, c = report["throughput"], report["commit_latency_ms"]
+    print(
+        f"[replay] {t['events']} eventos a {t['events_per_s']:,.0f}/s | {t['rows_written']} linhas "
+        f"({t['rows_per_s']:,.0f}/s) | commit p50 {c.get('p50', 0):.1f} ms p99 {c.get('p99', 0):.1f} ms | "
+        f"atraso do loop p99 {report['loop_lag_ms'].get('p99', 0):.1f} ms",
+        file=sys.stderr,
+    )
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
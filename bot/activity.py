@@ -0,0 +1,78 @@
+"""
+Última atividade (mensagem) por usuário, usada para detectar idle manual.
+
+Só interessa se o usuário falou nos últimos MANUAL_IDLE_WINDOW segundos,
+então cada entrada guarda um float (time.monotonic) e expira depois da
+janela. As entradas ficam em ordem de último toque (OrderedDict): cada
+toque remove do início as que já expiraram, custo amortizado O(1), e o total
+nunca passa de `max_users` (descarta as mais antigas).
+"""
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# atividade até N segundos antes de ficar idle = idle manual
+MANUAL_IDLE_WINDOW = float(os.getenv("MANUAL_IDLE_WINDOW_SECONDS", "60"))
+ACTIVITY_MAX_USERS = int(os.getenv("ACTIVITY_MAX_USERS", "100000"))
+
+class ActivityTracker:
+    def __init__(self, window: float = 60.0, max_users: int = 100000):
+        self.window = window
+        self.max_users = max(1, max_users)
+        self._seen: "OrderedDict[int, float]" = OrderedDict()
+        self.touches = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _expire(self, now: float) -> None:
+        seen = self._seen
+        while seen:
+            user_id, ts = next(iter(seen.items()))
+            if now - ts < self.window:
+                break
+            del seen[user_id]
+            self.expired += 1
+
+    def touch(self, user_id: int, now: Optional[float] = None) -> None:
+        """Registra atividade do usuário agora."""
+        now = time.monotonic() if now is None else now
+        self._seen[user_id] = now
+        self._seen.move_to_end(user_id)
+        self.touches += 1
+        self._expire(now)
+        while len(self._seen) > self.max_users:
+            self._seen.popitem(last=False)
+            self.evicted += 1
+
+    def recent(self, user_id: int, now: Optional[float] = None) -> bool:
+        """True se o usuário teve atividade dentro da janela."""
+        ts = self._seen.get(user_id)
+        if ts is None:
+            return False
+        now = time.monotonic() if now is None else now
+        return now - ts < self.window
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def memory_bytes(self) -> int:
+        """Estimativa do tamanho em memória (estrutura + chaves + valores)."""
+        n = len(self._seen)
+        if not n:
+            return sys.getsizeof(self._seen)
+        user_id, ts = next(iter(self._seen.items()))
+        return sys.getsizeof(self._seen) + n * (sys.getsizeof(user_id) + sys.getsizeof(ts))
+
+    def stats(self) -> dict:
+        self._expire(time.monotonic())
+        return {
+            "users": len(self._seen),
+            "max_users": self.max_users,
+            "window_s": self.window,
+            "touches": self.touches,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "memory_kb": round(self.memory_bytes() / 1024, 1),
+        }
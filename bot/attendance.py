@@ -0,0 +1,127 @@
+"""
+Motor de presença em lote para o servidor inteiro (NumPy).
+
+Em vez de duas consultas + um loop Python por usuário e por janela, busca
+todos os eventos do período numa consulta ordenada (db.guild_events) e
+calcula os segundos por usuário/status/janela com operações vetorizadas:
+cada evento vale até o próximo evento do mesmo usuário (ou o fim do
+período); cada intervalo é casado só com as janelas que cruza
+(searchsorted), recortado e somado com bincount.
+"""
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from bot import db
+from bot.timeline import STATUS_KEYS
+
+# código gravado -> índice em STATUS_KEYS (online, idle, dnd, offline)
+_KEY_INDEX = np.zeros(max(db.STATUS_KEY) + 1, dtype=np.int64)
+for _code, _key in db.STATUS_KEY.items():
+    _KEY_INDEX[_code] = STATUS_KEYS.index(_key)
+
+def window_durations(
+    guild_id: int, user_ids: Sequence[int], windows: Sequence[Tuple[float, float]]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Devolve (user_ids, durs) onde durs tem forma (janelas, usuários, 4) com
+    os segundos por status na ordem de STATUS_KEYS. As janelas devem estar
+    ordenadas; usuários sem nenhum registro contam como offline.
+    """
+    users = np.unique(np.asarray(list(user_ids), dtype=np.int64))
+    out = np.zeros((len(windows), len(users), len(STATUS_KEYS)), dtype=np.float64)
+    if not len(windows) or not len(users):
+        return users, out
+
+    span_start = min(a for a, _ in windows)
+    span_end = max(b for _, b in windows)
+    rows = db.guild_events(guild_id, users.tolist(), span_start, span_end)
+    if not rows:
+        return users, out
+    arr = np.asarray(rows, dtype=np.int64)
+    uid, code, ts = arr[:, 0], arr[:, 1], arr[:, 2].astype(np.float64)
+
+    uidx = np.searchsorted(users, uid)
+    key = _KEY_INDEX[code]
+
+    # fim de cada evento = início do próximo do mesmo usuário (ou fim do período)
+    nxt = np.empty_like(ts)
+    nxt[:-1] = ts[1:]
+    last_of_user = np.ones(len(ts), dtype=bool)
+    last_of_user[:-1] = uidx[1:] != uidx[:-1]
+    nxt[last_of_user] = span_end
+
+    # janelas (ordenadas, sem sobreposição) que cada intervalo [ts, nxt) cruza:
+    # da primeira com fim > ts até a última com início < nxt
+    starts = np.asarray([a for a, _ in windows], dtype=np.float64)
+    ends = np.asarray([b for _, b in windows], dtype=np.float64)
+    first = np.searchsorted(ends, ts, side="right")
+    stop = np.searchsorted(starts, nxt, side="left")
+    counts = np.clip(stop - first, 0, None)
+    total = int(counts.sum())
+    if not total:
+        return users, out
+
+    # expande cada evento em um par (evento, janela) por janela cruzada
+    ev = np.repeat(np.arange(len(ts)), counts)
+    offsets = np.cumsum(counts) - counts
+    win = first[ev] + (np.arange(total) - offsets[ev])
+    dur = np.minimum(nxt[ev], ends[win]) - np.maximum(ts[ev], starts[win])
+    np.clip(dur, 0.0, None, out=dur)
+
+    n_keys = len(STATUS_KEYS)
+    bins = (win * len(users) + uidx[ev]) * n_keys + key[ev]
+    out += np.bincount(bins, weights=dur, minlength=out.size).reshape(out.shape)
+    return users, out
+
+def attendance_table(
+    guild_id: int, user_ids: Sequence[int], windows: Sequence[Tuple[float, float]]
+) -> Dict[int, List[Dict[str, float]]]:
+    """Mesmo cálculo, como {user_id: [durações por janela]} no formato de timeline."""
+    users, durs = window_durations(guild_id, user_ids, windows)
+    table: Dict[int, List[Dict[str, float]]] = {}
+    for i, uid in enumerate(users.tolist()):
+        table[uid] = [dict(zip(STATUS_KEYS, durs[w, i].tolist())) for w in range(len(windows))]
+    return table
+
+def first_online(
+    guild_id: int, checks: Sequence[Tuple[int, float, float]], now: float
+) -> np.ndarray:
+    """
+    Para cada verificação (user_id, início, fim): o primeiro instante em que o
+    usuário estava online dentro de [início, fim] (NaN se não esteve). Uma
+    consulta para todos os usuários e o trecho inteiro (db.guild_events);
+    depois uma varredura dos eventos de cada usuário. O status vigente no
+    último evento vale até `now`.
+    """
+    out = np.full(len(checks), np.nan)
+    checks = [(u, a, min(b, now)) for u, a, b in checks]
+    valid = [i for i, (_, a, b) in enumerate(checks) if a <= b]
+    if not valid:
+        return out
+
+    span_start = min(checks[i][1] for i in valid)
+    span_end = max(checks[i][2] for i in valid)
+    rows = db.guild_events(guild_id, sorted({checks[i][0] for i in valid}), span_start, span_end)
+    if not rows:
+        return out
+    arr = np.asarray(rows, dtype=np.int64)
+    uid, ts = arr[:, 0], arr[:, 2].astype(np.float64)
+    online = _KEY_INDEX[arr[:, 1]] == STATUS_KEYS.index("online")
+
+    # cada evento vale até o próximo do mesmo usuário (ou o fim do trecho)
+    nxt = np.empty_like(ts)
+    nxt[:-1] = ts[1:]
+    last_of_user = np.ones(len(ts), dtype=bool)
+    last_of_user[:-1] = uid[1:] != uid[:-1]
+    nxt[last_of_user] = span_end
+
+    for i in valid:
+        u, a, b = checks[i]
+        lo, hi = np.searchsorted(uid, u, side="left"), np.searchsorted(uid, u, side="right")
+        # online em algum ponto da janela fechada [a, b]: começou até b e durou além de a
+        # (o último evento do usuário vale até o fim do trecho, inclusive)
+        hit = online[lo:hi] & (ts[lo:hi] <= b) & ((nxt[lo:hi] > a) | (last_of_user[lo:hi] & (nxt[lo:hi] >= a)))
+        if hit.any():
+            out[i] = max(a, float(ts[lo:hi][hit.argmax()]))
+    return out
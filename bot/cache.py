@@ -0,0 +1,210 @@
+"""
+Cache de resultados das consultas de agregação (!leaderboard, !stats,
+!report, !export_csv).
+
+Durante uma reunião dezenas de pessoas rodam o mesmo comando em poucos
+segundos, e cada um refazia o mesmo GROUP BY sobre a mesma janela. Aqui o
+resultado fica guardado por (servidor, tipo de consulta, parâmetros, balde
+da janela):
+  - o início da janela ("últimos N dias") é arredondado para baixo em
+    baldes de QUERY_CACHE_BUCKET_SECONDS, então comandos no mesmo minuto
+    caem na mesma chave;
+  - cada entrada vale até QUERY_CACHE_TTL_SECONDS e o total é limitado a
+    QUERY_CACHE_MAX_ENTRIES (LRU);
+  - quando o escritor grava uma mudança de status num servidor, a geração
+    dele sobe (O(1)): as entradas antigas desse servidor ficam "sujas" e só
+    são servidas por mais QUERY_CACHE_MAX_STALE_SECONDS desde que foram
+    calculadas (0 = nunca);
+  - amostras que só repetem o último status gravado do membro (o sampler em
+    SAMPLE_MODE=full grava todos a cada ciclo, e o heartbeat do modo
+    "changes") não sobem a geração: elas somam +1 às contagens o tempo todo
+    e, se sujassem o servidor, toda entrada valeria no máximo
+    QUERY_CACHE_MAX_STALE_SECONDS. Esse crescimento aparece quando a entrada
+    expira, então o atraso dele é de até QUERY_CACHE_TTL_SECONDS;
+  - consultas iguais simultâneas viram uma só (como no chunking).
+Tudo roda no event loop; as consultas em si continuam no executor (db.afetch_*).
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "60"))
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "512"))
+# resultados maiores que isso não são guardados (ex.: export de servidor enorme)
+QUERY_CACHE_MAX_ROWS = int(os.getenv("QUERY_CACHE_MAX_ROWS", "50000"))
+QUERY_CACHE_BUCKET = int(os.getenv("QUERY_CACHE_BUCKET_SECONDS", "60"))
+QUERY_CACHE_MAX_STALE = float(os.getenv("QUERY_CACHE_MAX_STALE_SECONDS", "10"))
+
+Key = Tuple[int, str, Hashable]
+
+class QueryCache:
+    def __init__(
+        self,
+        ttl: float = 60.0,
+        max_entries: int = 512,
+        max_rows: int = 50000,
+        bucket: int = 60,
+        max_stale: float = 10.0,
+    ):
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.max_rows = max_rows
+        self.bucket_seconds = max(1, bucket)
+        self.max_stale = max_stale
+        # chave -> (instante monotônico do cálculo, geração do servidor, linhas)
+        self._entries: "OrderedDict[Key, Tuple[float, int, List[Tuple]]]" = OrderedDict()
+        self._generation: Dict[int, int] = {}
+        # último status gravado por servidor e membro (decide se a linha muda algo)
+        self._last_status: Dict[int, Dict[int, str]] = {}
+        self._inflight: Dict[Key, "asyncio.Task[List[Tuple]]"] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.repeated_rows = 0
+        self.uncacheable = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def bucket(self, ts: int) -> int:
+        """Arredonda o início de uma janela para o balde, para que a chave se repita."""
+        return ts - ts % self.bucket_seconds
+
+    def _lookup(self, key: Key) -> Optional[List[Tuple]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        computed, gen, rows = entry
+        age = time.monotonic() - computed
+        if age >= self.ttl:
+            del self._entries[key]
+            return None
+        if gen != self._generation.get(key[0], 0):
+            if age >= self.max_stale:
+                del self._entries[key]
+                return None
+            self.stale_hits += 1
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return rows
+
+    def _store(self, key: Key, gen: int, rows: List[Tuple]) -> None:
+        if len(rows) > self.max_rows:
+            self.uncacheable += 1
+            return
+        self._entries[key] = (time.monotonic(), gen, rows)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(
+        self,
+        guild_id: int,
+        kind: str,
+        params: Hashable,
+        loader: Callable[[], Awaitable[List[Tuple]]],
+    ) -> List[Tuple]:
+        """
+        Devolve o resultado guardado ou chama `loader()` (uma vez, mesmo com
+        vários pedidos simultâneos) e guarda. As linhas devolvidas são
+        compartilhadas: não altere a lista.
+        """
+        if not self.enabled:
+            return await loader()
+        key = (guild_id, kind, params)
+        rows = self._lookup(key)
+        if rows is not None:
+            return rows
+        task = self._inflight.get(key)
+        if task is not None:
+            self.collapsed += 1
+            return await asyncio.shield(task)
+
+        self.misses += 1
+        gen = self._generation.get(guild_id, 0)
+
+        async def load() -> List[Tuple]:
+            result = list(await loader())
+            self._store(key, gen, result)
+            return result
+
+        task = asyncio.ensure_future(load())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _t: self._inflight.pop(key, None))
+        # shield: cancelar quem espera (timeout do comando) não derruba os outros
+        return await asyncio.shield(task)
+
+    def written(self, rows: List[Tuple]) -> None:
+        """
+        O escritor gravou estas linhas (user_id, username, status, ts, guild_id):
+        suja as entradas dos servidores onde algum membro mudou de status.
+        """
+        changed = set()
+        for user_id, _, status, _, guild_id in rows:
+            last = self._last_status.setdefault(guild_id, {})
+            if last.get(user_id) == status:
+                self.repeated_rows += 1
+                continue
+            last[user_id] = status
+            changed.add(guild_id)
+        for gid in changed:
+            self._generation[gid] = self._generation.get(gid, 0) + 1
+            self.invalidations += 1
+
+    def invalidate(self, guild_id: Optional[int] = None) -> None:
+        """Descarta as entradas de um servidor (ou todas, ex.: após a retenção)."""
+        if guild_id is None:
+            self._entries.clear()
+            self._last_status.clear()
+            return
+        self._last_status.pop(guild_id, None)
+        for key in [k for k in self._entries if k[0] == guild_id]:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        served = self.hits + self.collapsed  # respondidas sem ir ao banco
+        lookups = served + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "collapsed": self.collapsed,
+            "hit_ratio": round(served / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "repeated_rows": self.repeated_rows,
+            "uncacheable": self.uncacheable,
+        }
+
+# Instância única do processo
+_cache = QueryCache(
+    QUERY_CACHE_TTL, QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_MAX_ROWS, QUERY_CACHE_BUCKET, QUERY_CACHE_MAX_STALE
+)
+
+def bucket(ts: int) -> int:
+    return _cache.bucket(ts)
+
+async def cached(
+    guild_id: int, kind: str, params: Hashable, loader: Callable[[], Awaitable[List[Tuple]]]
+) -> List[Tuple]:
+    return await _cache.get(guild_id, kind, params, loader)
+
+def on_presence_written(batch: List[Tuple]) -> None:
+    """Listener do escritor (db.add_write_listener): linhas (user_id, username, status, ts, guild_id)."""
+    _cache.written(batch)
+
+def invalidate(guild_id: Optional[int] = None) -> None:
+    _cache.invalidate(guild_id)
+
+def cache_stats() -> dict:
+    return _cache.stats()
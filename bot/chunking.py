@@ -0,0 +1,296 @@
+"""
+Coordenador de chunk (download da lista de membros pelo gateway).
+
+`guild.chunk()` baixa todos os membros do servidor; em servidores grandes
+isso custa mais do que a própria amostragem. O coordenador lembra quais
+servidores já estão com o cache completo e só pede um novo chunk quando:
+  - o servidor ainda não foi carregado (entrada nova / nova sessão);
+  - há um buraco no cache (membros em cache bem abaixo de member_count);
+  - alguém força (`force=True`).
+Pedidos simultâneos para o mesmo servidor são agrupados numa única operação
+em andamento; quem chega depois só aguarda o resultado dela.
+
+Na inicialização preguiçosa (STARTUP_CHUNKING=lazy) o bot não baixa os
+membros antes do on_ready: o StartupChunker carrega os servidores em segundo
+plano, em ordem de prioridade e com concorrência limitada, e um comando que
+precise de um servidor ainda na fila faz o chunk dele na hora.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+import discord
+
+from bot import metrics
+
+# fração de membros faltando no cache que conta como "buraco" (0.01 = 1%)
+CHUNK_GAP_RATIO = float(os.getenv("CHUNK_GAP_RATIO", "0.01"))
+# intervalo mínimo entre dois chunks do mesmo servidor por causa de buraco
+CHUNK_MIN_INTERVAL = float(os.getenv("CHUNK_MIN_INTERVAL_SECONDS", "300"))
+# tempo máximo de um chunk antes de desistir
+CHUNK_TIMEOUT = float(os.getenv("CHUNK_TIMEOUT_SECONDS", "120"))
+
+# inicialização preguiçosa: servidores carregados primeiro (ids separados por vírgula, nesta ordem)
+CHUNK_PRIORITY_GUILDS = [int(x) for x in os.getenv("CHUNK_PRIORITY_GUILDS", "").split(",") if x.strip().isdigit()]
+# chunks simultâneos da fila de inicialização
+CHUNK_STARTUP_CONCURRENCY = int(os.getenv("CHUNK_STARTUP_CONCURRENCY", "4"))
+
+log = logging.getLogger("bot.chunk")
+_M_CHUNK = metrics.histogram("chunk_seconds", "Duração de guild.chunk() pelo coordenador")
+_M_READY = metrics.gauge("startup_ready_seconds", "Do início do processo até o on_ready concluído (bot atendendo)")
+_M_ALL_CHUNKED = metrics.gauge("startup_chunked_seconds", "Do início do processo até todos os servidores com membros carregados")
+_M_GUILD_READY = metrics.histogram(
+    "startup_guild_chunked_seconds", "Do on_ready até cada servidor da fila de inicialização ficar carregado",
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800),
+)
+# referência do "tempo até pronto": o import deste módulo, no começo do run.py
+_PROCESS_START = time.monotonic()
+
+class ChunkCoordinator:
+    def __init__(self, gap_ratio: float = 0.01, min_interval: float = 300.0, timeout: float = 120.0):
+        self.gap_ratio = gap_ratio
+        self.min_interval = min_interval
+        self.timeout = timeout
+        # guild_id -> instante monotônico do último chunk completo
+        self._loaded: Dict[int, float] = {}
+        self._inflight: Dict[int, "asyncio.Task[bool]"] = {}
+        self.chunks = 0
+        self.collapsed = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_chunk_ms = 0.0
+
+    def has_gap(self, guild: discord.Guild) -> bool:
+        """True se faltam membros no cache além da tolerância."""
+        expected = guild.member_count
+        if not expected:
+            return not guild.chunked
+        return len(guild.members) < expected * (1.0 - self.gap_ratio)
+
+    def needs_chunk(self, guild: discord.Guild) -> bool:
+        loaded = self._loaded.get(guild.id)
+        if loaded is None:
+            # a biblioteca pode já ter carregado tudo (chunk_guilds_at_startup)
+            return not guild.chunked
+        if not self.has_gap(guild):
+            return False
+        return (time.monotonic() - loaded) >= self.min_interval
+
+    async def ensure(self, guild: discord.Guild, force: bool = False) -> bool:
+        """
+        Garante o cache de membros do servidor, fazendo chunk só se preciso.
+        Devolve False se o chunk necessário falhou (o cache fica como está).
+        """
+        task = self._inflight.get(guild.id)
+        if task is not None:
+            self.collapsed += 1
+            # shield: cancelar quem espera não cancela o chunk dos outros
+            return await asyncio.shield(task)
+        if not force and not self.needs_chunk(guild):
+            if guild.id not in self._loaded:
+                self._loaded[guild.id] = time.monotonic()
+            self.skipped += 1
+            return True
+
+        task = asyncio.ensure_future(self._chunk(guild))
+        self._inflight[guild.id] = task
+        task.add_done_callback(lambda _t, gid=guild.id: self._inflight.pop(gid, None))
+        return await asyncio.shield(task)
+
+    async def _chunk(self, guild: discord.Guild) -> bool:
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(guild.chunk(cache=True), self.timeout)
+        except Exception as e:
+            self.failures += 1
+            log.error(f"{guild.id} falhou: {type(e).__name__}: {e}")
+            return False
+        self.chunks += 1
+        self.last_chunk_ms = (time.perf_counter() - t0) * 1000.0
+        _M_CHUNK.observe(self.last_chunk_ms / 1000.0)
+        self._loaded[guild.id] = time.monotonic()
+        return True
+
+    def invalidate(self, guild_id: Optional[int] = None) -> None:
+        """Esquece o estado de um servidor (ou de todos, ex.: nova sessão no gateway)."""
+        if guild_id is None:
+            self._loaded.clear()
+        else:
+            self._loaded.pop(guild_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "loaded": len(self._loaded),
+            "inflight": len(self._inflight),
+            "chunks": self.chunks,
+            "collapsed": self.collapsed,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "last_chunk_ms": round(self.last_chunk_ms, 1),
+        }
+
+class StartupChunker:
+    """
+    Fila de chunk da inicialização preguiçosa. Depois do on_ready, até
+    `concurrency` tarefas tiram servidores da fila e chamam o coordenador
+    (que pula quem já estiver carregado e agrupa com chunks em andamento).
+    Ordem: os servidores de `priority` (na ordem dada); depois os que tiveram
+    atividade desde a conexão (presença/mensagem, na ordem em que apareceram);
+    por fim os demais, do menor para o maior — assim a maior parte dos
+    servidores fica pronta cedo e os gigantes não seguram a fila.
+    """
+
+    def __init__(self, coordinator: ChunkCoordinator, concurrency: int = 4, priority: Iterable[int] = ()):
+        self.coordinator = coordinator
+        self.concurrency = max(1, int(concurrency))
+        self.priority = {gid: i for i, gid in enumerate(priority)}
+        self._heap: List[tuple] = []            # (nível, chave, seq, guild_id)
+        self._pending: Dict[int, discord.Guild] = {}
+        self._active: set = set()
+        self._seq = itertools.count()
+        self._workers: List["asyncio.Task"] = []
+        self._on_loaded: Optional[Callable[[discord.Guild], None]] = None
+        self._started_at = 0.0
+        self._finished = False
+        self.total = 0
+        self.done = 0
+        self.failures = 0
+        self.ready_s = 0.0
+        self.all_chunked_s = 0.0
+
+    def _push(self, guild_id: int, level: int, key: float) -> None:
+        heapq.heappush(self._heap, (level, key, next(self._seq), guild_id))
+
+    def mark_ready(self) -> None:
+        """on_ready concluído: registra o tempo até o bot atender (só o da primeira sessão)."""
+        if not self.ready_s:
+            self.ready_s = time.monotonic() - _PROCESS_START
+            _M_READY.set(self.ready_s)
+
+    def start(self, guilds: Iterable[discord.Guild], on_loaded: Optional[Callable[[discord.Guild], None]] = None) -> None:
+        """(Re)monta a fila com `guilds` e sobe as tarefas; `on_loaded` roda a cada servidor carregado."""
+        self.cancel()
+        self._on_loaded = on_loaded
+        self._pending = {g.id: g for g in guilds}
+        self._heap = []
+        for gid, g in self._pending.items():
+            if gid in self.priority:
+                self._push(gid, 0, self.priority[gid])
+            elif gid in self._active:
+                self._push(gid, 1, 0)
+            else:
+                self._push(gid, 2, g.member_count or 0)
+        self.total = len(self._pending)
+        self.done = 0
+        self.failures = 0
+        self._finished = False
+        self._started_at = time.monotonic()
+        loop = asyncio.get_running_loop()
+        self._workers = [
+            loop.create_task(self._worker(), name=f"startup-chunk-{i}")
+            for i in range(min(self.concurrency, self.total))
+        ]
+        if not self.total:
+            self._finish()
+
+    def cancel(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        self._workers = []
+        self._pending.clear()
+        self._heap = []
+
+    def note_activity(self, guild_id: int) -> None:
+        """Servidor com atividade: passa à frente dos que ainda não tiveram. O(log n), uma vez por servidor."""
+        if guild_id in self._active:
+            return
+        self._active.add(guild_id)
+        if guild_id in self._pending and guild_id not in self.priority:
+            self._push(guild_id, 1, 0)  # a entrada antiga fica no heap e é ignorada
+
+    def is_pending(self, guild_id: int) -> bool:
+        """True se o servidor ainda espera na fila (nenhum chunk começou)."""
+        return guild_id in self._pending
+
+    def discard(self, guild_id: int) -> None:
+        if self._pending.pop(guild_id, None) is not None:
+            self.total -= 1
+            self._check_done()
+        self._active.discard(guild_id)
+
+    async def _worker(self) -> None:
+        while self._heap:
+            guild = self._pending.pop(heapq.heappop(self._heap)[3], None)
+            if guild is None:
+                continue  # entrada repetida (atividade) ou servidor removido
+            if not await self.coordinator.ensure(guild):
+                self.failures += 1
+            elif self._on_loaded is not None:
+                try:
+                    self._on_loaded(guild)
+                except Exception as e:
+                    log.error(f"pós-chunk de {guild.id} falhou: {type(e).__name__}: {e}")
+            _M_GUILD_READY.observe(time.monotonic() - self._started_at)
+            self.done += 1
+            self._check_done()
+
+    def _check_done(self) -> None:
+        if self.total and self.done >= self.total and not self._finished:
+            self._finish()
+
+    def _finish(self) -> None:
+        self._finished = True
+        if not self.all_chunked_s:  # reconexões refazem a fila, mas a métrica é a da inicialização
+            self.all_chunked_s = time.monotonic() - _PROCESS_START
+            _M_ALL_CHUNKED.set(self.all_chunked_s)
+        log.info(
+            f"{self.done} servidor(es) carregado(s) em {time.monotonic() - self._started_at:.1f}s após o on_ready "
+            f"({self.failures} falha(s))"
+        )
+
+    def stats(self) -> dict:
+        return {
+            "startup_total": self.total,
+            "startup_done": self.done,
+            "startup_pending": len(self._pending),
+            "startup_failures": self.failures,
+            "ready_s": round(self.ready_s, 2),
+            "all_chunked_s": round(self.all_chunked_s, 2),
+        }
+
+# Instâncias únicas do processo
+_coordinator = ChunkCoordinator(CHUNK_GAP_RATIO, CHUNK_MIN_INTERVAL, CHUNK_TIMEOUT)
+_startup = StartupChunker(_coordinator, CHUNK_STARTUP_CONCURRENCY, CHUNK_PRIORITY_GUILDS)
+
+async def ensure_chunked(guild: discord.Guild, force: bool = False) -> bool:
+    return await _coordinator.ensure(guild, force=force)
+
+def invalidate(guild_id: Optional[int] = None) -> None:
+    _coordinator.invalidate(guild_id)
+    if guild_id is not None:
+        _startup.discard(guild_id)
+
+def start_startup(guilds: Iterable[discord.Guild], on_loaded: Optional[Callable[[discord.Guild], None]] = None) -> None:
+    _startup.start(guilds, on_loaded)
+
+def mark_ready() -> None:
+    _startup.mark_ready()
+
+def mark_all_chunked() -> None:
+    """Inicialização sem fila (STARTUP_CHUNKING=eager): tudo carregado junto com o on_ready."""
+    if not _startup.all_chunked_s:
+        _startup.all_chunked_s = time.monotonic() - _PROCESS_START
+        _M_ALL_CHUNKED.set(_startup.all_chunked_s)
+
+def note_activity(guild_id: int) -> None:
+    _startup.note_activity(guild_id)
+
+def startup_pending(guild_id: int) -> bool:
+    return _startup.is_pending(guild_id)
+
+def chunk_stats() -> dict:
+    return {**_coordinator.stats(), **_startup.stats()}
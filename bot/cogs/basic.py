@@ -1,8 +1,68 @@
 # bot/cogs/basic.py
+import logging
+import math
 import os
 import discord
 import sys, os
+from datetime import datetime, time as dtime
+from typing import List, Tuple
 from discord.ext import commands
+from bot import attendance, chunking, db, worktime
+
+log = logging.getLogger("bot.ponto")
+
+# Cargos do !relatorio_ponto: "Cargo=HH:MM[/tolerância em min]" separados por vírgula (horário em WORK_TZ)
+PONTO_SCHEDULES = os.getenv(
+    "PONTO_SCHEDULES",
+    "Entrada-07:30=07:30,Entrada-08:00=08:00,Entrada-08:30=08:30,Retorno-13:30=13:30,Retorno-14:00=14:00",
+)
+# minutos antes/depois do horário em que estar online conta como presença (padrão dos cargos)
+PONTO_TOLERANCE_MINUTES = float(os.getenv("PONTO_TOLERANCE_MINUTES", "10"))
+DM_LIMIT = 1900  # margem sob o limite de 2000 caracteres do Discord
+
+
+def _parse_schedules(spec: str) -> List[Tuple[str, int, int, float]]:
+    """'Cargo=HH:MM[/min],...' -> [(cargo, hora, minuto, tolerância em minutos)]."""
+    out = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        nome, _, hora = item.rpartition("=")
+        hora, _, tol = hora.partition("/")
+        try:
+            if not nome.strip():
+                raise ValueError(item)
+            hh, mm = (int(x) for x in hora.strip().split(":"))
+            out.append((nome.strip(), hh, mm, float(tol) if tol.strip() else PONTO_TOLERANCE_MINUTES))
+        except ValueError:
+            log.warning(f"PONTO_SCHEDULES: entrada inválida ignorada: {item!r}")
+    return out
+
+
+PONTO_CARGOS = _parse_schedules(PONTO_SCHEDULES)
+
+
+def _split_message(lines: List[str], limit: int = DM_LIMIT) -> List[str]:
+    """Junta as linhas em mensagens de até `limit` caracteres (linhas longas quebram nas vírgulas)."""
+    pieces = []
+    for line in lines:
+        while len(line) > limit:
+            cut = line.rfind(", ", 0, limit)
+            cut = cut + 1 if cut > 0 else limit
+            pieces.append(line[:cut])
+            line = line[cut:].lstrip()
+        pieces.append(line)
+    messages, cur = [], ""
+    for piece in pieces:
+        if cur and len(cur) + 1 + len(piece) > limit:
+            messages.append(cur)
+            cur = piece
+        else:
+            cur = f"{cur}\n{piece}" if cur else piece
+    if cur:
+        messages.append(cur)
+    return messages
 
 
 def _about_color() -> int:
@@ -23,48 +83,50 @@ class Basic(commands.Cog):
     async def relatorio_ponto(self, ctx):
         """
         Gera um relatório privado mostrando quem ficou online no Discord nos horários de entrada/retorno definidos pelos cargos.
+        Cargos e horários vêm de PONTO_SCHEDULES; presente = online em algum momento entre horário ± tolerância.
         """
-        import pytz
-        from datetime import datetime, timedelta
-        tz_br = pytz.timezone('America/Sao_Paulo')
-        agora_br = datetime.now(tz_br)
-        horarios_cargos = {
-            'Entrada-07:30': '07:30',
-            'Entrada-08:00': '08:00',
-            'Entrada-08:30': '08:30',
-            'Retorno-13:30': '13:30',
-            'Retorno-14:00': '14:00',
-        }
+        await chunking.ensure_chunked(ctx.guild)
+        now = db.now_ts()
+        hoje = worktime.local_date(now)
         relatorio = []
-        for cargo_nome, hora_str in horarios_cargos.items():
+        secoes = []  # (cargo, hora, tolerância, instante, membros, índice da 1ª verificação)
+        checks = []  # (user_id, início, fim) de todos os cargos: uma consulta só
+        for cargo_nome, hh, mm, tol in PONTO_CARGOS:
+            hora_str = f"{hh:02d}:{mm:02d}"
             cargo = discord.utils.get(ctx.guild.roles, name=cargo_nome)
             if not cargo:
-                relatorio.append(f"Cargo `{cargo_nome}` não encontrado.")
+                secoes.append((f"Cargo `{cargo_nome}` não encontrado.", None, None, None, None, None))
                 continue
-            membros = [m for m in ctx.guild.members if cargo in m.roles and not m.bot]
+            membros = [m for m in cargo.members if not m.bot]
             if not membros:
-                relatorio.append(f"Nenhum membro com o cargo `{cargo_nome}`.")
+                secoes.append((f"Nenhum membro com o cargo `{cargo_nome}`.", None, None, None, None, None))
+                continue
+            instante = datetime.combine(hoje, dtime(hh, mm), tzinfo=worktime.TZ).timestamp()
+            secoes.append((cargo_nome, hora_str, tol, instante, membros, len(checks)))
+            checks.extend((m.id, instante - tol * 60, instante + tol * 60) for m in membros)
+
+        primeiro = await db.arun(attendance.first_online, ctx.guild.id, checks, now) if checks else []
+        for cargo_nome, hora_str, tol, instante, membros, base in secoes:
+            if membros is None:
+                relatorio.append(cargo_nome)  # mensagem de cargo ausente/vazio
+                continue
+            relatorio.append(f"\n**{cargo_nome} ({hora_str} ± {tol:g} min)**")
+            if instante - tol * 60 > now:
+                relatorio.append("Horário ainda não chegou.")
                 continue
-            hora_br = agora_br.replace(hour=int(hora_str.split(":")[0]), minute=int(hora_str.split(":")[1]), second=0, microsecond=0)
-            janela_ini = hora_br
-            janela_fim = hora_br  # sem tolerância: só conta se ficou online exatamente no horário
-            from bot import db
             presentes = []
             ausentes = []
-            for membro in membros:
-                row = db.fetch_one(
-                    "SELECT status, timestamp FROM presence_log WHERE user_id=? AND status='online' AND timestamp = ? ORDER BY timestamp LIMIT 1",
-                    (membro.id, janela_ini.astimezone(pytz.UTC).strftime("%Y-%m-%d %H:%M:%S"),)
-                )
-                if row:
-                    presentes.append(membro.display_name)
+            for i, membro in enumerate(membros, start=base):
+                if not math.isnan(primeiro[i]):
+                    hora = datetime.fromtimestamp(primeiro[i], worktime.TZ).strftime("%H:%M")
+                    presentes.append(f"{membro.display_name} ({hora})")
                 else:
                     ausentes.append(membro.display_name)
-            relatorio.append(f"\n**{cargo_nome} ({hora_str})**")
             relatorio.append(f"Presentes: {', '.join(presentes) if presentes else 'Nenhum'}")
             relatorio.append(f"Ausentes: {', '.join(ausentes) if ausentes else 'Nenhum'}")
         try:
-            await ctx.author.send("\n".join(relatorio))
+            for mensagem in _split_message(relatorio):
+                await ctx.author.send(mensagem)
             await ctx.reply("Relatório enviado por DM!")
         except Exception:
             await ctx.reply("Não consegui enviar o relatório por DM. Verifique suas configurações de privacidade.")
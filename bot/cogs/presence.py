@@ -1,23 +1,74 @@
-from datetime import datetime, timezone
+import asyncio
+import logging
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from bot.config import Config
-from bot import db
+from bot import chunking, db, livecounts, metrics
+from bot.activity import ACTIVITY_MAX_USERS, MANUAL_IDLE_WINDOW, ActivityTracker
+
+log = logging.getLogger("bot.presence_log")
+log_counts = logging.getLogger("bot.livecounts")
+_M_UPDATES = metrics.counter("presence_updates_total", "Eventos presence_update recebidos do gateway (sem bots)", ["guild"])
 
 class Presence(commands.Cog):
-    # Dicionário para rastrear última atividade dos usuários
-    last_activity = {}
+    def __init__(self, bot: commands.Bot, config: Config):
+        self.bot = bot
+        self.config = config
+        # última atividade por usuário (da instância: recarregar o cog não acumula)
+        self.activity = ActivityTracker(MANUAL_IDLE_WINDOW, ACTIVITY_MAX_USERS)
+        if livecounts.LIVE_RECONCILE_SECONDS > 0:
+            self.reconcile_loop.start()
+
+    async def cog_unload(self):
+        self.reconcile_loop.cancel()
+        await db.flush_presence()
+
+    # Recontagem periódica dos contadores ao vivo a partir do cache de membros
+    @tasks.loop(seconds=livecounts.LIVE_RECONCILE_SECONDS)
+    async def reconcile_loop(self):
+        for guild in list(self.bot.guilds):
+            if chunking.startup_pending(guild.id):
+                continue  # ainda na fila da inicialização: semeado quando carregar
+            try:
+                await chunking.ensure_chunked(guild)  # só faz chunk se houver buraco
+                livecounts.seed(guild)
+            except Exception as e:
+                log_counts.error(f"erro ao reconciliar {guild.id}: {e}")
+            await asyncio.sleep(0)  # um servidor por vez, sem segurar o loop
+
+    @reconcile_loop.before_loop
+    async def before_reconcile(self):
+        await self.bot.wait_until_ready()
+        # o on_ready acabou de semear: a primeira volta fica para depois do intervalo
+        await asyncio.sleep(livecounts.LIVE_RECONCILE_SECONDS)
 
     @commands.Cog.listener()
     async def on_message(self, message):
         if message.author.bot:
             return
+        if message.guild:
+            chunking.note_activity(message.guild.id)
         # Atualiza última atividade para o usuário
-        self.last_activity[message.author.id] = datetime.now(timezone.utc)
+        self.activity.touch(message.author.id)
 
-    def __init__(self, bot: commands.Bot, config: Config):
-        self.bot = bot
-        self.config = config
+    @commands.command(name="activity_stats")
+    @commands.has_permissions(administrator=True)
+    async def activity_stats(self, ctx: commands.Context):
+        """Mostra o tamanho do rastreador de atividade (idle manual) (admin)."""
+        s = self.activity.stats()
+        await ctx.reply(
+            f"**Atividade recente (janela {s['window_s']:g}s)**\n"
+            f"- Usuários: {s['users']}/{s['max_users']} (~{s['memory_kb']} KB)\n"
+            f"- Mensagens: {s['touches']} | expirados: {s['expired']} | descartados pelo limite: {s['evicted']}"
+        )
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        livecounts.joined(member)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        livecounts.left(member)
 
     @commands.Cog.listener()
     async def on_presence_update(self, before: discord.Member, after: discord.Member):
@@ -25,31 +76,32 @@ class Presence(commands.Cog):
         if after.bot:
             return
 
+        if after.guild:
+            _M_UPDATES.inc(after.guild.id)
+            chunking.note_activity(after.guild.id)
+            livecounts.transition(after.guild.id, before.status, after.status)
+
         # Loga somente quando o status muda
         if before.status == after.status:
             return
 
-        now_iso = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        now_ts = db.now_ts()
         status = str(after.status)  # online / idle / dnd / offline
         username = f"{after.name}#{after.discriminator}" if after.discriminator != "0" else after.name
         guild_id = after.guild.id if after.guild else 0
 
-        # Detecta idle manual: se mudou para idle e teve atividade recente (<1min)
+        # Detecta idle manual: se mudou para idle e teve atividade recente (MANUAL_IDLE_WINDOW)
         if status == "idle":
-            last = self.last_activity.get(after.id)
-            now = datetime.now(timezone.utc)
-            manual = False
-            if last and (now - last).total_seconds() < 60:
-                manual = True
+            manual = self.activity.recent(after.id)
             # Salva info extra no banco (opcional: pode criar nova coluna ou logar em arquivo)
             try:
-                db.log_presence(after.id, username, status + ("_manual" if manual else ""), now_iso, guild_id)
+                await db.queue_presence(after.id, username, status + ("_manual" if manual else ""), now_ts, guild_id)
             except Exception as e:
-                print(f"[presence_log] erro: {e}")
+                log.error(f"erro: {e}")
             return
 
         try:
-            db.log_presence(after.id, username, status, now_iso, guild_id)
+            await db.queue_presence(after.id, username, status, now_ts, guild_id)
         except Exception as e:
-            print(f"[presence_log] erro: {e}")
+            log.error(f"erro: {e}")
 
@@ -1,10 +1,16 @@
-from datetime import datetime, timedelta, timezone
-import io, csv
+import asyncio, logging, os, tempfile
+from datetime import date, datetime, timedelta
 from typing import Optional, List
 import discord
 from discord.ext import commands
 from bot.config import Config
-from bot import db
+from bot import cache, counts, db, export, worktime
+
+# Exportação: teto por parte (0 = limite de anexo do servidor) e tempo máximo da consulta
+EXPORT_PART_MAX_MB = float(os.getenv("EXPORT_PART_MAX_MB", "0"))
+EXPORT_TIMEOUT = float(os.getenv("EXPORT_TIMEOUT_SECONDS", "600"))
+
+log = logging.getLogger("bot.snapshot")
 
 LABEL_PT = {
     "online":  "ONLINE",
@@ -13,49 +19,88 @@ LABEL_PT = {
     "offline": "OFFLINE",
 }
 
+class Data(commands.Converter):
+    """Só aceita YYYY-MM-DD: em parâmetro Optional, qualquer outra coisa (ex.: @menção) passa adiante."""
+
+    async def convert(self, ctx: commands.Context, argument: str) -> date:
+        try:
+            return date.fromisoformat(argument)
+        except ValueError:
+            raise commands.BadArgument(f"data inválida: {argument!r} (use YYYY-MM-DD)")
+
 class Reports(commands.Cog):
     def __init__(self, bot: commands.Bot, config: Config):
         self.bot = bot
         self.config = config
 
     @commands.command(name="export_csv")
-    async def export_csv(self, ctx: commands.Context, days: Optional[int] = 7):
-        """Exporta CSV com contagem por status por usuário no período (padrão: 7 dias)."""
-        try:
-            days = int(days)
-        except Exception:
-            days = 7
-
-        since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
-
-        rows = db.fetch_all(
-            "SELECT user_id, MAX(username) AS uname, "
-            "SUM(CASE WHEN status='online'  THEN 1 ELSE 0 END) AS online, "
-            "SUM(CASE WHEN status='idle'    THEN 1 ELSE 0 END) AS idle, "
-            "SUM(CASE WHEN status='dnd'     THEN 1 ELSE 0 END) AS dnd, "
-            "SUM(CASE WHEN status='offline' THEN 1 ELSE 0 END) AS offline, "
-            "COUNT(*) AS total "
-            "FROM presence_log WHERE guild_id = ? AND timestamp >= ? "
-            "GROUP BY user_id ORDER BY total DESC",
-            (ctx.guild.id, since)
-        )
-
-        if not rows:
-            await ctx.reply(f"Sem dados nos últimos {days} dias.")
-            return
+    async def export_csv(
+        self,
+        ctx: commands.Context,
+        modo: Optional[str] = None,
+        inicio: Optional[Data] = None,
+        fim: Optional[Data] = None,
+        *membros: discord.Member,
+    ):
+        """
+        Exporta CSV compactado (.csv.gz), dividido em partes se passar do limite de anexo.
+        Uso:
+          !export_csv [dias]                               -> contagem por status por usuário (padrão: 7 dias)
+          !export_csv bruto [inicio] [fim] [@usuários...]  -> eventos um a um (YYYY-MM-DD, fim incluso)
+        """
+        raw = (modo or "").lower() in ("bruto", "raw", "eventos")
+        if raw:
+            # datas ausentes: `fim` = hoje, `inicio` = 6 dias antes do fim
+            d_fim = fim or datetime.now(worktime.TZ).date()
+            d_ini = inicio or d_fim - timedelta(days=6)
+            if d_fim < d_ini:
+                d_ini, d_fim = d_fim, d_ini
+            start = worktime.day_bounds(d_ini)[0]
+            end = worktime.day_bounds(d_fim)[3]
+            basename = f"presence_eventos_{d_ini}_{d_fim}_g{ctx.guild.id}"
+            desc = f"Eventos de **{d_ini}** a **{d_fim}**" + (f" ({len(membros)} usuário(s))" if membros else "")
+        else:
+            try:
+                days = int(modo) if modo else 7
+            except ValueError:
+                days = 7
+            since = cache.bucket(db.now_ts() - days * 86400)
+            basename = f"presence_report_{days}d_g{ctx.guild.id}"
+            desc = f"Export dos últimos **{days}** dias"
 
-        buf = io.StringIO()
-        writer = csv.writer(buf)
-        writer.writerow(["user_id", "username", "ONLINE", "AUSENTE", "NÃO PERTURBE", "OFFLINE", "TOTAL"])
-        for user_id, uname, online, idle, dnd, offline, total in rows:
-            writer.writerow([user_id, uname, online, idle, dnd, offline, total])
+        max_bytes = ctx.guild.filesize_limit
+        if EXPORT_PART_MAX_MB > 0:
+            max_bytes = min(max_bytes, int(EXPORT_PART_MAX_MB * 1024 * 1024))
 
-        data = buf.getvalue().encode("utf-8-sig")  # BOM p/ Excel
-        filename = f"presence_report_{days}d_g{ctx.guild.id}.csv"
-        await ctx.reply(
-            content=f"Export dos últimos **{days}** dias.",
-            file=discord.File(io.BytesIO(data), filename=filename)
-        )
+        with tempfile.TemporaryDirectory(prefix="export_") as tmp:
+            # leitura em blocos direto para o disco, no executor de leitura
+            if raw:
+                paths, n = await db.arun(
+                    export.export_raw, ctx.guild.id, start, end, [m.id for m in membros],
+                    tmp, basename, max_bytes, timeout=EXPORT_TIMEOUT,
+                )
+            elif (ctx.guild.member_count or 0) <= cache.QUERY_CACHE_MAX_ROWS:
+                # uma linha por usuário: cabe no cache de consultas; só a gravação vai para a thread
+                rows = await cache.cached(ctx.guild.id, "export_totals", since, lambda: db.afetch_all(
+                    *export.totals_query(ctx.guild.id, since), timeout=EXPORT_TIMEOUT,
+                ))
+                paths, n = await asyncio.to_thread(
+                    export.export_totals, ctx.guild.id, since, tmp, basename, max_bytes, rows,
+                )
+            else:
+                paths, n = await db.arun(
+                    export.export_totals, ctx.guild.id, since, tmp, basename, max_bytes,
+                    timeout=EXPORT_TIMEOUT,
+                )
+            if not n:
+                await ctx.reply(f"{desc}: sem dados.")
+                return
+            for i, path in enumerate(paths, start=1):
+                parte = f" — parte {i}/{len(paths)}" if len(paths) > 1 else ""
+                await ctx.reply(
+                    content=f"{desc} ({n} linhas){parte}.",
+                    file=discord.File(path, filename=os.path.basename(path)),
+                )
 
     @commands.command(name="report")
     async def report(self, ctx: commands.Context, days: Optional[int] = 7):
@@ -64,14 +109,15 @@ class Reports(commands.Cog):
             days = int(days)
         except Exception:
             days = 7
-        since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+        since = cache.bucket(db.now_ts() - days * 86400)
 
         # totais do servidor por status
-        totals = dict(db.fetch_all(
-            "SELECT status, COUNT(*) FROM presence_log "
-            "WHERE guild_id = ? AND timestamp >= ? GROUP BY status",
-            (ctx.guild.id, since)
-        ))
+        totals: dict = {}
+        for code, c in await cache.cached(
+            ctx.guild.id, "report_totals", since, lambda: db.arun(counts.guild_status_counts, ctx.guild.id, since),
+        ):
+            key = db.STATUS_KEY.get(code, "offline")
+            totals[key] = totals.get(key, 0) + c
         def t(k): return totals.get(k, 0)
         header = (f"**Resumo — últimos {days} dias**\n"
                   f"- {LABEL_PT['online']}: {t('online')}\n"
@@ -80,11 +126,8 @@ class Reports(commands.Cog):
                   f"- {LABEL_PT['offline']}: {t('offline')}\n")
 
         # top usuários
-        top = db.fetch_all(
-            "SELECT MAX(username) AS uname, COUNT(*) AS total "
-            "FROM presence_log WHERE guild_id = ? AND timestamp >= ? "
-            "GROUP BY user_id ORDER BY total DESC LIMIT 10",
-            (ctx.guild.id, since)
+        top = await cache.cached(
+            ctx.guild.id, "report_top", since, lambda: db.arun(counts.top_users, ctx.guild.id, since, 10),
         )
         if top:
             lines = [header, f"\n**Top {len(top)} usuários:**"]
@@ -105,7 +148,7 @@ class Reports(commands.Cog):
         except Exception:
             members = list(ctx.guild.members)  # fallback no cache
 
-        now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        now = db.now_ts()
         inserted = 0
         for m in members:
             if m.bot:
@@ -113,9 +156,10 @@ class Reports(commands.Cog):
             status = str(m.status)
             username = f"{m.name}#{m.discriminator}" if m.discriminator != "0" else m.name
             try:
-                db.log_presence(m.id, username, status, now, ctx.guild.id)
+                await db.queue_presence(m.id, username, status, now, ctx.guild.id)
                 inserted += 1
             except Exception as e:
-                print(f"[snapshot] erro: {e}")
+                log.error(f"erro: {e}")
+        await db.flush_presence()  # snapshot visível imediatamente
 
         await ctx.reply(f"Snapshot registrado: **{inserted}** membros.")
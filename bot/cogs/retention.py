@@ -0,0 +1,40 @@
+from __future__ import annotations
+import asyncio
+import logging
+from discord.ext import commands, tasks
+from bot.config import Config
+from bot import cache, retention
+
+log = logging.getLogger("bot.retention")
+
+class Retention(commands.Cog):
+    """
+    Compacta o presence_log antigo em presence_intervals, apaga trechos além
+    do corte definitivo e roda incremental_vacuum. Cada lote roda numa
+    thread, numa transação curta; nada disso passa pelo event loop.
+    Só no modo de processo único: com shards quem roda é o gravador (bot/ingest.py).
+    """
+
+    def __init__(self, bot: commands.Bot, config: Config):
+        self.bot = bot
+        self.config = config
+        if retention.enabled():
+            self.retention_loop.start()
+
+    async def cog_unload(self):
+        self.retention_loop.cancel()
+
+    @tasks.loop(seconds=retention.EVERY)
+    async def retention_loop(self):
+        try:
+            if await asyncio.to_thread(retention.run_once):
+                # as contagens só enxergam o log bruto: o que foi compactado sai delas
+                cache.invalidate()
+        except Exception as e:
+            log.error(f"erro: {e}")
+
+    @retention_loop.before_loop
+    async def before_retention(self):
+        await self.bot.wait_until_ready()
+        log.info(f"loop iniciado (cada {retention.EVERY}s, bruto {retention.RAW_DAYS}d, "
+                 f"corte {retention.HARD_DAYS or '∞'}d)")
@@ -0,0 +1,37 @@
+from __future__ import annotations
+import asyncio
+import logging
+from discord.ext import commands, tasks
+from bot.config import Config
+from bot import rollup
+
+log = logging.getLogger("bot.rollup")
+
+class Rollup(commands.Cog):
+    """
+    Mantém o rollup diário (presence_daily) em dia com o presence_log.
+    A cada ciclo consome as linhas novas em lotes, numa thread, até alcançar
+    o fim do log; dias já consolidados não são recalculados.
+    Só no modo de processo único: com shards quem roda é o gravador (bot/ingest.py).
+    """
+
+    def __init__(self, bot: commands.Bot, config: Config):
+        self.bot = bot
+        self.config = config
+        if rollup.ENABLED:
+            self.rollup_loop.start()
+
+    async def cog_unload(self):
+        self.rollup_loop.cancel()
+
+    @tasks.loop(seconds=rollup.EVERY)
+    async def rollup_loop(self):
+        try:
+            await asyncio.to_thread(rollup.catch_up)
+        except Exception as e:
+            log.error(f"erro ao consolidar: {e}")
+
+    @rollup_loop.before_loop
+    async def before_rollup(self):
+        await self.bot.wait_until_ready()
+        log.info(f"loop iniciado (cada {rollup.EVERY}s, lote {rollup.BATCH})")
@@ -1,54 +1,260 @@
 from __future__ import annotations
-from datetime import datetime, timezone
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+import logging
+import math
 import os
+import random
+import time
 import discord
 from discord.ext import commands, tasks
 from bot.config import Config
-from bot import db
+from bot import chunking, db, metrics, worktime
 
 # Periodicidade (segundos) configurável pelo .env
 SAMPLE_EVERY = int(os.getenv("SAMPLE_EVERY_SECONDS", "60"))  # 60s = 1 min
+# "full"    = grava todos os membros a cada ciclo (comportamento original)
+# "changes" = grava só quando o status difere do último gravado (+ heartbeat opcional)
+SAMPLE_MODE = os.getenv("SAMPLE_MODE", "full").strip().lower()
+# Em modo "changes", regrava o status mesmo sem mudança após N segundos (0 = desliga)
+SAMPLE_HEARTBEAT = int(os.getenv("SAMPLE_HEARTBEAT_SECONDS", "0"))
+
+# Agenda escalonada: cada servidor tem sua fase dentro do intervalo e os
+# servidores grandes são amostrados em fatias espalhadas pelo ciclo.
+SAMPLE_TICK = float(os.getenv("SAMPLE_TICK_SECONDS", "1"))
+SAMPLE_SLICE_SIZE = int(os.getenv("SAMPLE_SLICE_SIZE", "1000"))
+SAMPLE_JITTER = float(os.getenv("SAMPLE_JITTER", "0.1"))  # fração do espaço entre fatias
+# Intervalo adaptativo: mais curto com muita troca de status, mais longo fora do expediente
+SAMPLE_MIN_SECONDS = float(os.getenv("SAMPLE_MIN_SECONDS", str(max(SAMPLE_EVERY / 2, SAMPLE_TICK))))
+SAMPLE_MAX_SECONDS = float(os.getenv("SAMPLE_MAX_SECONDS", str(SAMPLE_EVERY * 5)))
+SAMPLE_OFFHOURS_FACTOR = float(os.getenv("SAMPLE_OFFHOURS_FACTOR", "5"))
+SAMPLE_CHURN_HIGH = float(os.getenv("SAMPLE_CHURN_HIGH", "0.05"))  # trocas por membro por ciclo
+WORK_DAYS = {int(x) for x in os.getenv("WORK_DAYS", "0,1,2,3,4").split(",") if x.strip() != ""}
+
+log = logging.getLogger("bot.sampler")
+_M_TICK = metrics.histogram("sampler_tick_seconds", "Duração de cada tick do sampler (todas as fatias devidas)")
+_M_LAG = metrics.histogram("sampler_slice_lag_seconds", "Atraso de cada fatia em relação ao horário agendado")
+
+def _in_work_hours(ts: float) -> bool:
+    d = worktime.local_date(ts)
+    if d.weekday() not in WORK_DAYS:
+        return False
+    _, ws, we, _ = worktime.day_bounds(d)
+    return ws <= ts < we
+
+def _phase(guild_id: int) -> float:
+    """Fase estável do servidor dentro do intervalo, em [0, 1) (hash multiplicativo)."""
+    return ((guild_id * 2654435761) & 0xFFFFFFFF) / 2**32
+
+@dataclass
+class _GuildSchedule:
+    interval: float
+    cycle_start: float                     # instante monotônico do início do ciclo atual
+    next_at: float                         # quando a próxima fatia vence
+    slice_idx: int = 0
+    pending: bool = True                   # ciclo novo ainda não preparado
+    ids: List[int] = field(default_factory=list)  # membros do ciclo (fixados no início)
+    slices: int = 1
+    changes: int = 0                       # trocas de status vistas no ciclo atual
+    churn: float = 0.0                     # média móvel de trocas por membro por ciclo
+    cycles: int = 0
+    last_lag: float = 0.0
+    max_lag: float = 0.0
+    lag_sum: float = 0.0
+    lag_n: int = 0
 
 class Sampler(commands.Cog):
     """
     Amostra o status de TODOS os membros de TODOS os servidores onde o bot está,
     em intervalos regulares, gravando no presence_log.
     Isso garante dados mesmo sem 'mudanças de status'.
+
+    Em SAMPLE_MODE=changes o sampler guarda, por servidor, o último status
+    gravado de cada membro e só emite uma linha quando ele muda (ou quando o
+    heartbeat vence). Como as durações são calculadas a partir das transições,
+    o resultado de _durations_in_window não muda; só some a redundância.
+
+    Os servidores não são varridos todos no mesmo instante: cada um tem uma
+    fase própria no intervalo, os grandes são divididos em fatias de
+    SAMPLE_SLICE_SIZE membros espalhadas pelo ciclo (com jitter) e o
+    intervalo de cada servidor se adapta à troca de status e ao expediente.
     """
 
     def __init__(self, bot: commands.Bot, config: Config):
         self.bot = bot
         self.config = config
+        self.changes_only = SAMPLE_MODE == "changes"
+        # guild_id -> user_id -> (status, instante monotônico da gravação)
+        self._last: Dict[int, Dict[int, Tuple[str, float]]] = {}
+        self._sched: Dict[int, _GuildSchedule] = {}
         # começa a amostrar quando o bot estiver pronto
         self.poll_loop.start()
 
-    def cog_unload(self):
+    async def cog_unload(self):
         self.poll_loop.cancel()
+        await db.flush_presence()
+
+    def _should_write(self, guild_id: int, user_id: int, status: str, mono: float) -> bool:
+        if not self.changes_only:
+            return True
+        last = self._last.get(guild_id, {}).get(user_id)
+        if last is None or last[0] != status:
+            return True
+        return SAMPLE_HEARTBEAT > 0 and (mono - last[1]) >= SAMPLE_HEARTBEAT
+
+    def _remember(self, guild_id: int, user_id: int, status: str, mono: float) -> None:
+        if self.changes_only:
+            self._last.setdefault(guild_id, {})[user_id] = (status, mono)
+
+    # ---- agenda ----------------------------------------------------------
+
+    def _interval_for(self, sched: _GuildSchedule) -> float:
+        if sched.churn >= SAMPLE_CHURN_HIGH:
+            interval = SAMPLE_MIN_SECONDS
+        elif _in_work_hours(time.time()):
+            interval = float(SAMPLE_EVERY)
+        else:
+            interval = SAMPLE_EVERY * SAMPLE_OFFHOURS_FACTOR
+        return min(max(interval, SAMPLE_MIN_SECONDS), SAMPLE_MAX_SECONDS)
+
+    def _slice_due(self, sched: _GuildSchedule) -> float:
+        slot = sched.interval / sched.slices
+        return sched.cycle_start + sched.slice_idx * slot + random.uniform(0.0, SAMPLE_JITTER * slot)
+
+    def _new_cycle(self, guild: discord.Guild, sched: _GuildSchedule) -> None:
+        sched.ids = [m.id for m in guild.members if not m.bot]
+        sched.slices = max(1, math.ceil(len(sched.ids) / SAMPLE_SLICE_SIZE))
+        sched.slice_idx = 0
+        sched.pending = False
+        sched.next_at = self._slice_due(sched)
 
-    @tasks.loop(seconds=SAMPLE_EVERY)
+    def _finish_cycle(self, sched: _GuildSchedule, mono: float) -> None:
+        members = max(1, len(sched.ids))
+        rate = sched.changes / members
+        sched.churn = rate if not sched.cycles else 0.5 * sched.churn + 0.5 * rate
+        sched.changes = 0
+        sched.cycles += 1
+        start = sched.cycle_start + sched.interval
+        sched.interval = self._interval_for(sched)
+        # atrasou um ciclo inteiro: recomeça a partir de agora em vez de acumular
+        sched.cycle_start = start if mono - start < sched.interval else mono
+
+    def _schedule(self, guild: discord.Guild, mono: float) -> _GuildSchedule:
+        sched = self._sched.get(guild.id)
+        if sched is None:
+            interval = float(SAMPLE_EVERY)
+            start = mono + _phase(guild.id) * interval
+            sched = _GuildSchedule(interval=interval, cycle_start=start, next_at=start)
+            self._sched[guild.id] = sched
+        return sched
+
+    async def _sample_slice(self, guild: discord.Guild, sched: _GuildSchedule, mono: float) -> None:
+        if sched.pending:
+            if chunking.startup_pending(guild.id):
+                return  # a fila da inicialização carrega este servidor; sem chunk fora da ordem
+            # só baixa os membros de novo se o cache tiver buraco
+            await chunking.ensure_chunked(guild)
+            self._new_cycle(guild, sched)
+            if mono < sched.next_at:
+                return
+
+        lag = max(0.0, mono - sched.next_at)
+        sched.last_lag = lag
+        sched.max_lag = max(sched.max_lag, lag)
+        sched.lag_sum += lag
+        sched.lag_n += 1
+        _M_LAG.observe(lag)
+
+        now = db.now_ts()
+        lo = sched.slice_idx * SAMPLE_SLICE_SIZE
+        for uid in sched.ids[lo:lo + SAMPLE_SLICE_SIZE]:
+            m = guild.get_member(uid)
+            if m is None:
+                continue  # saiu do servidor durante o ciclo
+            status = str(m.status)  # refletirá online/idle/dnd/offline de verdade
+            if not self._should_write(guild.id, m.id, status, mono):
+                continue
+            username = f"{m.name}#{m.discriminator}" if m.discriminator != "0" else m.name
+            try:
+                await db.queue_presence(m.id, username, status, now, guild.id)
+                self._remember(guild.id, m.id, status, mono)
+            except Exception as e:
+                log.error(f"erro ao gravar {guild.id}/{m.id}: {e}")
+
+        sched.slice_idx += 1
+        if sched.slice_idx >= sched.slices:
+            self._finish_cycle(sched, mono)
+            sched.pending = True
+            sched.next_at = sched.cycle_start
+        else:
+            sched.next_at = self._slice_due(sched)
+
+    @tasks.loop(seconds=SAMPLE_TICK)
     async def poll_loop(self):
-        now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        t0 = time.perf_counter()
         for guild in list(self.bot.guilds):
+            mono = time.monotonic()
+            sched = self._schedule(guild, mono)
+            if mono < sched.next_at:
+                continue
             try:
-                # garante que o cache tem TODOS os membros e suas presenças
-                try:
-                    await guild.chunk(cache=True)
-                except Exception as e:
-                    print(f"[sampler] chunk {guild.id} falhou: {e}")
-
-                for m in guild.members:
-                    if m.bot:
-                        continue
-                    status = str(m.status)  # refletirá online/idle/dnd/offline de verdade
-                    username = f"{m.name}#{m.discriminator}" if m.discriminator != "0" else m.name
-                    try:
-                        db.log_presence(m.id, username, status, now, guild.id)
-                    except Exception as e:
-                        print(f"[sampler] erro ao gravar {guild.id}/{m.id}: {e}")
+                await self._sample_slice(guild, sched, mono)
             except Exception as e:
-                print(f"[sampler] erro no guild {guild.id}: {e}")
+                log.error(f"erro no guild {guild.id}: {e}")
+        _M_TICK.observe(time.perf_counter() - t0)
 
     @poll_loop.before_loop
     async def before_poll(self):
         await self.bot.wait_until_ready()
-        print(f"[sampler] loop iniciado (cada {SAMPLE_EVERY}s)")
+        mode = "changes" if self.changes_only else "full"
+        log.info(f"loop iniciado (cada {SAMPLE_EVERY}s, modo {mode}, fatias de {SAMPLE_SLICE_SIZE})")
+
+    def lag_stats(self) -> Dict[int, dict]:
+        """Por servidor: intervalo atual, troca de status e atraso das fatias (segundos)."""
+        return {
+            gid: {
+                "interval": round(s.interval, 1),
+                "slices": s.slices,
+                "churn": round(s.churn, 4),
+                "cycles": s.cycles,
+                "last_lag": round(s.last_lag, 3),
+                "avg_lag": round(s.lag_sum / s.lag_n, 3) if s.lag_n else 0.0,
+                "max_lag": round(s.max_lag, 3),
+            }
+            for gid, s in self._sched.items()
+        }
+
+    @commands.command(name="sampler_stats")
+    @commands.has_permissions(administrator=True)
+    async def sampler_stats(self, ctx: commands.Context):
+        """Mostra a agenda do sampler neste servidor (intervalo, fatias, atraso)."""
+        s = self.lag_stats().get(ctx.guild.id)
+        if not s:
+            await ctx.reply("O sampler ainda não passou por este servidor.")
+            return
+        await ctx.reply(
+            f"**Sampler — {ctx.guild.name}**\n"
+            f"- Intervalo atual: {s['interval']}s ({s['slices']} fatia(s), {s['cycles']} ciclos)\n"
+            f"- Troca de status: {s['churn'] * 100:.1f}% dos membros por ciclo\n"
+            f"- Atraso das fatias: último {s['last_lag']}s | médio {s['avg_lag']}s | máx {s['max_lag']}s"
+        )
+
+    # O cog Presence grava cada transição; registrar aqui evita que o próximo
+    # ciclo grave a mesma mudança de novo.
+    @commands.Cog.listener()
+    async def on_presence_update(self, before: discord.Member, after: discord.Member):
+        if after.bot or before.status == after.status or not after.guild:
+            return
+        sched = self._sched.get(after.guild.id)
+        if sched is not None:
+            sched.changes += 1
+        self._remember(after.guild.id, after.id, str(after.status), time.monotonic())
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        self._last.get(member.guild.id, {}).pop(member.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self._last.pop(guild.id, None)
+        self._sched.pop(guild.id, None)
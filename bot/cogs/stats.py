@@ -1,9 +1,8 @@
-from datetime import datetime, timedelta, timezone
 from typing import Optional
 import discord
 from discord.ext import commands
 from bot.config import Config
-from bot import db
+from bot import cache, chunking, counts, db, livecounts
 
 LABEL_PT = {
     "online":  "ONLINE",
@@ -20,27 +19,19 @@ class Stats(commands.Cog):
     @commands.command(name="status_servidor", aliases=["online_agora","contagem_agora"])
     async def status_servidor(self, ctx: commands.Context):
         """Mostra contagem AO VIVO de status no servidor (ignora bots)."""
-        # Garante cache atualizado de membros E presenças
-        try:
-            await ctx.guild.chunk(cache=True)
-        except Exception as e:
-            print(f"[status_servidor] chunk falhou: {e}")
-
-        counts = {"online": 0, "idle": 0, "dnd": 0, "offline": 0}
-        for m in ctx.guild.members:  # usa o CACHE do gateway
-            if m.bot:
-                continue
-            key = str(m.status)  # agora reflete a presença real
-            if key in counts:
-                counts[key] += 1
+        # contadores mantidos pelos eventos de presença; só conta o cache se ainda não existem
+        contagem = livecounts.get(ctx.guild.id)
+        if contagem is None:
+            await chunking.ensure_chunked(ctx.guild)  # chunk só se houver buraco
+            contagem = livecounts.seed(ctx.guild)
 
         label = {"online": "ONLINE", "idle": "AUSENTE", "dnd": "NÃO PERTURBE", "offline": "OFFLINE"}
         msg = [
             f"**Status agora — {ctx.guild.name}**",
-            f"- {label['online']}: {counts['online']}",
-            f"- {label['idle']}: {counts['idle']}",
-            f"- {label['dnd']}: {counts['dnd']}",
-            f"- {label['offline']}: {counts['offline']}",
+            f"- {label['online']}: {contagem['online']}",
+            f"- {label['idle']}: {contagem['idle']}",
+            f"- {label['dnd']}: {contagem['dnd']}",
+            f"- {label['offline']}: {contagem['offline']}",
             "_Obs.: OFFLINE inclui quem está Invisível._"
         ]
         await ctx.reply("\n".join(msg))
@@ -59,13 +50,11 @@ class Stats(commands.Cog):
             days = int(days)
         except Exception:
             days = 7
-        since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+        since = cache.bucket(db.now_ts() - days * 86400)
         limit = self.config.leaderboard_limit
-        rows = db.fetch_all(
-            "SELECT user_id, MAX(username) AS uname, COUNT(*) AS c "
-            "FROM presence_log WHERE guild_id = ? AND timestamp >= ? "
-            "GROUP BY user_id ORDER BY c DESC LIMIT ?",
-            (ctx.guild.id, since, limit)
+        rows = await cache.cached(
+            ctx.guild.id, "leaderboard", (since, limit),
+            lambda: db.arun(counts.leaderboard, ctx.guild.id, since, limit),
         )
         if not rows:
             await ctx.reply("Sem dados suficientes nesse período.")
@@ -82,19 +71,34 @@ class Stats(commands.Cog):
             days = int(days)
         except Exception:
             days = 7
-        since = (datetime.now(timezone.utc) - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
-        rows = db.fetch_all(
-            "SELECT status, COUNT(*) FROM presence_log "
-            "WHERE guild_id = ? AND user_id = ? AND timestamp >= ? "
-            "GROUP BY status",
-            (ctx.guild.id, member.id, since)
+        since = cache.bucket(db.now_ts() - days * 86400)
+        rows = await cache.cached(
+            ctx.guild.id, "stats", (member.id, since),
+            lambda: db.arun(counts.user_status_counts, ctx.guild.id, member.id, since),
         )
         if not rows:
             await ctx.reply(f"Sem dados para {member.display_name} nos últimos {days} dias.")
             return
-        counts = {k.lower(): v for k, v in rows}
+        por_status: dict = {}
+        for code, v in rows:
+            key = db.STATUS_KEY.get(code, "offline")
+            por_status[key] = por_status.get(key, 0) + v
         order = ["online","idle","dnd","offline"]
         linhas = [f"**{member.display_name} — últimos {days} dias**"]
         for k in order:
-            linhas.append(f"- {LABEL_PT[k]}: {counts.get(k, 0)}")
+            linhas.append(f"- {LABEL_PT[k]}: {por_status.get(k, 0)}")
         await ctx.reply("\n".join(linhas))
+
+    @commands.command(name="cache_stats")
+    @commands.has_permissions(administrator=True)
+    async def cache_stats(self, ctx: commands.Context):
+        """Mostra acertos/erros do cache de consultas (admin)."""
+        s = cache.cache_stats()
+        await ctx.reply(
+            "**Cache de consultas**\n"
+            f"- Entradas: {s['entries']}/{s['max_entries']} (em andamento: {s['inflight']})\n"
+            f"- Acertos: {s['hits']} ({s['stale_hits']} com dados sujos) | erros: {s['misses']} | "
+            f"agrupadas: {s['collapsed']} | taxa: {s['hit_ratio'] * 100:.1f}%\n"
+            f"- Invalidações: {s['invalidations']} | despejos LRU: {s['evictions']} | "
+            f"grandes demais: {s['uncacheable']}"
+        )
@@ -1,12 +1,12 @@
 from __future__ import annotations
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, List, Tuple
-import os, re
+import csv, io, os, re
 
 import discord
 from discord.ext import commands
 from bot.config import Config
-from bot import db
+from bot import attendance, chunking, db, rollup, timeline
 
 # --------- Padrões configuráveis via .env ----------
 DEFAULT_TZ    = os.getenv("WORK_TZ", "America/Sao_Paulo")
@@ -47,11 +47,6 @@ def _fmt_hms(seconds: float) -> str:
     out.append(f"{s}s")
     return " ".join(out)
 
-def _parse_utc(ts: str) -> datetime:
-    # banco salva "YYYY-MM-DD HH:MM:SS" em UTC
-    dt = datetime.strptime(ts, "%Y-%m-%d %H:%M:%S")
-    return dt.replace(tzinfo=timezone.utc)
-
 def _durations_in_window(guild_id: int, user_id: int, start_utc: datetime, end_utc: datetime) -> Dict[str,float]:
     """
     Devolve os segundos por status em [start_utc, end_utc].
@@ -61,36 +56,37 @@ def _durations_in_window(guild_id: int, user_id: int, start_utc: datetime, end_u
     if end_utc <= start_utc:
         return {"online":0.0, "idle":0.0, "dnd":0.0, "offline":0.0}
 
-    start = start_utc.strftime("%Y-%m-%d %H:%M:%S")
-    end   = end_utc.strftime("%Y-%m-%d %H:%M:%S")
+    # tudo em epoch (segundos): sem parse de data por linha
+    return timeline.durations_between(guild_id, user_id, start_utc.timestamp(), end_utc.timestamp())
 
-    last_before = db.fetch_one(
-        "SELECT status, timestamp FROM presence_log "
-        "WHERE guild_id = ? AND user_id = ? AND timestamp < ? "
-        "ORDER BY timestamp DESC LIMIT 1",
-        (guild_id, user_id, start)
-    )
-    current_status = last_before[0] if last_before else "offline"
-    prev_time = start_utc
-
-    rows = db.fetch_all(
-        "SELECT status, timestamp FROM presence_log "
-        "WHERE guild_id = ? AND user_id = ? AND timestamp >= ? AND timestamp <= ? "
-        "ORDER BY timestamp ASC",
-        (guild_id, user_id, start, end)
+def _durations_by_window(
+    guild_id: int, user_id: int, janelas: List[Tuple[datetime, datetime]], tz, start_hm, end_hm
+) -> List[Dict[str,float]]:
+    """
+    Durações de cada janela (ordenadas, uma por dia) sem consultar dia a dia:
+    se for a janela útil padrão, lê os dias do rollup diário (que já resolve
+    pelo log bruto os dias ainda não consolidados); senão busca os eventos do
+    período inteiro uma vez e faz uma única varredura. Janela que o rollup
+    não devolver entra numa única consulta extra, junto com as outras.
+    """
+    if not janelas:
+        return []
+    if not (rollup.ENABLED and rollup.matches(tz, start_hm, end_hm)):
+        return timeline.durations_for_windows(
+            guild_id, user_id, [(a.timestamp(), b.timestamp()) for a, b in janelas]
+        )
+    por_dia = rollup.daily_business_durations(
+        guild_id, user_id, janelas[0][0].timestamp(), janelas[-1][1].timestamp()
     )
-
-    durs = {"online":0.0, "idle":0.0, "dnd":0.0, "offline":0.0}
-    for st, ts in rows:
-        t = _parse_utc(ts)
-        if t > prev_time:
-            durs[current_status] += (t - prev_time).total_seconds()
-        current_status = st
-        prev_time = t
-
-    if end_utc > prev_time:
-        durs[current_status] += (end_utc - prev_time).total_seconds()
-    return durs
+    out: List[Optional[Dict[str, float]]] = [por_dia.get(a.astimezone(tz).date()) for a, _ in janelas]
+    faltam = [i for i, durs in enumerate(out) if durs is None]
+    if faltam:
+        extra = timeline.durations_for_windows(
+            guild_id, user_id, [(janelas[i][0].timestamp(), janelas[i][1].timestamp()) for i in faltam]
+        )
+        for i, durs in zip(faltam, extra):
+            out[i] = durs
+    return out
 
 def _parse_when(arg: Optional[str], tz, start_hm: Tuple[int,int], end_hm: Tuple[int,int]) -> List[Tuple[datetime, datetime]]:
     """
@@ -189,6 +185,10 @@ class WorkCheck(commands.Cog):
 
         linhas: List[str] = []
         total_ativo = 0.0
+        validas = [(a, b) for a, b in janelas if a.astimezone(tz).date().weekday() in dias_validos]
+        # consulta e varredura no executor de leitura, fora do event loop
+        durs_validas = await db.arun(_durations_by_window, ctx.guild.id, membro.id, validas, tz, (sh,sm), (eh,em))
+        por_janela = dict(zip(validas, durs_validas))
 
         for w_ini_utc, w_fim_utc in janelas:
             data_local = w_ini_utc.astimezone(tz).date()
@@ -196,7 +196,7 @@ class WorkCheck(commands.Cog):
                 linhas.append(f"- {data_local} (fora dos dias úteis) — ignorado")
                 continue
 
-            durs = _durations_in_window(ctx.guild.id, membro.id, w_ini_utc, w_fim_utc)
+            durs = por_janela[(w_ini_utc, w_fim_utc)]
             ativo_seg = sum(durs[k] for k in status_ativos)
             total_ativo += ativo_seg
 
@@ -220,6 +220,81 @@ class WorkCheck(commands.Cog):
 
         await ctx.reply("\n".join(linhas))
 
+    # ----------------- TRABALHOU? (servidor inteiro) -----------------
+    @commands.command(name="trabalhou_todos", aliases=["worked_all"])
+    async def trabalhou_todos(
+        self,
+        ctx: commands.Context,
+        quando: Optional[str] = "hoje",
+        min_minutos: Optional[int] = 30,
+        modo: Optional[str] = "ativo",
+        inicio: Optional[str] = None,
+        fim: Optional[str] = None,
+        dias: Optional[str] = None,
+        fuso: Optional[str] = None,
+    ):
+        """
+        'Trabalhou?' para TODOS os membros (exceto bots), com tabela completa em CSV.
+        Exemplos:
+          !trabalhou_todos                       -> hoje, 30min, 08:00-18:00, seg-sex
+          !trabalhou_todos ontem 15
+          !trabalhou_todos 2025-08-10..2025-08-14 30 online 09:00 17:00
+        """
+        try:
+            min_minutos = int(min_minutos)
+        except Exception:
+            min_minutos = 30
+
+        tz = get_tz(fuso or DEFAULT_TZ)
+        sh, sm = _parse_hhmm(inicio or DEFAULT_START)
+        eh, em = _parse_hhmm(fim    or DEFAULT_END)
+        dias_validos = set(int(x) for x in (dias or DEFAULT_DAYS).split(",") if x!="")
+        modo = (str(modo or "ativo")).lower()
+        status_ativos = {"online","idle","dnd"} if modo in ("ativo","active") else {"online"}
+
+        janelas = [
+            (a, b) for a, b in _parse_when(quando, tz, (sh,sm), (eh,em))
+            if a.astimezone(tz).date().weekday() in dias_validos
+        ]
+        await chunking.ensure_chunked(ctx.guild)  # na hora, se ainda estiver na fila da inicialização
+        membros = {m.id: m for m in ctx.guild.members if not m.bot}
+        if not janelas or not membros:
+            await ctx.reply("Nenhum dia útil no período (ou nenhum membro).")
+            return
+
+        # uma consulta para o servidor todo + cálculo vetorizado, fora do event loop
+        tabela = await db.arun(
+            attendance.attendance_table,
+            ctx.guild.id, list(membros), [(a.timestamp(), b.timestamp()) for a, b in janelas],
+        )
+
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(["data", "user_id", "nome", "ativo_s", "online_s", "idle_s", "dnd_s", "offline_s", "trabalhou"])
+        linhas = [
+            f"**Trabalhou — todos ({len(membros)} membros)**\n"
+            f"Janela: {sh:02d}:{sm:02d}-{eh:02d}:{em:02d} | Modo: {modo.upper()} | "
+            f"Mín: {min_minutos}min | TZ: {_tz_label(tz)}"
+        ]
+        for w, (a, _) in enumerate(janelas):
+            data_local = a.astimezone(tz).date()
+            ok_count = 0
+            for uid, durs_list in tabela.items():
+                durs = durs_list[w]
+                ativo_seg = sum(durs[k] for k in status_ativos)
+                ok = ativo_seg >= (min_minutos*60)
+                ok_count += ok
+                writer.writerow([
+                    data_local, uid, membros[uid].display_name, int(ativo_seg),
+                    int(durs["online"]), int(durs["idle"]), int(durs["dnd"]), int(durs["offline"]),
+                    "sim" if ok else "nao",
+                ])
+            linhas.append(f"- {data_local}: {ok_count}/{len(tabela)} trabalharam")
+
+        data = buf.getvalue().encode("utf-8-sig")  # BOM p/ Excel
+        filename = f"trabalhou_todos_g{ctx.guild.id}.csv"
+        await ctx.reply("\n".join(linhas), file=discord.File(io.BytesIO(data), filename=filename))
+
     # ----------------- AUSENTE (idle) -----------------
     
     @commands.command(name="ausente", aliases=["tempo_ausente"])
@@ -261,6 +336,10 @@ class WorkCheck(commands.Cog):
 
         total_idle = 0.0
         linhas = []
+        validas = [(a, b) for a, b in janelas if a.astimezone(tz).date().weekday() in dias_validos]
+        # consulta e varredura no executor de leitura, fora do event loop
+        durs_validas = await db.arun(_durations_by_window, ctx.guild.id, membro.id, validas, tz, (sh,sm), (eh,em))
+        por_janela = dict(zip(validas, durs_validas))
 
 
         for a_utc, b_utc in janelas:
@@ -269,7 +348,7 @@ class WorkCheck(commands.Cog):
                 linhas.append(f"- {data_local} (fora dos dias úteis) — ignorado")
                 continue
 
-            durs = _durations_in_window(ctx.guild.id, membro.id, a_utc, b_utc)
+            durs = por_janela[(a_utc, b_utc)]
             idle = durs["idle"]
             total_idle += idle
 
@@ -301,17 +380,12 @@ class WorkCheck(commands.Cog):
             await ctx.reply(f"{membro.display_name} **NÃO** está AUSENTE agora.")
             return
 
-        row = db.fetch_one(
-            "SELECT timestamp FROM presence_log WHERE guild_id=? AND user_id=? AND status='idle' "
-            "ORDER BY timestamp DESC LIMIT 1",
-            (ctx.guild.id, membro.id)
-        )
-        if not row:
+        t0 = await db.arun(db.last_status_ts, ctx.guild.id, membro.id, "idle")
+        if t0 is None:
             await ctx.reply(f"{membro.display_name} está **AUSENTE** agora (início desconhecido).")
             return
 
-        t0 = datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
-        dt = (datetime.now(timezone.utc) - t0).total_seconds()
+        dt = db.now_ts() - t0
         h, s = divmod(int(dt), 3600); m, s = divmod(s, 60)
         dur = (f"{h}h " if h else "") + (f"{m}m " if m else "") + f"{s}s"
         await ctx.reply(f"{membro.display_name} está **AUSENTE** há {dur}.")
@@ -356,7 +430,7 @@ class WorkCheck(commands.Cog):
         a_utc = a_local.astimezone(timezone.utc)
         b_utc = b_local.astimezone(timezone.utc)
 
-        durs = _durations_in_window(ctx.guild.id, membro.id, a_utc, b_utc)
+        durs = await db.arun(_durations_in_window, ctx.guild.id, membro.id, a_utc, b_utc)
         ativo = sum(durs[k] for k in status_ativos)
 
         linhas = [
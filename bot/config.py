@@ -7,6 +7,27 @@ class Config:
     prefix: str = "!"
     database_file: str = "presence_data.db"
     leaderboard_limit: int = 10
+    # escritor em lote do presence_log
+    writer_batch_size: int = 1000
+    writer_flush_seconds: float = 2.0
+    writer_max_queue: int = 50000
+    # conexões / PRAGMAs do SQLite
+    db_journal_mode: str = "WAL"
+    db_synchronous: str = "NORMAL"
+    db_mmap_size: int = 256 * 1024 * 1024
+    db_cache_size: int = -64000  # negativo = KiB
+    db_busy_timeout_ms: int = 5000
+    db_readers: int = 4
+    db_query_timeout: float = 30.0
+    # modo com shards: N processos de shard + 1 processo gravador
+    shard_processes: int = 1
+    shard_count: int = 0  # 0 = um shard por processo
+    ingest_address: str = "127.0.0.1:8765"
+    # endpoint de métricas Prometheus (0 = desligado; com shards: porta + primeiro shard do processo)
+    metrics_port: int = 0
+    metrics_host: str = "127.0.0.1"
+    # "lazy" = on_ready sem esperar o chunk (fila em segundo plano); "eager" = chunk de tudo antes
+    startup_chunking: str = "lazy"
 
     @classmethod
     def from_env(cls) -> "Config":
@@ -16,9 +37,43 @@ class Config:
         prefix = os.getenv("BOT_PREFIX", "!")
         database_file = os.getenv("DATABASE_FILE", "presence_data.db")
         leaderboard_limit = int(os.getenv("LEADERBOARD_LIMIT", "10"))
+        writer_batch_size = int(os.getenv("DB_WRITER_BATCH", "1000"))
+        writer_flush_seconds = float(os.getenv("DB_WRITER_FLUSH_SECONDS", "2"))
+        writer_max_queue = int(os.getenv("DB_WRITER_MAX_QUEUE", "50000"))
+        db_journal_mode = os.getenv("DB_JOURNAL_MODE", "WAL")
+        db_synchronous = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+        db_mmap_size = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+        db_cache_size = int(os.getenv("DB_CACHE_SIZE", "-64000"))
+        db_busy_timeout_ms = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+        db_readers = int(os.getenv("DB_READERS", "4"))
+        db_query_timeout = float(os.getenv("DB_QUERY_TIMEOUT_SECONDS", "30"))
+        shard_processes = int(os.getenv("SHARD_PROCESSES", "1"))
+        shard_count = int(os.getenv("SHARD_COUNT", "0"))
+        ingest_address = os.getenv("INGEST_ADDRESS", "127.0.0.1:8765")
+        metrics_port = int(os.getenv("METRICS_PORT", "0"))
+        metrics_host = os.getenv("METRICS_HOST", "127.0.0.1")
+        startup_chunking = os.getenv("STARTUP_CHUNKING", "lazy").strip().lower()
+        if startup_chunking not in ("lazy", "eager"):
+            raise RuntimeError(f"STARTUP_CHUNKING inválido: {startup_chunking!r} (use lazy ou eager)")
         return cls(
             token=token,
             prefix=prefix,
             database_file=database_file,
             leaderboard_limit=leaderboard_limit,
+            writer_batch_size=writer_batch_size,
+            writer_flush_seconds=writer_flush_seconds,
+            writer_max_queue=writer_max_queue,
+            db_journal_mode=db_journal_mode,
+            db_synchronous=db_synchronous,
+            db_mmap_size=db_mmap_size,
+            db_cache_size=db_cache_size,
+            db_busy_timeout_ms=db_busy_timeout_ms,
+            db_readers=db_readers,
+            db_query_timeout=db_query_timeout,
+            shard_processes=shard_processes,
+            shard_count=shard_count,
+            ingest_address=ingest_address,
+            metrics_port=metrics_port,
+            metrics_host=metrics_host,
+            startup_chunking=startup_chunking,
         )
@@ -0,0 +1,47 @@
+"""
+Contagens sobre o presence_log bruto usadas por !leaderboard, !stats e
+!report. Síncronas (rode via db.arun); ficam fora dos cogs para que o
+benchmark (bench/queries_bench.py) meça exatamente as mesmas consultas.
+"""
+from typing import List, Tuple
+
+from bot import db
+
+def leaderboard(guild_id: int, since: int, limit: int) -> List[Tuple]:
+    """(user_id, nome, mudanças de status) dos `limit` usuários com mais linhas desde `since`."""
+    return db.fetch_all(
+        "SELECT p.user_id, COALESCE(u.username, p.user_id) AS uname, p.c FROM ("
+        "  SELECT user_id, COUNT(*) AS c FROM presence_log "
+        "  WHERE guild_id = ? AND timestamp >= ? "
+        "  GROUP BY user_id ORDER BY c DESC LIMIT ?"
+        ") p LEFT JOIN users u ON u.user_id = p.user_id ORDER BY p.c DESC",
+        (guild_id, since, limit),
+    )
+
+def user_status_counts(guild_id: int, user_id: int, since: int) -> List[Tuple]:
+    """(código de status, linhas) de um usuário desde `since`."""
+    return db.fetch_all(
+        "SELECT status, COUNT(*) FROM presence_log "
+        "WHERE guild_id = ? AND user_id = ? AND timestamp >= ? "
+        "GROUP BY status",
+        (guild_id, user_id, since),
+    )
+
+def guild_status_counts(guild_id: int, since: int) -> List[Tuple]:
+    """(código de status, linhas) do servidor inteiro desde `since`."""
+    return db.fetch_all(
+        "SELECT status, COUNT(*) FROM presence_log "
+        "WHERE guild_id = ? AND timestamp >= ? GROUP BY status",
+        (guild_id, since),
+    )
+
+def top_users(guild_id: int, since: int, limit: int = 10) -> List[Tuple]:
+    """(nome, linhas) dos `limit` usuários com mais linhas desde `since`."""
+    return db.fetch_all(
+        "SELECT COALESCE(u.username, p.user_id), p.total FROM ("
+        "  SELECT user_id, COUNT(*) AS total FROM presence_log "
+        "  WHERE guild_id = ? AND timestamp >= ? "
+        "  GROUP BY user_id ORDER BY total DESC LIMIT ?"
+        ") p LEFT JOIN users u ON u.user_id = p.user_id ORDER BY p.total DESC",
+        (guild_id, since, limit),
+    )
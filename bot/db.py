@@ -1,51 +1,839 @@
+import asyncio
+import json
+import logging
+import os
+import queue
 import sqlite3
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import Iterable, Tuple
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar, Union
+
+from bot import metrics
+
+# Códigos de status gravados em presence_log.status (tabela status_codes).
+STATUS_CODES = {"offline": 0, "online": 1, "idle": 2, "dnd": 3, "idle_manual": 4, "invisible": 5}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+# Chave usada em contagens/durações: idle_manual conta como idle, invisible como offline.
+STATUS_KEY = {0: "offline", 1: "online", 2: "idle", 3: "dnd", 4: "idle", 5: "offline"}
+
+log = logging.getLogger("bot.db")
+log_writer = logging.getLogger("bot.db-writer")
+
+_M_QUEUED = metrics.counter("presence_rows_queued_total", "Linhas de presença enfileiradas para gravação", ["guild"])
+_M_WRITE = metrics.histogram("presence_db_write_seconds", "Duração de log_presence_many (uma transação)")
+_M_FLUSH = metrics.histogram("presence_flush_seconds", "Duração de cada gravação de lote do escritor (inclui IPC com shards)")
+_M_FLUSH_ROWS = metrics.histogram("presence_flush_rows", "Linhas por lote gravado", buckets=metrics.SIZE_BUCKETS)
+_M_QUERY = metrics.histogram("db_query_seconds", "Latência das leituras no executor, por comando", ["command"])
+_M_QUERY_TIMEOUTS = metrics.counter("db_query_timeouts_total", "Leituras interrompidas por timeout, por comando", ["command"])
+
+def status_code(name: str) -> int:
+    return STATUS_CODES.get(name, STATUS_CODES["offline"])
+
+def codes_for(key: str) -> Tuple[int, ...]:
+    """Todos os códigos que contam como `key` (ex.: "idle" -> idle e idle_manual)."""
+    return tuple(code for code, k in STATUS_KEY.items() if k == key)
 
 _SCHEMA = """
 CREATE TABLE IF NOT EXISTS presence_log (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
+  guild_id INTEGER NOT NULL,
   user_id INTEGER NOT NULL,
-  username TEXT NOT NULL,
-  status TEXT NOT NULL,
-  timestamp DATETIME NOT NULL,
-  guild_id INTEGER NOT NULL
+  status INTEGER NOT NULL,     -- status_codes.code
+  timestamp INTEGER NOT NULL   -- epoch UTC em segundos
+);
+CREATE TABLE IF NOT EXISTS users (
+  user_id INTEGER PRIMARY KEY,
+  username TEXT NOT NULL       -- último nome visto
+);
+CREATE TABLE IF NOT EXISTS status_codes (
+  code INTEGER PRIMARY KEY,
+  name TEXT NOT NULL UNIQUE
 );
 """
 
+_MIGRATION_BATCH = 50000
+
+# Índices de cobertura do presence_log (migrações 1 e 2). Num banco antigo eles
+# só são construídos no fim da migração 4: antes disso a 3 teria de mantê-los a
+# cada linha reescrita e a 4 os jogaria fora junto com a tabela.
+_PRESENCE_INDEXES = (
+    ("idx_presence_guild_user_ts", "guild_id, user_id, timestamp, status"),
+    ("idx_presence_guild_ts", "guild_id, timestamp, user_id, status"),
+)
+
+def _old_layout(conn: sqlite3.Connection) -> bool:
+    """presence_log ainda no layout original (username/status TEXT por linha)?"""
+    return "username" in {row[1] for row in conn.execute("PRAGMA table_info(presence_log)")}
+
+def _create_presence_indexes(conn: sqlite3.Connection, names=None) -> None:
+    for name, cols in _PRESENCE_INDEXES:
+        if names is None or name in names:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON presence_log ({cols})")
+
+def _drop_presence_indexes(conn: sqlite3.Connection) -> None:
+    for name, _ in _PRESENCE_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+def _presence_index_step(name: str) -> Callable[[sqlite3.Connection], None]:
+    def step(conn: sqlite3.Connection) -> None:
+        if _old_layout(conn):
+            return  # a migração 4 cria o índice na tabela nova
+        with conn:
+            _create_presence_indexes(conn, {name})
+    return step
+
+def _migrate_epoch_timestamps(conn: sqlite3.Connection) -> None:
+    """
+    Converte timestamps TEXT ("YYYY-MM-DD HH:MM:SS", UTC) para epoch inteiro.
+    Anda por faixas de id e commita a cada lote, então não segura o banco por
+    muito tempo e, se for interrompida, continua de onde parou (só linhas que
+    ainda são TEXT são tocadas). Os índices de cobertura saem antes da
+    reescrita e voltam no fim (no layout antigo, só na migração 4).
+    """
+    if conn.execute("SELECT 1 FROM presence_log WHERE typeof(timestamp) = 'text' LIMIT 1").fetchone() is None:
+        return
+    # reescrever sem índices: cada UPDATE mexeria nas duas árvores de cobertura
+    with conn:
+        _drop_presence_indexes(conn)
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM presence_log").fetchone()[0]
+    lo = 0
+    while lo < max_id:
+        hi = lo + _MIGRATION_BATCH
+        with conn:
+            conn.execute(
+                "UPDATE presence_log SET timestamp = CAST(strftime('%s', timestamp) AS INTEGER) "
+                "WHERE id > ? AND id <= ? AND typeof(timestamp) = 'text' "
+                "AND strftime('%s', timestamp) IS NOT NULL",
+                (lo, hi),
+            )
+        lo = hi
+        if (lo // _MIGRATION_BATCH) % 20 == 0 or lo >= max_id:
+            log.info(f"timestamps convertidos até id {min(lo, max_id)}/{max_id}")
+    # linhas com texto que não é data não têm instante utilizável
+    with conn:
+        cur = conn.execute("DELETE FROM presence_log WHERE typeof(timestamp) = 'text'")
+    if cur.rowcount:
+        log.info(f"{cur.rowcount} linhas com timestamp inválido removidas")
+    if not _old_layout(conn):
+        with conn:
+            _create_presence_indexes(conn)
+
+def _migrate_normalized_layout(conn: sqlite3.Connection) -> None:
+    """
+    Passa presence_log do layout antigo (username/status TEXT por linha) para
+    o normalizado: nome em `users`, status como código inteiro.
+    A cópia vai para presence_log_new em lotes de id (retomável pelo maior id
+    já copiado); só a troca final (drop + rename + índices) é uma transação
+    única. Precisa de espaço livre temporário ~ ao tamanho da tabela.
+    """
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO status_codes (code, name) VALUES (?, ?)",
+            [(code, name) for name, code in STATUS_CODES.items()],
+        )
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(presence_log)")}
+    if "username" not in cols:
+        return  # banco criado já no layout novo
+
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS presence_log_new ("
+        "  id INTEGER PRIMARY KEY AUTOINCREMENT,"
+        "  guild_id INTEGER NOT NULL,"
+        "  user_id INTEGER NOT NULL,"
+        "  status INTEGER NOT NULL,"
+        "  timestamp INTEGER NOT NULL"
+        ")"
+    )
+    case = " ".join(f"WHEN '{name}' THEN {code}" for name, code in STATUS_CODES.items())
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM presence_log").fetchone()[0]
+    lo = conn.execute("SELECT COALESCE(MAX(id), 0) FROM presence_log_new").fetchone()[0]
+    while lo < max_id:
+        hi = lo + _MIGRATION_BATCH
+        with conn:
+            conn.execute(
+                "INSERT INTO presence_log_new (id, guild_id, user_id, status, timestamp) "
+                f"SELECT id, guild_id, user_id, CASE status {case} ELSE 0 END, timestamp "
+                "FROM presence_log WHERE id > ? AND id <= ?",
+                (lo, hi),
+            )
+        lo = hi
+        if (lo // _MIGRATION_BATCH) % 20 == 0 or lo >= max_id:
+            log.info(f"linhas copiadas até id {min(lo, max_id)}/{max_id}")
+
+    try:
+        conn.execute("BEGIN")
+        # nome mais recente de cada usuário
+        conn.execute(
+            "INSERT OR REPLACE INTO users (user_id, username) "
+            "SELECT user_id, username FROM presence_log "
+            "WHERE id IN (SELECT MAX(id) FROM presence_log GROUP BY user_id)"
+        )
+        conn.execute("DROP TABLE presence_log")
+        conn.execute("ALTER TABLE presence_log_new RENAME TO presence_log")
+        _create_presence_indexes(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+# Migrações versionadas, aplicadas em ordem por init_db.
+# Cada passo é SQL (um comando ou lista; roda numa transação junto com o registro
+# da versão) ou uma função (conn) -> None idempotente, que pode commitar em lotes
+# por conta própria.
+_MIGRATIONS: List[Tuple[int, str, Union[str, List[str], Callable[[sqlite3.Connection], None]]]] = [
+    (
+        1,
+        "índice presence_log (guild_id, user_id, timestamp, status)",
+        _presence_index_step("idx_presence_guild_user_ts"),
+    ),
+    (
+        2,
+        "índice presence_log (guild_id, timestamp, user_id, status)",
+        _presence_index_step("idx_presence_guild_ts"),
+    ),
+    (3, "presence_log.timestamp TEXT -> epoch UTC inteiro", _migrate_epoch_timestamps),
+    (4, "tabelas users/status_codes e presence_log normalizado", _migrate_normalized_layout),
+    (
+        5,
+        "rollup diário presence_daily + cursores",
+        [
+            # segundos por (guild, usuário, dia local, status), dentro/fora da janela útil
+            "CREATE TABLE IF NOT EXISTS presence_daily ("
+            "  guild_id INTEGER NOT NULL,"
+            "  user_id INTEGER NOT NULL,"
+            "  day TEXT NOT NULL,"
+            "  status INTEGER NOT NULL,"
+            "  inside_s INTEGER NOT NULL DEFAULT 0,"
+            "  outside_s INTEGER NOT NULL DEFAULT 0,"
+            "  PRIMARY KEY (guild_id, user_id, day, status)"
+            ") WITHOUT ROWID",
+            # último evento já consolidado de cada usuário
+            "CREATE TABLE IF NOT EXISTS rollup_cursor ("
+            "  guild_id INTEGER NOT NULL,"
+            "  user_id INTEGER NOT NULL,"
+            "  status INTEGER NOT NULL,"
+            "  ts INTEGER NOT NULL,"
+            "  PRIMARY KEY (guild_id, user_id)"
+            ") WITHOUT ROWID",
+            "CREATE TABLE IF NOT EXISTS rollup_state (key TEXT PRIMARY KEY, value)",
+        ],
+    ),
+    (
+        6,
+        "presence_intervals (retenção: trechos contínuos do log antigo)",
+        # cada linha substitui uma sequência de amostras com o mesmo status;
+        # start_ts é a transição, end_ts a última amostra do trecho
+        "CREATE TABLE IF NOT EXISTS presence_intervals ("
+        "  guild_id INTEGER NOT NULL,"
+        "  user_id INTEGER NOT NULL,"
+        "  start_ts INTEGER NOT NULL,"
+        "  end_ts INTEGER NOT NULL,"
+        "  status INTEGER NOT NULL,"
+        "  PRIMARY KEY (guild_id, user_id, start_ts)"
+        ") WITHOUT ROWID",
+    ),
+]
+
+_INSERT_PRESENCE = (
+    "INSERT INTO presence_log (guild_id, user_id, status, timestamp) VALUES (?, ?, ?, ?)"
+)
+_UPSERT_USER = (
+    "INSERT INTO users (user_id, username) VALUES (?, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET username = excluded.username "
+    "WHERE users.username <> excluded.username"
+)
+
 _db_path = None
+_pragmas: dict = {}
+_writer_conn: Optional[sqlite3.Connection] = None
+_writer_lock = threading.Lock()
+_readers: Optional["queue.Queue[sqlite3.Connection]"] = None
+_all_readers: List[sqlite3.Connection] = []
+_read_executor: Optional[ThreadPoolExecutor] = None
+_query_timeout = 30.0
+# último nome gravado em `users` por user_id (só o escritor mexe, sob _writer_lock)
+_known_names: Dict[int, str] = {}
+
+def _apply_pragmas(conn: sqlite3.Connection, writer: bool) -> None:
+    conn.execute(f"PRAGMA busy_timeout = {int(_pragmas['busy_timeout_ms'])}")
+    conn.execute(f"PRAGMA cache_size = {int(_pragmas['cache_size'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(_pragmas['mmap_size'])}")
+    if writer:
+        conn.execute(f"PRAGMA journal_mode = {_pragmas['journal_mode']}")
+        conn.execute(f"PRAGMA synchronous = {_pragmas['synchronous']}")
 
-def init_db(path: str):
-    global _db_path
+def _open_reader() -> sqlite3.Connection:
+    uri = "file:" + urllib.parse.quote(os.path.abspath(_db_path)) + "?mode=ro"
+    conn = sqlite3.connect(
+        uri, uri=True, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False,
+    )
+    _apply_pragmas(conn, writer=False)
+    return conn
+
+def init_db(
+    path: str,
+    *,
+    journal_mode: str = "WAL",
+    synchronous: str = "NORMAL",
+    mmap_size: int = 256 * 1024 * 1024,
+    cache_size: int = -64000,
+    busy_timeout_ms: int = 5000,
+    readers: int = 4,
+    query_timeout: float = 30.0,
+    read_only: bool = False,
+):
+    """
+    Abre as conexões de longa duração: uma de escrita e um pool de `readers`
+    conexões somente-leitura. Em WAL as leituras rodam em paralelo com a
+    gravação do sampler em vez de esperar por ela.
+    cache_size segue a convenção do SQLite (negativo = KiB).
+    As leituras assíncronas (arun/afetch_*) usam um executor com um worker
+    por leitor e desistem após `query_timeout` segundos.
+    Com read_only=True (processos de shard) só o pool de leitura é aberto:
+    sem conexão de escrita, schema nem migrações — quem grava e migra é o
+    processo gravador (ingest.run_sink), que precisa ter subido antes.
+    """
+    global _db_path, _writer_conn, _readers, _read_executor, _query_timeout
+    close_db()
     _db_path = path
-    with sqlite3.connect(_db_path) as conn:
-        conn.execute(_SCHEMA)
-        conn.commit()
+    _pragmas.update(
+        journal_mode=journal_mode.upper(),
+        synchronous=synchronous.upper(),
+        mmap_size=mmap_size,
+        cache_size=cache_size,
+        busy_timeout_ms=busy_timeout_ms,
+    )
+    _known_names.clear()
+    if not read_only:
+        _writer_conn = sqlite3.connect(
+            _db_path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False,
+        )
+        # só vale para banco novo (ou após um VACUUM); usado pela retenção
+        _writer_conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        _apply_pragmas(_writer_conn, writer=True)
+        _writer_conn.executescript(_SCHEMA)
+        _migrate(_writer_conn)
+        _known_names.update(_writer_conn.execute("SELECT user_id, username FROM users"))
+
+    _readers = queue.Queue()
+    for _ in range(max(1, int(readers))):
+        conn = _open_reader()
+        _all_readers.append(conn)
+        _readers.put(conn)
+    _read_executor = ThreadPoolExecutor(max_workers=len(_all_readers), thread_name_prefix="db-read")
+    _query_timeout = float(query_timeout)
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def latest_schema_version() -> int:
+    """Versão que init_db deixa o banco depois de aplicar todas as migrações."""
+    return max(version for version, _, _ in _MIGRATIONS)
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """
+    Aplica as migrações pendentes de _MIGRATIONS e registra cada uma em
+    schema_version. Seguro para rodar a cada inicialização: versões já
+    aplicadas são puladas e os passos são idempotentes, então uma migração
+    interrompida (ex.: índice grande num banco de vários GB) recomeça do zero
+    na próxima subida sem deixar o schema pela metade.
+    """
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "  version INTEGER PRIMARY KEY,"
+        "  description TEXT NOT NULL,"
+        "  applied_at TEXT NOT NULL"
+        ")"
+    )
+    conn.commit()
+    current = schema_version(conn)
+    applied = 0
+    for version, description, step in _MIGRATIONS:
+        if version <= current:
+            continue
+        log.info(f"aplicando migração {version}: {description}")
+        t0 = time.perf_counter()
+        applied_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        if callable(step):
+            step(conn)
+            with conn:
+                conn.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, applied_at),
+                )
+        else:
+            try:
+                conn.execute("BEGIN")
+                for stmt in ([step] if isinstance(step, str) else step):
+                    conn.execute(stmt)
+                conn.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, applied_at),
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        applied += 1
+        log.info(f"migração {version} concluída em {time.perf_counter() - t0:.1f}s")
+    if applied:
+        # estatísticas do planejador com custo limitado mesmo em bancos grandes
+        conn.execute("PRAGMA analysis_limit = 1000")
+        conn.execute("PRAGMA optimize")
+
+def close_db() -> None:
+    global _writer_conn, _readers, _read_executor
+    if _read_executor is not None:
+        _read_executor.shutdown(wait=True, cancel_futures=True)
+        _read_executor = None
+    for conn in _all_readers:
+        conn.close()
+    _all_readers.clear()
+    _readers = None
+    if _writer_conn is not None:
+        _writer_conn.close()
+        _writer_conn = None
 
 @contextmanager
-def _conn():
-    if not _db_path:
+def write_conn():
+    if _writer_conn is None:
+        raise RuntimeError(
+            "DB sem conexão de escrita. Chame init_db(database_file) antes "
+            "(com read_only=False: só o processo gravador grava)."
+        )
+    with _writer_lock:
+        yield _writer_conn
+
+@contextmanager
+def read_conn():
+    if _readers is None:
         raise RuntimeError("DB não inicializado. Chame init_db(database_file) antes.")
-    conn = sqlite3.connect(_db_path, detect_types=sqlite3.PARSE_DECLTYPES)
+    call: Optional[_ReadCall] = getattr(_current_call, "call", None)
+    if call is not None and call.cancelled:
+        raise sqlite3.OperationalError("interrupted")
+    conn = _readers.get()
+    if call is not None:
+        call.attach(conn)
     try:
         yield conn
     finally:
-        conn.close()
+        if call is not None:
+            call.detach()
+        _readers.put(conn)
 
-def log_presence(user_id: int, username: str, status: str, ts: str, guild_id: int) -> None:
-    with _conn() as conn:
-        conn.execute(
-            "INSERT INTO presence_log (user_id, username, status, timestamp, guild_id) VALUES (?, ?, ?, ?, ?)",
-            (int(user_id), username, status, ts, int(guild_id)),
-        )
-        conn.commit()
+def now_ts() -> int:
+    """Instante atual em epoch UTC (segundos), o formato gravado em presence_log.timestamp."""
+    return int(time.time())
+
+def log_presence(user_id: int, username: str, status: str, ts: int, guild_id: int) -> None:
+    """Gravação síncrona de uma linha (fora do caminho quente; os cogs usam queue_presence)."""
+    log_presence_many([(int(user_id), username, status, int(ts), int(guild_id))])
+
+def log_presence_many(rows: List[Tuple]) -> None:
+    """
+    Grava várias linhas (user_id, username, status, ts, guild_id) numa única
+    transação. O nome só é regravado em `users` quando mudou.
+    """
+    if not rows:
+        return
+    with _M_WRITE.time(), write_conn() as conn:
+        renamed = {}
+        for user_id, username, _, _, _ in rows:
+            if _known_names.get(user_id) != username:
+                renamed[user_id] = username
+        with conn:
+            if renamed:
+                conn.executemany(_UPSERT_USER, renamed.items())
+            conn.executemany(
+                _INSERT_PRESENCE,
+                [(guild_id, user_id, status_code(status), ts) for user_id, _, status, ts, guild_id in rows],
+            )
+        _known_names.update(renamed)
 
 def fetch_one(query: str, params: Tuple = ()) -> Tuple:
-    with _conn() as conn:
+    with read_conn() as conn:
         cur = conn.execute(query, params)
         return cur.fetchone()
 
 def fetch_all(query: str, params: Tuple = ()) -> Iterable[Tuple]:
-    with _conn() as conn:
+    with read_conn() as conn:
         cur = conn.execute(query, params)
         return cur.fetchall()
+
+
+# ---- consultas de eventos (timestamps em epoch UTC) ----
+#
+# Os eventos vêm de duas tabelas: presence_log (amostras brutas recentes) e
+# presence_intervals (log antigo compactado pela retenção, um evento por
+# trecho, em start_ts). Como o status vale até o próximo evento, a união das
+# duas dá as mesmas durações que o log bruto original.
+
+# Último evento antes de um instante, nas duas tabelas, como ts*16 + código
+# (empate no mesmo segundo: maior código, como a ordem do índice no log bruto).
+# Parâmetros: guild_id, user_id, ts, guild_id, user_id, ts.
+_LAST_EVENT_KEY = (
+    "MAX("
+    "  COALESCE((SELECT timestamp * 16 + status FROM presence_log "
+    "    WHERE guild_id = ? AND user_id = ? AND timestamp < ? "
+    "    ORDER BY timestamp DESC, status DESC LIMIT 1), -1),"
+    "  COALESCE((SELECT start_ts * 16 + status FROM presence_intervals "
+    "    WHERE guild_id = ? AND user_id = ? AND start_ts < ? "
+    "    ORDER BY start_ts DESC LIMIT 1), -1)"
+    ")"
+)
+
+def status_before(guild_id: int, user_id: int, ts: float) -> Optional[str]:
+    """Último status (chave de STATUS_KEY) gravado estritamente antes de `ts` (None se não houver)."""
+    row = fetch_one(
+        f"SELECT {_LAST_EVENT_KEY}",
+        (guild_id, user_id, ts, guild_id, user_id, ts),
+    )
+    return STATUS_KEY[row[0] % 16] if row and row[0] >= 0 else None
+
+def events_between(guild_id: int, user_id: int, start_ts: float, end_ts: float) -> List[Tuple[str, int]]:
+    """Eventos (status, timestamp) em [start_ts, end_ts], em ordem crescente; status já como chave."""
+    rows = fetch_all(
+        "SELECT status, timestamp FROM presence_log "
+        "WHERE guild_id = ? AND user_id = ? AND timestamp >= ? AND timestamp <= ? "
+        "UNION ALL "
+        "SELECT status, start_ts FROM presence_intervals "
+        "WHERE guild_id = ? AND user_id = ? AND start_ts >= ? AND start_ts <= ? "
+        "ORDER BY 2, 1",
+        (guild_id, user_id, start_ts, end_ts, guild_id, user_id, start_ts, end_ts),
+    )
+    return [(STATUS_KEY[code], ts) for code, ts in rows]
+
+def last_status_ts(guild_id: int, user_id: int, status: str) -> Optional[int]:
+    """Timestamp do último registro do usuário que conta como `status` (None se não houver)."""
+    codes = codes_for(status)
+    marks = ",".join("?" * len(codes))
+    row = fetch_one(
+        "SELECT MAX(ts) FROM ("
+        "  SELECT MAX(timestamp) AS ts FROM presence_log WHERE guild_id = ? AND user_id = ? "
+        f"  AND status IN ({marks}) "
+        "  UNION ALL "
+        "  SELECT MAX(end_ts) FROM presence_intervals WHERE guild_id = ? AND user_id = ? "
+        f"  AND status IN ({marks})"
+        ")",
+        (guild_id, user_id, *codes, guild_id, user_id, *codes),
+    )
+    return row[0] if row else None
+
+def guild_events(guild_id: int, user_ids: Iterable[int], start_ts: float, end_ts: float) -> List[Tuple[int, int, int]]:
+    """
+    Numa única consulta, para cada usuário da lista: uma linha com o status
+    vigente em `start_ts` (código; offline se não houver registro anterior)
+    seguida dos eventos em [start_ts, end_ts]. Linhas (user_id, código, ts)
+    ordenadas por usuário e tempo; a linha inicial vem antes de eventos no
+    mesmo instante.
+    O status inicial é uma busca no índice por usuário (subconsulta
+    correlacionada): um MAX(timestamp) ... GROUP BY user_id varreria todo o
+    histórico anterior a `start_ts` (≈ 40x mais lento em 2 mi de linhas; ver
+    bench/attendance_bench.py).
+    """
+    ids = json.dumps([int(u) for u in user_ids])
+    last_key = _LAST_EVENT_KEY.replace("user_id = ?", "user_id = u.value")
+    return fetch_all(
+        "SELECT user_id, status, ts FROM ("
+        "  SELECT user_id, CASE WHEN k < 0 THEN 0 ELSE k % 16 END AS status, ts, 0 AS k FROM ("
+        f"    SELECT u.value AS user_id, {last_key} AS k, CAST(? AS INTEGER) AS ts FROM json_each(?) u"
+        "  )"
+        "  UNION ALL "
+        "  SELECT user_id, status, timestamp, 1 FROM presence_log "
+        "  WHERE guild_id = ? AND timestamp >= ? AND timestamp <= ? "
+        "  AND user_id IN (SELECT value FROM json_each(?))"
+        "  UNION ALL "
+        "  SELECT user_id, status, start_ts, 1 FROM presence_intervals "
+        "  WHERE guild_id = ? AND start_ts >= ? AND start_ts <= ? "
+        "  AND user_id IN (SELECT value FROM json_each(?))"
+        ") ORDER BY user_id, ts, k, status",
+        (
+            guild_id, start_ts, guild_id, start_ts, start_ts, ids,
+            guild_id, start_ts, end_ts, ids,
+            guild_id, start_ts, end_ts, ids,
+        ),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Leitura assíncrona (executor dedicado; o event loop nunca roda SQLite)
+# ---------------------------------------------------------------------------
+
+T = TypeVar("T")
+
+class _ReadCall:
+    """Estado de uma chamada assíncrona: qual leitor ela está usando e se foi abandonada."""
+
+    def __init__(self):
+        self.cancelled = False
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def attach(self, conn: sqlite3.Connection) -> None:
+        with self._lock:
+            self._conn = conn
+
+    def detach(self) -> None:
+        with self._lock:
+            self._conn = None
+
+    def cancel(self) -> None:
+        """Marca como abandonada e interrompe a consulta em andamento, liberando o leitor."""
+        with self._lock:
+            self.cancelled = True
+            if self._conn is not None:
+                self._conn.interrupt()
+
+_current_call = threading.local()
+
+async def arun(fn: Callable[..., T], *args: Any, timeout: Optional[float] = None) -> T:
+    """
+    Roda `fn(*args)` (código síncrono que lê via fetch_*/read_conn) no
+    executor de leitura. Se estourar `timeout` (padrão: query_timeout do
+    init_db) ou se quem aguarda for cancelado, a consulta em andamento é
+    interrompida e o leitor volta ao pool.
+    """
+    if _read_executor is None:
+        raise RuntimeError("DB não inicializado. Chame init_db(database_file) antes.")
+    call = _ReadCall()
+
+    def job():
+        _current_call.call = call
+        try:
+            return fn(*args)
+        finally:
+            _current_call.call = None
+
+    limit = _query_timeout if timeout is None else timeout
+    command = metrics.current_command.get()
+    t0 = time.perf_counter()
+    fut = asyncio.get_running_loop().run_in_executor(_read_executor, job)
+    try:
+        return await asyncio.wait_for(fut, limit)
+    except asyncio.TimeoutError:
+        call.cancel()
+        _M_QUERY_TIMEOUTS.inc(command)
+        raise TimeoutError(f"consulta ao banco excedeu {limit:g}s") from None
+    except asyncio.CancelledError:
+        call.cancel()
+        raise
+    finally:
+        _M_QUERY.observe(time.perf_counter() - t0, command)
+
+async def afetch_one(query: str, params: Tuple = (), timeout: Optional[float] = None) -> Tuple:
+    return await arun(fetch_one, query, params, timeout=timeout)
+
+async def afetch_all(query: str, params: Tuple = (), timeout: Optional[float] = None) -> List[Tuple]:
+    return await arun(fetch_all, query, params, timeout=timeout)
+
+
+# ---------------------------------------------------------------------------
+# Escritor único de presença (fila assíncrona + gravação em lote)
+# ---------------------------------------------------------------------------
+
+class PresenceWriter:
+    """
+    Fila única de escrita do presence_log.
+
+    Os cogs enfileiram linhas com `put`; uma task de fundo junta as linhas e
+    grava com executemany numa única transação quando o lote chega a
+    `batch_size` ou quando `flush_interval` segundos se passam desde a
+    primeira linha do lote. A gravação roda numa thread, fora do event loop.
+    A fila é limitada a `max_queue` linhas: se encher, `put` aguarda
+    (backpressure) em vez de crescer sem limite.
+    `sink` recebe cada lote (padrão: log_presence_many neste processo; no
+    modo com shards, o envio ao processo gravador — ver bot/ingest.py).
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 1000,
+        flush_interval: float = 2.0,
+        max_queue: int = 50000,
+        sink: Optional[Callable[[List[Tuple]], None]] = None,
+    ):
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.0, float(flush_interval))
+        self.max_queue = max(1, int(max_queue))
+        self.sink = sink or log_presence_many
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue)
+        self._pending: List[Tuple] = []  # lote em montagem (não se perde no stop)
+        self._lock = asyncio.Lock()      # serializa gravações
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()  # lotes em gravação (sobrevivem ao cancelamento)
+
+        # contadores
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    # ---- ciclo de vida ----
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="presence-writer")
+
+    async def stop(self) -> None:
+        """
+        Para a task de fundo e grava tudo o que ainda estiver na fila. Só
+        retorna depois que o lote que estava em gravação terminou (contadores
+        e listeners incluídos), então quem chama pode fechar o banco em seguida.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight)
+        await self.flush()
+
+    # ---- produção ----
+    async def put(self, row: Tuple) -> None:
+        await self._queue.put(row)
+        self.enqueued += 1
+        depth = self.depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() + len(self._pending)
+
+    # ---- consumo ----
+    def _drain(self, limit: Optional[int] = None) -> None:
+        while limit is None or len(self._pending) < limit:
+            try:
+                self._pending.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._pending:
+                self._pending.append(await self._queue.get())
+            deadline = loop.time() + self.flush_interval
+            while len(self._pending) < self.batch_size:
+                self._drain(self.batch_size)
+                if len(self._pending) >= self.batch_size:
+                    break
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    self._pending.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._write_pending()
+
+    async def flush(self) -> None:
+        """Grava imediatamente tudo o que está pendente ou enfileirado."""
+        self._drain()
+        while self._pending:
+            await self._write_pending()
+            self._drain()
+
+    async def _write_pending(self) -> None:
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        # a thread do sink não para com o cancelamento de quem espera (stop):
+        # o lote roda numa task própria, protegida, para que contadores e
+        # listeners sempre vejam o que foi gravado
+        task = asyncio.ensure_future(self._write_batch(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+        await asyncio.shield(task)
+
+    async def _write_batch(self, batch: List[Tuple]) -> None:
+        async with self._lock:
+            t0 = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.sink, batch)
+                self.written += len(batch)
+            except Exception as e:
+                self.errors += 1
+                self.dropped += len(batch)
+                log_writer.error(f"erro ao gravar lote de {len(batch)} linhas: {e}")
+            else:
+                for listener in _write_listeners:
+                    try:
+                        listener(batch)
+                    except Exception as e:
+                        log_writer.error(f"erro no listener {getattr(listener, '__name__', listener)}: {e}")
+            ms = (time.perf_counter() - t0) * 1000.0
+            _M_FLUSH.observe(ms / 1000.0)
+            _M_FLUSH_ROWS.observe(len(batch))
+            self.flushes += 1
+            self.last_flush_ms = ms
+            self.total_flush_ms += ms
+            if ms > self.max_flush_ms:
+                self.max_flush_ms = ms
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.depth,
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
+
+
+_writer: Optional[PresenceWriter] = None
+# chamados no event loop com cada lote gravado com sucesso (ex.: bot/cache.py)
+_write_listeners: List[Callable[[List[Tuple]], None]] = []
+
+def add_write_listener(fn: Callable[[List[Tuple]], None]) -> None:
+    if fn not in _write_listeners:
+        _write_listeners.append(fn)
+
+def start_writer(
+    batch_size: int = 1000,
+    flush_interval: float = 2.0,
+    max_queue: int = 50000,
+    sink: Optional[Callable[[List[Tuple]], None]] = None,
+) -> PresenceWriter:
+    """Cria e inicia o escritor único. Deve ser chamado de dentro do event loop."""
+    global _writer
+    if _writer is None:
+        _writer = PresenceWriter(batch_size, flush_interval, max_queue, sink)
+    _writer.start()
+    return _writer
+
+async def stop_writer() -> None:
+    global _writer
+    if _writer is not None:
+        await _writer.stop()
+        _writer = None
+
+async def queue_presence(user_id: int, username: str, status: str, ts: int, guild_id: int) -> None:
+    """Enfileira uma linha de presença para gravação em lote (aguarda se a fila estiver cheia)."""
+    if _writer is None:
+        raise RuntimeError("Escritor não iniciado. Chame start_writer() antes.")
+    await _writer.put((int(user_id), username, status, int(ts), int(guild_id)))
+    _M_QUEUED.inc(guild_id)
+
+async def flush_presence() -> None:
+    if _writer is not None:
+        await _writer.flush()
+
+def writer_stats() -> dict:
+    return _writer.stats() if _writer is not None else {}
@@ -0,0 +1,172 @@
+"""
+Exportação em CSV compactado (gzip) sem montar o arquivo em memória.
+
+As linhas saem do cursor em blocos (fetchmany) direto para um .csv.gz em
+disco; quando a parte atual chega perto de `max_bytes` comprimidos, ela é
+fechada e uma nova começa (cada parte é um CSV completo, com cabeçalho).
+A memória fica do tamanho de um bloco, seja o período de 7 dias ou 2 anos.
+Síncrono: rode via db.arun.
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import time
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+from bot import db
+
+FETCH_ROWS = 5000
+
+class CsvGzParts:
+    """Escreve linhas CSV em partes <basename>_parteNNN.csv.gz de até `max_bytes` cada."""
+
+    def __init__(self, directory: str, basename: str, header: Sequence[str], max_bytes: int):
+        self.directory = directory
+        self.basename = basename
+        self.header = list(header)
+        # o deflate segura alguns KB antes de emitir: fecha a parte com folga
+        self.threshold = max(64 * 1024, max_bytes - min(1024 * 1024, max_bytes // 8))
+        self.paths: List[str] = []
+        self.rows = 0
+        self._raw = None
+        self._text = None
+        self._writer = None
+
+    def _open(self) -> None:
+        path = os.path.join(self.directory, f"{self.basename}_parte{len(self.paths) + 1:03d}.csv.gz")
+        self._raw = open(path, "wb")
+        gz = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=6, mtime=0)
+        self._text = io.TextIOWrapper(gz, encoding="utf-8-sig", newline="")  # BOM p/ Excel
+        self._writer = csv.writer(self._text)
+        self._writer.writerow(self.header)
+        self.paths.append(path)
+
+    def _close_part(self) -> None:
+        if self._text is not None:
+            self._text.close()  # fecha o gzip (trailer) antes do arquivo
+            self._raw.close()
+            self._text = self._raw = self._writer = None
+
+    def write(self, rows: Iterable[Sequence]) -> None:
+        if self._writer is None:
+            self._open()
+        self._writer.writerows(rows)
+        self._text.flush()
+        if self._raw.tell() >= self.threshold:
+            self._close_part()
+
+    def close(self) -> List[str]:
+        if not self.paths:
+            self._open()  # resultado vazio: uma parte só com o cabeçalho
+        self._close_part()
+        return self.paths
+
+def export_query(
+    query: str,
+    params: Tuple,
+    parts: CsvGzParts,
+    row_fn: Optional[Callable[[Tuple], Sequence]] = None,
+) -> int:
+    """Despeja o resultado de `query` em `parts`, bloco a bloco. Devolve o número de linhas."""
+    n = 0
+    with db.read_conn() as conn:
+        cur = conn.execute(query, params)
+        while True:
+            chunk = cur.fetchmany(FETCH_ROWS)
+            if not chunk:
+                break
+            parts.write(map(row_fn, chunk) if row_fn else chunk)
+            n += len(chunk)
+    parts.rows += n
+    return n
+
+def _in(key: str) -> str:
+    return f"status IN ({','.join(map(str, db.codes_for(key)))})"
+
+TOTALS_HEADER = ["user_id", "username", "ONLINE", "AUSENTE", "NÃO PERTURBE", "OFFLINE", "TOTAL"]
+
+def totals_query(guild_id: int, since: int) -> Tuple[str, Tuple]:
+    """Contagem por status por usuário desde `since` (o relatório clássico do export_csv)."""
+    return (
+        "SELECT p.user_id, COALESCE(u.username, p.user_id), "
+        "p.online, p.idle, p.dnd, p.offline, p.total FROM ("
+        "  SELECT user_id, "
+        f"  SUM({_in('online')}) AS online, "
+        f"  SUM({_in('idle')}) AS idle, "
+        f"  SUM({_in('dnd')}) AS dnd, "
+        f"  SUM({_in('offline')}) AS offline, "
+        "  COUNT(*) AS total "
+        "  FROM presence_log WHERE guild_id = ? AND timestamp >= ? "
+        "  GROUP BY user_id"
+        ") p LEFT JOIN users u ON u.user_id = p.user_id ORDER BY p.total DESC",
+        (guild_id, since),
+    )
+
+def export_totals(
+    guild_id: int,
+    since: int,
+    directory: str,
+    basename: str,
+    max_bytes: int,
+    rows: Optional[Sequence[Sequence]] = None,
+) -> Tuple[List[str], int]:
+    """
+    Escreve o totals_query em partes. Com `rows` (resultado já calculado,
+    ex.: vindo do cache de consultas) só grava; sem, lê do banco em blocos.
+    """
+    parts = CsvGzParts(directory, basename, TOTALS_HEADER, max_bytes)
+    if rows is None:
+        export_query(*totals_query(guild_id, since), parts)
+    else:
+        for i in range(0, len(rows), FETCH_ROWS):
+            parts.write(rows[i:i + FETCH_ROWS])
+        parts.rows += len(rows)
+    return parts.close(), parts.rows
+
+def _raw_row(row: Tuple) -> List:
+    ts, user_id, username, code, end_ts = row
+    return [
+        time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts)), ts, user_id, username,
+        db.STATUS_NAMES.get(code, code), "" if end_ts is None else end_ts,
+    ]
+
+def export_raw(
+    guild_id: int,
+    start_ts: int,
+    end_ts: int,
+    user_ids: Optional[Sequence[int]],
+    directory: str,
+    basename: str,
+    max_bytes: int,
+) -> Tuple[List[str], int]:
+    """
+    Eventos um a um em [start_ts, end_ts), opcionalmente só dos `user_ids`.
+    Primeiro os trechos já compactados pela retenção (com o fim em
+    `ate_epoch`), depois as amostras brutas; cada bloco em ordem de tempo.
+    """
+    parts = CsvGzParts(directory, basename, ["data_utc", "epoch", "user_id", "username", "status", "ate_epoch"], max_bytes)
+    users_sql, users_params = "", ()
+    if user_ids:
+        users_sql = " AND x.user_id IN (SELECT value FROM json_each(?))"
+        users_params = (json.dumps([int(u) for u in user_ids]),)
+    export_query(
+        "SELECT x.start_ts, x.user_id, COALESCE(u.username, x.user_id), x.status, x.end_ts "
+        "FROM presence_intervals x LEFT JOIN users u ON u.user_id = x.user_id "
+        f"WHERE x.guild_id = ? AND x.start_ts >= ? AND x.start_ts < ?{users_sql} "
+        "ORDER BY x.start_ts, x.user_id",
+        (guild_id, start_ts, end_ts, *users_params),
+        parts,
+        _raw_row,
+    )
+    export_query(
+        "SELECT x.timestamp, x.user_id, COALESCE(u.username, x.user_id), x.status, NULL "
+        "FROM presence_log x LEFT JOIN users u ON u.user_id = x.user_id "
+        f"WHERE x.guild_id = ? AND x.timestamp >= ? AND x.timestamp < ?{users_sql} "
+        "ORDER BY x.timestamp",
+        (guild_id, start_ts, end_ts, *users_params),
+        parts,
+        _raw_row,
+    )
+    return parts.close(), parts.rows
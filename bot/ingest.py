@@ -0,0 +1,211 @@
+"""
+Gravação centralizada do presence_log no modo com shards (vários processos).
+
+Cada processo de shard continua usando a fila em lote de db.PresenceWriter,
+mas o lote não é gravado localmente: `RemoteSink` o envia por um canal IPC
+local (multiprocessing.connection, autenticado por authkey) ao processo
+gravador, que roda `run_sink` e é o único a inserir no presence_log.
+O envio espera a confirmação da gravação, então flush_presence() num shard
+continua garantindo que as linhas já estão visíveis no banco.
+
+O gravador é o único processo com conexão de escrita: aplica as migrações
+ao subir e roda o rollup diário e a retenção em threads próprias. Os shards
+abrem o banco só para leitura (db.init_db(read_only=True)).
+"""
+import logging
+import signal
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Callable, List, Optional, Tuple, Union
+
+from bot import db, logs, retention, rollup
+
+Address = Union[str, Tuple[str, int]]
+
+log = logging.getLogger("bot.ingest")
+
+def parse_address(s: str) -> Address:
+    """"host:porta" vira (host, porta); qualquer outra coisa é um caminho de socket Unix."""
+    host, sep, port = s.strip().rpartition(":")
+    if sep and port.isdigit():
+        return (host or "127.0.0.1", int(port))
+    return s.strip()
+
+# ---------------------------------------------------------------------------
+# Processo gravador
+# ---------------------------------------------------------------------------
+
+class IngestServer:
+    """Aceita conexões dos shards e grava cada lote recebido com log_presence_many."""
+
+    def __init__(self, address: Address, authkey: bytes):
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self.authkey = authkey
+        self._stopping = threading.Event()
+        self.batches = 0
+        self.rows = 0
+        self.errors = 0
+
+    def serve_forever(self) -> None:
+        try:
+            while True:
+                try:
+                    conn = self.listener.accept()
+                except (OSError, EOFError, AuthenticationError):
+                    if self._stopping.is_set():
+                        break
+                    continue  # handshake inválido / conexão abortada
+                if self._stopping.is_set():
+                    conn.close()
+                    break
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            self.listener.close()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        # accept() não acorda com close() de outra thread: conecta para destravar
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except (OSError, EOFError, AuthenticationError):
+            pass
+
+    def _handle(self, conn: Connection) -> None:
+        with conn:
+            while True:
+                try:
+                    kind, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if kind == "rows":
+                    try:
+                        db.log_presence_many(payload)
+                    except Exception as e:
+                        self.errors += 1
+                        log.error(f"erro ao gravar lote de {len(payload)} linhas: {e}")
+                        conn.send(("err", str(e)))
+                        continue
+                    self.batches += 1
+                    self.rows += len(payload)
+                    conn.send(("ok", len(payload)))
+                elif kind == "ping":
+                    conn.send(("ok", 0))
+                elif kind == "stop":
+                    conn.send(("ok", 0))
+                    self.stop()
+                    return
+
+def _periodic(name: str, seconds: float, fn: Callable[[threading.Event], object], stop: threading.Event) -> threading.Thread:
+    """Roda fn(stop) já e depois a cada `seconds`, numa thread, até `stop`."""
+    job_log = logging.getLogger(f"bot.{name}")
+
+    def loop() -> None:
+        job_log.info(f"loop iniciado no gravador (cada {seconds:g}s)")
+        while not stop.is_set():
+            try:
+                fn(stop)
+            except Exception as e:
+                job_log.error(f"erro: {e}")
+            stop.wait(seconds)
+
+    t = threading.Thread(target=loop, name=name, daemon=True)
+    t.start()
+    return t
+
+def run_sink(address: Address, authkey: bytes, database_file: str, db_options: dict) -> None:
+    """Ponto de entrada do processo gravador (multiprocessing)."""
+    # Ctrl+C chega a todo o grupo de processos; o gravador só sai quando o
+    # supervisor mandar "stop", depois que os shards descarregaram suas filas.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logs.setup_logging("ingest")
+    db.init_db(database_file, **db_options)
+    server = IngestServer(address, authkey)
+    log.info(f"gravador ouvindo em {address}")
+
+    # rollup e retenção são um só para o banco inteiro: rodam aqui, junto do
+    # único escritor. A retenção não alcança o cache de consultas dos shards;
+    # lá as contagens compactadas saem quando a entrada expira (TTL).
+    stop = threading.Event()
+    jobs = []
+    if rollup.ENABLED:
+        jobs.append(_periodic("rollup", rollup.EVERY, lambda ev: rollup.catch_up(stop=ev), stop))
+    if retention.enabled():
+        jobs.append(_periodic("retention", retention.EVERY, retention.run_once, stop))
+    try:
+        server.serve_forever()
+    finally:
+        # cada lote é uma transação curta: espera o atual antes de fechar o banco
+        stop.set()
+        for t in jobs:
+            t.join()
+        db.close_db()
+        log.info(f"encerrado ({server.rows} linhas em {server.batches} lotes, {server.errors} erros)")
+
+# ---------------------------------------------------------------------------
+# Lado dos shards
+# ---------------------------------------------------------------------------
+
+class RemoteSink:
+    """
+    `sink` de db.PresenceWriter que envia o lote ao processo gravador.
+    Síncrono (roda na thread de gravação do writer); reconecta uma vez se a
+    conexão cair. Um lote reenviado após queda pode ser gravado duas vezes,
+    o que não altera as durações (mesmo status no mesmo instante).
+    """
+
+    def __init__(self, address: Address, authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self._conn: Optional[Connection] = None
+        self._lock = threading.Lock()
+
+    def _request(self, kind: str, payload) -> int:
+        if self._conn is None:
+            self._conn = Client(self.address, authkey=self.authkey)
+        self._conn.send((kind, payload))
+        status, value = self._conn.recv()
+        if status != "ok":
+            raise RuntimeError(f"gravador recusou o lote: {value}")
+        return value
+
+    def __call__(self, batch: List[Tuple]) -> None:
+        with self._lock:
+            try:
+                self._request("rows", batch)
+            except (EOFError, OSError):
+                self.close()
+                self._request("rows", batch)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except OSError:
+                pass
+            self._conn = None
+
+def wait_for_sink(address: Address, authkey: bytes, timeout: float = 60.0) -> None:
+    """Bloqueia até o gravador aceitar conexões (ou estoura TimeoutError)."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with Client(address, authkey=authkey) as conn:
+                conn.send(("ping", None))
+                conn.recv()
+                return
+        except (ConnectionError, FileNotFoundError, EOFError):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"gravador não respondeu em {address} após {timeout:g}s")
+            time.sleep(0.2)
+
+def stop_sink(address: Address, authkey: bytes) -> None:
+    """Pede ao gravador para encerrar (depois que os shards pararam)."""
+    try:
+        with Client(address, authkey=authkey) as conn:
+            conn.send(("stop", None))
+            conn.recv()
+    except (ConnectionError, FileNotFoundError, EOFError):
+        pass
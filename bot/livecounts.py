@@ -0,0 +1,122 @@
+"""
+Contadores ao vivo de status por servidor (online/idle/dnd/offline, sem bots).
+
+Semeados uma vez por servidor (no on_ready, depois do chunk) contando o
+cache de membros; depois disso cada presence_update / entrada / saída de
+membro ajusta o contador em O(1), e o !status_servidor responde na hora sem
+chunk nem varredura. Eventos perdidos (reconexão, membros que chegam ao
+cache por chunk) são corrigidos pela reconciliação periódica, que reconta o
+cache (ver Presence.reconcile_loop).
+"""
+import os
+import time
+from typing import Dict, Optional
+
+import discord
+
+# periodicidade da reconciliação com o cache de membros (0 = desliga)
+LIVE_RECONCILE_SECONDS = float(os.getenv("LIVE_RECONCILE_SECONDS", "300"))
+
+KEYS = ("online", "idle", "dnd", "offline")
+
+def status_key(status) -> str:
+    """discord.Status -> chave do contador (invisible conta como offline)."""
+    key = str(status)
+    return key if key in KEYS else "offline"
+
+class LiveCounters:
+    def __init__(self):
+        self._counts: Dict[int, Dict[str, int]] = {}
+        self._seeded_at: Dict[int, float] = {}  # instante monotônico da última contagem completa
+        self.updates = 0
+        self.reconciles = 0
+        self.drift = 0  # soma das correções feitas pelas reconciliações
+
+    def seed(self, guild: discord.Guild) -> Dict[str, int]:
+        """(Re)conta o servidor a partir do cache de membros. O(membros)."""
+        counts = dict.fromkeys(KEYS, 0)
+        for m in guild.members:
+            if not m.bot:
+                counts[status_key(m.status)] += 1
+        old = self._counts.get(guild.id)
+        if old is not None:
+            self.reconciles += 1
+            self.drift += sum(abs(counts[k] - old[k]) for k in KEYS)
+        self._counts[guild.id] = counts
+        self._seeded_at[guild.id] = time.monotonic()
+        return dict(counts)
+
+    def transition(self, guild_id: int, before, after) -> None:
+        counts = self._counts.get(guild_id)
+        if counts is None:
+            return  # ainda não semeado: a contagem inicial vai enxergar o estado novo
+        b, a = status_key(before), status_key(after)
+        if b != a:
+            counts[b] = max(0, counts[b] - 1)
+            counts[a] += 1
+            self.updates += 1
+
+    def joined(self, member: discord.Member) -> None:
+        counts = self._counts.get(member.guild.id)
+        if counts is not None and not member.bot:
+            counts[status_key(member.status)] += 1
+            self.updates += 1
+
+    def left(self, member: discord.Member) -> None:
+        counts = self._counts.get(member.guild.id)
+        if counts is not None and not member.bot:
+            key = status_key(member.status)
+            counts[key] = max(0, counts[key] - 1)
+            self.updates += 1
+
+    def get(self, guild_id: int) -> Optional[Dict[str, int]]:
+        counts = self._counts.get(guild_id)
+        return dict(counts) if counts is not None else None
+
+    def age(self, guild_id: int) -> Optional[float]:
+        """Segundos desde a última contagem completa do servidor."""
+        t = self._seeded_at.get(guild_id)
+        return time.monotonic() - t if t is not None else None
+
+    def forget(self, guild_id: Optional[int] = None) -> None:
+        if guild_id is None:
+            self._counts.clear()
+            self._seeded_at.clear()
+        else:
+            self._counts.pop(guild_id, None)
+            self._seeded_at.pop(guild_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "guilds": len(self._counts),
+            "updates": self.updates,
+            "reconciles": self.reconciles,
+            "drift": self.drift,
+        }
+
+# Instância única do processo
+_counters = LiveCounters()
+
+def seed(guild: discord.Guild) -> Dict[str, int]:
+    return _counters.seed(guild)
+
+def transition(guild_id: int, before, after) -> None:
+    _counters.transition(guild_id, before, after)
+
+def joined(member: discord.Member) -> None:
+    _counters.joined(member)
+
+def left(member: discord.Member) -> None:
+    _counters.left(member)
+
+def get(guild_id: int) -> Optional[Dict[str, int]]:
+    return _counters.get(guild_id)
+
+def age(guild_id: int) -> Optional[float]:
+    return _counters.age(guild_id)
+
+def forget(guild_id: Optional[int] = None) -> None:
+    _counters.forget(guild_id)
+
+def live_stats() -> dict:
+    return _counters.stats()
@@ -0,0 +1,192 @@
+"""
+Logging assíncrono: o event loop nunca escreve em disco nem no terminal.
+
+Cada módulo usa `logging.getLogger("bot.<categoria>")` (ex.: bot.sampler,
+bot.msg). O handler do processo é um QueueHandler: o registro só é posto
+numa fila limitada (se ela encher, o registro é descartado e contado, em vez
+de bloquear). Uma thread (QueueListener) tira da fila e escreve:
+  - em logs/<processo>.jsonl, uma linha JSON por registro, com rotação por
+    tamanho (LOG_FILE_MAX_MB, LOG_FILE_BACKUPS);
+  - no terminal, no formato de sempre: "[categoria] mensagem".
+Categorias barulhentas têm limite de registros por segundo (LOG_RATE_LIMITS,
+ex.: "msg=5,sampler=20"); o que passar do limite é descartado antes de
+entrar na fila e o total suprimido sai no próximo registro aceito.
+Campos estruturados vão em `extra={"fields": {...}}`.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional
+
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE_MAX_MB = float(os.getenv("LOG_FILE_MAX_MB", "20"))
+LOG_FILE_BACKUPS = int(os.getenv("LOG_FILE_BACKUPS", "5"))
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+LOG_CONSOLE = os.getenv("LOG_CONSOLE", "1") != "0"
+# registros por segundo por categoria ("categoria=n,..."); categoria ausente = sem limite
+LOG_RATE_LIMITS = os.getenv("LOG_RATE_LIMITS", "msg=5,presence_log=20,sampler=20,db-writer=10")
+
+def category(name: str) -> str:
+    """"bot.sampler" -> "sampler"."""
+    return name[4:] if name.startswith("bot.") else name
+
+def parse_rate_limits(spec: str) -> Dict[str, float]:
+    limits: Dict[str, float] = {}
+    for item in spec.split(","):
+        cat, sep, rate = item.strip().partition("=")
+        if sep:
+            try:
+                limits[cat.strip()] = float(rate)
+            except ValueError:
+                pass
+    return limits
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro: ts, level, cat, msg, campos extras e exceção."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        doc = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "cat": category(record.name),
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            doc.update(fields)
+        if record.exc_info:
+            doc["exc"] = self.formatException(record.exc_info)
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+class ConsoleFormatter(logging.Formatter):
+    """"[categoria] mensagem", como os antigos print."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = f"[{category(record.name)}] {record.getMessage()}"
+        if record.exc_info:
+            text += "\n" + self.formatException(record.exc_info)
+        return text
+
+class RateLimitFilter(logging.Filter):
+    """Balde de fichas por categoria (roda na thread de quem loga: só aritmética)."""
+
+    def __init__(self, limits: Dict[str, float]):
+        super().__init__()
+        self.limits = limits
+        self._buckets: Dict[str, list] = {}  # cat -> [fichas, último instante, suprimidos]
+        self._lock = threading.Lock()
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        cat = category(record.name)
+        rate = self.limits.get(cat)
+        if rate is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            b = self._buckets.get(cat)
+            if b is None:
+                b = self._buckets[cat] = [rate, now, 0]
+            b[0] = min(rate, b[0] + (now - b[1]) * rate)  # rajada de até 1s
+            b[1] = now
+            if b[0] < 1.0:
+                b[2] += 1
+                self.suppressed += 1
+                return False
+            b[0] -= 1.0
+            dropped, b[2] = b[2], 0
+        if dropped:
+            fields = dict(getattr(record, "fields", None) or {})
+            fields["suppressed"] = dropped
+            record.fields = fields
+        return True
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que descarta (e conta) quando a fila está cheia."""
+
+    def __init__(self, q: "queue.Queue"):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # a fila é do próprio processo: só fixa a mensagem (os args podem mudar
+        # depois) e deixa a formatação, inclusive de exceções, para a thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[NonBlockingQueueHandler] = None
+_filter: Optional[RateLimitFilter] = None
+
+def setup_logging(process_name: str = "bot") -> None:
+    """
+    Instala o pipeline no logger raiz deste processo (uma vez por processo).
+    `process_name` dá nome ao arquivo (logs/<process_name>.jsonl): cada
+    processo do modo com shards tem o seu, já que a rotação não é segura
+    entre processos.
+    """
+    global _listener, _handler, _filter
+    if _listener is not None:
+        return
+    os.makedirs(LOG_DIR, exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        os.path.join(LOG_DIR, f"{process_name}.jsonl"),
+        maxBytes=int(LOG_FILE_MAX_MB * 1024 * 1024),
+        backupCount=LOG_FILE_BACKUPS,
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(JsonFormatter())
+    outputs = [file_handler]
+    if LOG_CONSOLE:
+        console = logging.StreamHandler()
+        console.setFormatter(ConsoleFormatter())
+        outputs.append(console)
+
+    q: "queue.Queue" = queue.Queue(maxsize=max(1, LOG_QUEUE_MAX))
+    _handler = NonBlockingQueueHandler(q)
+    _filter = RateLimitFilter(parse_rate_limits(LOG_RATE_LIMITS))
+    _handler.addFilter(_filter)
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+    # discord.py loga bastante em DEBUG/INFO; fica no nível do .env, mas pela fila
+    _listener = logging.handlers.QueueListener(q, *outputs, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging() -> None:
+    """
+    Esvazia a fila e para a thread de escrita (chamado no atexit). Depois
+    disso setup_logging pode instalar o pipeline de novo.
+    """
+    global _listener, _handler, _filter
+    if _listener is None:
+        return
+    _listener.stop()
+    for h in _listener.handlers:
+        h.close()
+    logging.getLogger().removeHandler(_handler)
+    atexit.unregister(stop_logging)
+    _listener = _handler = _filter = None
+
+def log_stats() -> dict:
+    if _handler is None:
+        return {}
+    return {
+        "queue_depth": _handler.queue.qsize(),
+        "dropped": _handler.dropped,
+        "suppressed": _filter.suppressed if _filter is not None else 0,
+    }
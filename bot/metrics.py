@@ -0,0 +1,242 @@
+"""
+Métricas do processo no formato texto do Prometheus (sem dependências).
+
+Contadores e histogramas são registrados uma vez, no import dos módulos
+que os usam, e atualizados no caminho quente com uma soma sob um lock
+(podem ser tocados das threads de leitura e gravação). O que já existe como
+estatística (writer_stats, chunk_stats, cache_stats...) entra por
+"coletores": funções chamadas só quando alguém lê /metrics.
+
+`serve()` sobe um servidor HTTP mínimo no event loop (GET /metrics) e o
+monitor de atraso do event loop; ligado por METRICS_PORT (ver run.py).
+"""
+import asyncio
+import bisect
+import contextvars
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+PREFIX = "presence_bot_"
+LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.5"))
+
+# comando em execução (definido no before_invoke do bot): rótulo da latência do banco
+current_command: "contextvars.ContextVar[str]" = contextvars.ContextVar("current_command", default="-")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+Labels = Tuple[str, ...]
+# (nome, tipo, ajuda, [(rótulos, valor)])
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0) -> None:
+        key = tuple(str(v) for v in label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(dict(zip(self.labels, k)))} {_fmt_value(v)}" for k, v in items]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *label_values) -> None:
+        key = tuple(str(v) for v in label_values)
+        with self._lock:
+            self._values[key] = float(value)
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = PREFIX + name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # rótulos -> [contagem por balde..., soma, total]
+        self._values: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        key = tuple(str(v) for v in label_values)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def time(self, *label_values) -> "_Timer":
+        return _Timer(self, label_values)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = []
+        for key, row in items:
+            base = dict(zip(self.labels, key))
+            acc = 0.0
+            for bound, n in zip(self.buckets, row):
+                acc += n
+                lines.append(f"{self.name}_bucket{_fmt_labels({**base, 'le': _fmt_value(bound)})} {_fmt_value(acc)}")
+            lines.append(f"{self.name}_bucket{_fmt_labels({**base, 'le': '+Inf'})} {_fmt_value(row[-1])}")
+            lines.append(f"{self.name}_sum{_fmt_labels(base)} {_fmt_value(row[-2])}")
+            lines.append(f"{self.name}_count{_fmt_labels(base)} {_fmt_value(row[-1])}")
+        return lines
+
+class _Timer:
+    """`with hist.time(...):` observa a duração do bloco em segundos."""
+
+    def __init__(self, hist: Histogram, label_values: Tuple):
+        self.hist = hist
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0, *self.label_values)
+        return False
+
+# ---------------------------------------------------------------------------
+# Registro
+# ---------------------------------------------------------------------------
+
+_metrics: Dict[str, object] = {}
+_collectors: List[Callable[[], Iterable[Family]]] = []
+
+def _register(metric):
+    existing = _metrics.get(metric.name)
+    if existing is not None:
+        return existing  # reimport (reload de cog) reaproveita a série
+    _metrics[metric.name] = metric
+    return metric
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+    return _register(Counter(name, help, labels))
+
+def gauge(name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+    return _register(Gauge(name, help, labels))
+
+def histogram(name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help, labels, buckets))
+
+def add_collector(fn: Callable[[], Iterable[Family]]) -> None:
+    if fn not in _collectors:
+        _collectors.append(fn)
+
+def remove_collector(fn: Callable[[], Iterable[Family]]) -> None:
+    if fn in _collectors:
+        _collectors.remove(fn)
+
+def stats_family(prefix: str, stats: dict, help: str, labels: Optional[Dict[str, str]] = None) -> List[Family]:
+    """Transforma um dict de estatísticas (ex.: writer_stats()) em gauges <prefix>_<chave>."""
+    out = []
+    for key, value in stats.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        out.append((f"{prefix}_{key}", "gauge", f"{help}: {key}", [(labels or {}, float(value))]))
+    return out
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in list(_metrics.values()):
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    # coletores podem repetir um nome (ex.: uma família por servidor): junta as amostras
+    families: Dict[str, Family] = {}
+    for fn in list(_collectors):
+        try:
+            for name, kind, help, samples in fn():
+                fam = families.setdefault(PREFIX + name, (PREFIX + name, kind, help, []))
+                fam[3].extend(samples)
+        except Exception as e:
+            lines.append(f"# coletor {getattr(fn, '__name__', fn)} falhou: {type(e).__name__}")
+    for name, kind, help, samples in families.values():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{name}{_fmt_labels(labels)} {_fmt_value(v)}" for labels, v in samples)
+    return "\n".join(lines) + "\n"
+
+# ---------------------------------------------------------------------------
+# Atraso do event loop e servidor HTTP
+# ---------------------------------------------------------------------------
+
+LOOP_LAG = histogram("event_loop_lag_seconds", "Atraso do event loop em acordar de um sleep")
+LOOP_LAG_LAST = gauge("event_loop_lag_last_seconds", "Último atraso medido do event loop")
+
+async def _loop_lag_monitor(interval: float) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - t0 - interval)
+        LOOP_LAG.observe(lag)
+        LOOP_LAG_LAST.set(lag)
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request = await asyncio.wait_for(reader.readline(), 5.0)
+        while (await asyncio.wait_for(reader.readline(), 5.0)) not in (b"\r\n", b"\n", b""):
+            pass  # descarta cabeçalhos
+        parts = request.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] in ("GET", "HEAD") and parts[1].split("?")[0] in ("/metrics", "/"):
+            body = render().encode("utf-8")
+            status, ctype = "200 OK", "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, status, ctype = b"not found\n", "404 Not Found", "text/plain"
+        head = f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+        writer.write(head.encode("latin-1") + (body if parts and parts[0] != "HEAD" else b""))
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+class MetricsServer:
+    def __init__(self, server: asyncio.AbstractServer, lag_task: "asyncio.Task"):
+        self.server = server
+        self.lag_task = lag_task
+
+    async def close(self) -> None:
+        self.lag_task.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+
+async def serve(host: str, port: int) -> MetricsServer:
+    """Sobe GET /metrics em host:port e o monitor de atraso do event loop."""
+    server = await asyncio.start_server(_handle_http, host, port)
+    lag_task = asyncio.get_running_loop().create_task(_loop_lag_monitor(LOOP_LAG_INTERVAL), name="loop-lag")
+    return MetricsServer(server, lag_task)
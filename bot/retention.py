@@ -0,0 +1,196 @@
+"""
+Retenção do presence_log.
+
+1. Compactação: amostras brutas mais velhas que RETENTION_RAW_DAYS viram
+   trechos contínuos em presence_intervals (guild, usuário, início, fim,
+   status) e saem do presence_log. Só a primeira amostra de cada trecho
+   importa para as durações (o status vale até o próximo evento), então
+   status_before/events_between/guild_events dão as mesmas respostas.
+2. Corte definitivo: trechos mais velhos que RETENTION_HARD_DAYS são
+   apagados, exceto o último de cada usuário antes do corte (que ainda
+   define o status vigente no início do período mantido).
+3. PRAGMA incremental_vacuum devolve ao disco as páginas liberadas.
+
+Tudo em lotes pequenos, cada um na sua transação curta; síncrono: rode
+numa thread (`run_once`, chamado pelo cog Retention ou, com shards, pelo
+processo gravador em bot/ingest.py).
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bot import db, rollup
+
+RAW_DAYS = int(os.getenv("RETENTION_RAW_DAYS", "0"))    # 0 = não compacta
+HARD_DAYS = int(os.getenv("RETENTION_HARD_DAYS", "0"))  # 0 = nunca apaga
+BATCH = int(os.getenv("RETENTION_BATCH", "5000"))
+VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "2000"))
+# Periodicidade do job e pausa entre lotes (deixa o escritor respirar)
+EVERY = int(os.getenv("RETENTION_EVERY_SECONDS", "3600"))
+PAUSE = float(os.getenv("RETENTION_PAUSE_SECONDS", "0.05"))
+
+log = logging.getLogger("bot.retention")
+_vacuum_warned = False
+
+def enabled() -> bool:
+    return RAW_DAYS > 0 or HARD_DAYS > 0
+
+Key = Tuple[int, ...]
+
+def compact_cutoff(raw_days: int) -> Optional[int]:
+    """
+    Instante antes do qual o log bruto pode ser compactado. Com o rollup
+    ligado, não passa da primeira linha que ele ainda não consumiu (o rollup
+    lê o presence_log por id).
+    """
+    if raw_days <= 0:
+        return None
+    cutoff = db.now_ts() - raw_days * 86400
+    if rollup.ENABLED:
+        row = db.fetch_one("SELECT value FROM rollup_state WHERE key = 'last_id'")
+        last_id = int(row[0]) if row and row[0] is not None else 0
+        pending = db.fetch_one("SELECT MIN(timestamp) FROM presence_log WHERE id > ?", (last_id,))
+        if pending and pending[0] is not None:
+            cutoff = min(cutoff, pending[0])
+    return cutoff
+
+def compact_batch(cutoff: int, after: Key = (-1, -1, -1, -1, -1), limit: int = 5000) -> Tuple[int, Optional[Key]]:
+    """
+    Compacta até `limit` linhas com timestamp < cutoff, na ordem do índice
+    (guild, usuário, tempo) a partir da chave `after`. Devolve (linhas
+    removidas, chave para o próximo lote ou None se acabou).
+    """
+    with db.write_conn() as conn, conn:
+        rows = conn.execute(
+            "SELECT guild_id, user_id, timestamp, status, id FROM presence_log "
+            "WHERE timestamp < ? AND (guild_id, user_id, timestamp, status, id) > (?, ?, ?, ?, ?) "
+            "ORDER BY guild_id, user_id, timestamp, status, id LIMIT ?",
+            (cutoff, *after, limit),
+        ).fetchall()
+        if not rows:
+            return 0, None
+
+        by_user: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+        for g, u, ts, code, _ in rows:
+            by_user.setdefault((g, u), []).append((ts, code))
+
+        upserts: List[Tuple[int, int, int, int, int]] = []
+        for (g, u), events in by_user.items():
+            # continua o último trecho do usuário se o status for o mesmo
+            last = conn.execute(
+                "SELECT start_ts, end_ts, status FROM presence_intervals "
+                "WHERE guild_id = ? AND user_id = ? ORDER BY start_ts DESC LIMIT 1",
+                (g, u),
+            ).fetchone()
+            cur: Optional[List[int]] = list(last) if last and last[0] <= events[0][0] else None
+            for ts, code in events:
+                if cur is not None and cur[2] == code:
+                    cur[1] = max(cur[1], ts)
+                    continue
+                if cur is not None:
+                    upserts.append((g, u, *cur))
+                cur = [ts, ts, code]
+            upserts.append((g, u, *cur))
+
+        # mesmo início (dois status no mesmo segundo): vale o último, como no log bruto
+        conn.executemany(
+            "INSERT OR REPLACE INTO presence_intervals (guild_id, user_id, start_ts, end_ts, status) "
+            "VALUES (?, ?, ?, ?, ?)",
+            upserts,
+        )
+        conn.executemany("DELETE FROM presence_log WHERE id = ?", [(r[4],) for r in rows])
+        if not rollup.ENABLED:
+            # o rollup lê o log por id: se for religado, precisa refazer a partir dos trechos
+            conn.execute("UPDATE rollup_state SET value = '' WHERE key = 'config'")
+    return len(rows), (tuple(rows[-1]) if len(rows) == limit else None)
+
+def drop_batch(hard_cutoff: int, after: Key = (-1, -1, -1), limit: int = 5000) -> Tuple[int, Optional[Key]]:
+    """
+    Apaga trechos que começaram antes de `hard_cutoff` e já foram sucedidos
+    por outro trecho também antes do corte. Varre até `limit` trechos a
+    partir da chave `after`; devolve (apagados, próxima chave ou None).
+    """
+    with db.write_conn() as conn, conn:
+        keys = conn.execute(
+            "SELECT guild_id, user_id, start_ts FROM presence_intervals "
+            "WHERE (guild_id, user_id, start_ts) > (?, ?, ?) "
+            "ORDER BY guild_id, user_id, start_ts LIMIT ?",
+            (*after, limit),
+        ).fetchall()
+        if not keys:
+            return 0, None
+        doomed = []
+        for i, (g, u, start) in enumerate(keys):
+            if start >= hard_cutoff:
+                continue
+            nxt = keys[i + 1] if i + 1 < len(keys) else None
+            if nxt is not None and nxt[0] == g and nxt[1] == u:
+                following = nxt[2]
+            else:
+                row = conn.execute(
+                    "SELECT MIN(start_ts) FROM presence_intervals "
+                    "WHERE guild_id = ? AND user_id = ? AND start_ts > ?",
+                    (g, u, start),
+                ).fetchone()
+                following = row[0] if row else None
+            if following is not None and following <= hard_cutoff:
+                doomed.append((g, u, start))
+        conn.executemany(
+            "DELETE FROM presence_intervals WHERE guild_id = ? AND user_id = ? AND start_ts = ?",
+            doomed,
+        )
+    return len(doomed), (tuple(keys[-1]) if len(keys) == limit else None)
+
+def incremental_vacuum(pages: int) -> Optional[int]:
+    """Libera até `pages` páginas livres. None se o banco não está em auto_vacuum=INCREMENTAL."""
+    with db.write_conn() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return None
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return before - after
+
+def stats() -> dict:
+    raw = db.fetch_one("SELECT COUNT(*), MIN(timestamp) FROM presence_log")
+    iv = db.fetch_one("SELECT COUNT(*), MIN(start_ts) FROM presence_intervals")
+    return {"raw_rows": raw[0], "raw_oldest": raw[1], "intervals": iv[0], "intervals_oldest": iv[1]}
+
+def _run_batches(fn: Callable, cutoff: int, stop: Optional[threading.Event]) -> int:
+    """Chama fn(cutoff, after=..., limit=...) lote a lote até acabar (ou `stop`)."""
+    total = 0
+    kwargs = {"limit": BATCH}
+    while True:
+        n, key = fn(cutoff, **kwargs)
+        total += n
+        if key is None:
+            return total
+        kwargs["after"] = key
+        if stop is None:
+            time.sleep(PAUSE)
+        elif stop.wait(PAUSE):
+            return total
+
+def run_once(stop: Optional[threading.Event] = None) -> int:
+    """
+    Um ciclo completo: compactação, corte definitivo e incremental_vacuum.
+    Devolve quantas linhas/trechos mudaram (0 = nada a fazer; quem chama
+    limpa o cache de consultas quando > 0). Síncrono: rode numa thread.
+    """
+    global _vacuum_warned
+    compacted = dropped = 0
+    cutoff = compact_cutoff(RAW_DAYS)
+    if cutoff is not None:
+        compacted = _run_batches(compact_batch, cutoff, stop)
+    if HARD_DAYS > 0 and not (stop is not None and stop.is_set()):
+        dropped = _run_batches(drop_batch, db.now_ts() - HARD_DAYS * 86400, stop)
+    if not (compacted or dropped):
+        return 0
+    freed = incremental_vacuum(VACUUM_PAGES)
+    log.info(f"{compacted} linhas compactadas, {dropped} trechos apagados, {freed or 0} páginas liberadas")
+    if freed is None and not _vacuum_warned:
+        _vacuum_warned = True
+        log.warning("banco sem auto_vacuum=INCREMENTAL: rode VACUUM uma vez para o arquivo encolher")
+    return compacted + dropped
@@ -0,0 +1,241 @@
+"""
+Rollup diário do presence_log (tabela presence_daily).
+
+Para cada (guild, usuário, dia local, status) guarda quantos segundos caíram
+dentro e fora da janela útil padrão (WORK_START–WORK_END em WORK_TZ).
+`process_pending` consome o presence_log incrementalmente (marca d'água por
+id) e mantém em rollup_cursor o último evento já consolidado de cada usuário.
+Ao refazer do zero, os trechos já compactados pela retenção
+(presence_intervals) são consumidos antes do log bruto.
+Tudo antes desse cursor está no rollup e não muda mais; as consultas leem os
+dias consolidados e só vão ao log bruto para as bordas e o trecho posterior.
+"""
+import json
+import os
+import threading
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from bot import db, timeline
+from bot.worktime import END_HM, START_HM, TZ, day_bounds, local_date
+
+ENABLED = os.getenv("ROLLUP_ENABLED", "1").strip().lower() not in ("0", "false", "no", "off")
+# Periodicidade e tamanho de lote do rollup diário (presence_daily)
+EVERY = int(os.getenv("ROLLUP_EVERY_SECONDS", "60"))
+BATCH = int(os.getenv("ROLLUP_BATCH", "50000"))
+
+# se a janela mudar no .env, o rollup é refeito do zero
+_CONFIG = f"{TZ}|{START_HM[0]:02d}:{START_HM[1]:02d}|{END_HM[0]:02d}:{END_HM[1]:02d}"
+
+def matches(tz, start_hm: Tuple[int, int], end_hm: Tuple[int, int]) -> bool:
+    """True se a janela pedida é exatamente a janela consolidada no rollup."""
+    return str(tz) == str(TZ) and tuple(start_hm) == START_HM and tuple(end_hm) == END_HM
+
+def _split(acc: Dict[Tuple, List[int]], guild_id: int, user_id: int, code: int, s: int, e: int) -> None:
+    """Distribui o intervalo [s, e) pelos dias locais, separando dentro/fora da janela útil."""
+    d = local_date(s)
+    while True:
+        d0, ws, we, d1 = day_bounds(d)
+        seg_s, seg_e = max(s, d0), min(e, d1)
+        if seg_e > seg_s:
+            inside = max(0, min(seg_e, we) - max(seg_s, ws))
+            slot = acc.setdefault((guild_id, user_id, d.isoformat(), code), [0, 0])
+            slot[0] += inside
+            slot[1] += (seg_e - seg_s) - inside
+        if e <= d1:
+            break
+        d += timedelta(days=1)
+
+def _reset() -> None:
+    with db.write_conn() as conn, conn:
+        conn.execute("DELETE FROM presence_daily")
+        conn.execute("DELETE FROM rollup_cursor")
+        conn.execute("DELETE FROM rollup_state")
+        conn.execute(
+            "INSERT INTO rollup_state (key, value) VALUES ('config', ?), ('last_id', 0), ('intervals_done', 0)",
+            (_CONFIG,),
+        )
+
+def _load_cursors(pairs) -> Dict[Tuple[int, int], Tuple[int, int]]:
+    by_guild: Dict[int, List[int]] = {}
+    for g, u in pairs:
+        by_guild.setdefault(g, []).append(u)
+    out = {}
+    for g, users in by_guild.items():
+        for u, code, ts in db.fetch_all(
+            "SELECT user_id, status, ts FROM rollup_cursor "
+            "WHERE guild_id = ? AND user_id IN (SELECT value FROM json_each(?))",
+            (g, json.dumps(users)),
+        ):
+            out[(g, u)] = (code, ts)
+    return out
+
+def _read_intervals(after: Tuple[int, int, int], max_rows: int) -> List[Tuple[int, int, int, int, int]]:
+    """Próximos trechos compactados após a chave (guild, usuário, início), no formato das linhas do log."""
+    return [
+        (0, g, u, code, ts)
+        for g, u, ts, code in db.fetch_all(
+            "SELECT guild_id, user_id, start_ts, status FROM presence_intervals "
+            "WHERE (guild_id, user_id, start_ts) > (?, ?, ?) "
+            "ORDER BY guild_id, user_id, start_ts LIMIT ?",
+            (*after, max_rows),
+        )
+    ]
+
+def process_pending(max_rows: int = 50000) -> int:
+    """
+    Consolida até `max_rows` linhas novas do presence_log. Devolve quantas
+    linhas foram consumidas (0 = em dia; max_rows enquanto reprocessa o
+    histórico compactado). Síncrono: rode numa thread.
+    """
+    state = dict(db.fetch_all("SELECT key, value FROM rollup_state"))
+    if state.get("config") != _CONFIG:
+        _reset()
+        state = {"last_id": 0, "intervals_done": 0}
+    last_id = int(state.get("last_id") or 0)
+
+    replay_key: Optional[Tuple[int, int, int]] = None
+    # sem a chave (rollup anterior à retenção) não há histórico a reprocessar
+    if not int(state.get("intervals_done", 1)):
+        # reconstrução: primeiro o histórico compactado, usuário por usuário
+        replay_key = tuple(json.loads(state.get("intervals_key") or "[-1, -1, -1]"))
+        rows = _read_intervals(replay_key, max_rows)
+    else:
+        rows = db.fetch_all(
+            "SELECT id, guild_id, user_id, status, timestamp FROM presence_log "
+            "WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, max_rows),
+        )
+    if not rows and replay_key is None:
+        return 0
+
+    touched = {(g, u) for _, g, u, _, _ in rows}
+    cursors = _load_cursors(touched)
+    acc: Dict[Tuple, List[int]] = {}
+    for _, g, u, code, ts in rows:
+        key_code = db.STATUS_CODES[db.STATUS_KEY[code]]
+        cur = cursors.get((g, u))
+        if cur is None:
+            cursors[(g, u)] = (key_code, ts)
+            continue
+        cur_code, cur_ts = cur
+        if ts > cur_ts:
+            _split(acc, g, u, cur_code, cur_ts, ts)
+        # evento fora de ordem vale a partir do cursor (duração zero antes dele)
+        cursors[(g, u)] = (key_code, max(ts, cur_ts))
+
+    with db.write_conn() as conn, conn:
+        conn.executemany(
+            "INSERT INTO presence_daily (guild_id, user_id, day, status, inside_s, outside_s) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(guild_id, user_id, day, status) DO UPDATE SET "
+            "inside_s = inside_s + excluded.inside_s, outside_s = outside_s + excluded.outside_s",
+            [(*k, v[0], v[1]) for k, v in acc.items()],
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO rollup_cursor (guild_id, user_id, status, ts) VALUES (?, ?, ?, ?)",
+            [(g, u, *cursors[(g, u)]) for g, u in touched],
+        )
+        if replay_key is None:
+            conn.execute("UPDATE rollup_state SET value = ? WHERE key = 'last_id'", (rows[-1][0],))
+        elif len(rows) < max_rows:
+            conn.execute("INSERT OR REPLACE INTO rollup_state (key, value) VALUES ('intervals_done', 1)")
+        else:
+            _, g, u, _, ts = rows[-1]
+            conn.execute(
+                "INSERT OR REPLACE INTO rollup_state (key, value) VALUES ('intervals_key', ?)",
+                (json.dumps([g, u, ts]),),
+            )
+    # durante a reconstrução devolve max_rows para quem chama seguir para o log bruto
+    return len(rows) if replay_key is None else max_rows
+
+def catch_up(batch: int = BATCH, stop: Optional[threading.Event] = None) -> int:
+    """
+    Chama process_pending lote a lote até alcançar o fim do log (ou até
+    `stop` ser sinalizado). Devolve as linhas consumidas. Síncrono.
+    """
+    total = 0
+    while stop is None or not stop.is_set():
+        n = process_pending(batch)
+        total += n
+        if n < batch:
+            break
+    return total
+
+def daily_business_durations(
+    guild_id: int, user_id: int, start_ts: float, end_ts: float
+) -> Dict[date, Dict[str, float]]:
+    """
+    Segundos por status dentro da janela útil de cada dia local em
+    [start_ts, end_ts] (todos os dias da semana; quem chama filtra os úteis).
+    Dias cobertos pelo cursor vêm de presence_daily; dias cortados pelo
+    início ou pelo fim do intervalo e o trecho após o cursor vêm do log
+    bruto, lidos só nesses dias.
+    """
+    out: Dict[date, Dict[str, float]] = {}
+    if end_ts <= start_ts:
+        return out
+    first, last = local_date(start_ts), local_date(end_ts)
+
+    frontier: Optional[Tuple[int, int]] = None
+    daily: Dict[str, Dict[str, float]] = {}
+    with db.read_conn() as conn:
+        conn.execute("BEGIN")  # cursor e linhas diárias do mesmo snapshot
+        try:
+            cfg = conn.execute("SELECT value FROM rollup_state WHERE key = 'config'").fetchone()
+            if cfg and cfg[0] == _CONFIG:
+                frontier = conn.execute(
+                    "SELECT status, ts FROM rollup_cursor WHERE guild_id = ? AND user_id = ?",
+                    (guild_id, user_id),
+                ).fetchone()
+            if frontier:
+                for day, code, inside in conn.execute(
+                    "SELECT day, status, inside_s FROM presence_daily "
+                    "WHERE guild_id = ? AND user_id = ? AND day >= ? AND day <= ?",
+                    (guild_id, user_id, first.isoformat(), last.isoformat()),
+                ):
+                    key = db.STATUS_KEY[code]
+                    slot = daily.setdefault(day, timeline.empty_durations())
+                    slot[key] += inside
+        finally:
+            conn.execute("COMMIT")
+
+    pre: List[Tuple[date, float, float]] = []   # janelas resolvidas só pelo bruto
+    post: List[Tuple[date, float, float]] = []  # trechos depois do cursor
+    d = first
+    while d <= last:
+        _, ws, we, _ = day_bounds(d)
+        a, b = max(start_ts, ws), min(end_ts, we)
+        if b <= a:
+            out[d] = timeline.empty_durations()
+        elif frontier and a == ws and max(ws, min(frontier[1], we)) <= b:
+            g = max(ws, min(frontier[1], we))
+            durs = dict(daily.get(d.isoformat(), timeline.empty_durations()))
+            # antes do primeiro evento do usuário o status é offline
+            durs["offline"] = max(0.0, (g - ws) - durs["online"] - durs["idle"] - durs["dnd"])
+            out[d] = durs
+            if b > g:
+                post.append((d, g, b))
+        else:
+            pre.append((d, a, b))
+        d += timedelta(days=1)
+
+    # só os dias que faltam no rollup vão ao bruto: cada sequência de dias
+    # seguidos vira uma consulta (tipicamente o primeiro dia, cortado pelo
+    # início, e o último, que termina antes do cursor), nunca o período todo
+    run: List[Tuple[date, float, float]] = []
+    for i, item in enumerate(pre):
+        run.append(item)
+        if i + 1 < len(pre) and pre[i + 1][0] == item[0] + timedelta(days=1):
+            continue
+        windows = [(a, b) for _, a, b in run]
+        for (d, _, _), durs in zip(run, timeline.durations_for_windows(guild_id, user_id, windows)):
+            out[d] = durs
+        run = []
+    if post:
+        events = db.events_between(guild_id, user_id, frontier[1], post[-1][2])
+        initial = db.STATUS_KEY[frontier[0]]
+        for (d, _, _), durs in zip(post, timeline.sweep_windows(initial, events, [(a, b) for _, a, b in post])):
+            for k, v in durs.items():
+                out[d][k] += v
+    return out
@@ -0,0 +1,71 @@
+"""
+Cálculo de tempo por status a partir dos eventos do presence_log.
+
+Tudo aqui trabalha em epoch UTC (segundos) e não depende do Discord, então
+pode ser usado pelos cogs e por scripts. O status vigente num instante é o do
+último evento anterior (ou "offline" se não houver nenhum).
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from bot import db
+
+STATUS_KEYS = ("online", "idle", "dnd", "offline")
+
+def empty_durations() -> Dict[str, float]:
+    return {k: 0.0 for k in STATUS_KEYS}
+
+def sweep_windows(
+    initial_status: Optional[str],
+    events: Sequence[Tuple[str, float]],
+    windows: Sequence[Tuple[float, float]],
+) -> List[Dict[str, float]]:
+    """
+    Uma única passada pelos eventos (status, ts) em ordem crescente,
+    devolvendo os segundos por status de cada janela [a, b].
+    As janelas devem estar ordenadas e não se sobrepor. `initial_status`
+    é o status vigente antes do primeiro evento.
+    """
+    status = initial_status or "offline"
+    out: List[Dict[str, float]] = []
+    i, n = 0, len(events)
+    for a, b in windows:
+        durs = empty_durations()
+        if b <= a:
+            out.append(durs)
+            continue
+        # eventos até o início da janela só mudam o status vigente
+        while i < n and events[i][1] <= a:
+            status = events[i][0]
+            i += 1
+        prev = a
+        while i < n and events[i][1] < b:
+            st, t = events[i]
+            durs[status] += t - prev
+            status, prev = st, t
+            i += 1
+        durs[status] += b - prev
+        out.append(durs)
+    return out
+
+def durations_between(guild_id: int, user_id: int, start_ts: float, end_ts: float) -> Dict[str, float]:
+    """Segundos por status em [start_ts, end_ts], direto dos eventos brutos."""
+    if end_ts <= start_ts:
+        return empty_durations()
+    initial = db.status_before(guild_id, user_id, start_ts)
+    events = db.events_between(guild_id, user_id, start_ts, end_ts)
+    return sweep_windows(initial, events, [(start_ts, end_ts)])[0]
+
+def durations_for_windows(
+    guild_id: int, user_id: int, windows: Sequence[Tuple[float, float]]
+) -> List[Dict[str, float]]:
+    """
+    Durações de várias janelas ordenadas (ex.: um dia útil por janela) com
+    uma única consulta sobre o período todo e uma única varredura dos eventos.
+    """
+    if not windows:
+        return []
+    rows = db.guild_events(guild_id, [user_id], windows[0][0], windows[-1][1])
+    # primeira linha = status vigente no início do período
+    initial = db.STATUS_KEY[rows[0][1]]
+    events = [(db.STATUS_KEY[code], ts) for _, code, ts in rows[1:]]
+    return sweep_windows(initial, events, windows)
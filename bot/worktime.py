@@ -0,0 +1,135 @@
+"""
+Expediente configurado no .env (WORK_TZ, WORK_DAYS, WORK_START, WORK_END):
+fuso, dia local e limites de cada dia, e a sobreposição de um intervalo com
+a janela útil. Sem dependências do discord.py nem do banco; o rollup, os
+cogs e os benchmarks leem o fuso daqui.
+
+`business_overlap_seconds` tem custo constante por intervalo: só o primeiro
+e o último dia local são recortados; os dias inteiros do meio são contados
+por aritmética de semanas, com correção pelos (raros) dias úteis em que o
+horário muda dentro da janela. Conta segundos reais (epoch), então um dia
+com mudança de horário no expediente dura uma hora a mais ou a menos.
+"""
+import os
+from bisect import bisect_left
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import List, Tuple
+
+# Fuso padrão: America/Sao_Paulo. Em Windows, pode ser preciso `pip install tzdata`.
+WORK_TZ = os.getenv("WORK_TZ", "America/Sao_Paulo")
+WORK_DAYS = os.getenv("WORK_DAYS", "0,1,2,3,4")  # 0=segunda ... 6=domingo
+WORK_START = os.getenv("WORK_START", "08:00")
+WORK_END = os.getenv("WORK_END", "18:00")
+
+def parse_hhmm(s: str) -> Tuple[int, int]:
+    s = s.strip().strip('"').strip("'")
+    hh, mm = s.split(":")
+    return int(hh), int(mm)
+
+try:
+    from zoneinfo import ZoneInfo
+    TZ = ZoneInfo(WORK_TZ)
+except Exception:
+    # fallback (Windows sem tzdata): usa offset simples, padrão -03
+    try:
+        TZ = timezone(timedelta(hours=int(os.getenv("WORK_TZ_OFFSET", "-3"))))
+    except Exception:
+        TZ = timezone.utc
+
+BIZ_DAYS = {int(x) for x in WORK_DAYS.split(",") if x.strip() != ""}
+START_HM = parse_hhmm(WORK_START)
+END_HM = parse_hhmm(WORK_END)
+
+# Segundos úteis de um dia "normal" (sem mudança de horário dentro da janela)
+_NOMINAL = max(0, ((END_HM[0] * 60 + END_HM[1]) - (START_HM[0] * 60 + START_HM[1])) * 60)
+
+def local_date(ts: float) -> date:
+    """Dia local (WORK_TZ) de um instante em epoch."""
+    return datetime.fromtimestamp(ts, TZ).date()
+
+@lru_cache(maxsize=8192)
+def day_bounds(d: date) -> Tuple[int, int, int, int]:
+    """(meia-noite, início útil, fim útil, meia-noite seguinte) do dia local, em epoch."""
+    nd = d + timedelta(days=1)
+    return (
+        int(datetime(d.year, d.month, d.day, tzinfo=TZ).timestamp()),
+        int(datetime(d.year, d.month, d.day, *START_HM, tzinfo=TZ).timestamp()),
+        int(datetime(d.year, d.month, d.day, *END_HM, tzinfo=TZ).timestamp()),
+        int(datetime(nd.year, nd.month, nd.day, tzinfo=TZ).timestamp()),
+    )
+
+def _weekday(ordinal: int) -> int:
+    # date.fromordinal(1) é uma segunda-feira
+    return (ordinal - 1) % 7
+
+@lru_cache(maxsize=None)
+def _irregular_days(year: int) -> Tuple[Tuple[int, ...], Tuple[float, ...]]:
+    """
+    Dias úteis do ano cuja janela não dura _NOMINAL (mudança de horário no
+    meio do expediente): ordinais ordenados e somas acumuladas da diferença.
+    """
+    ords: List[int] = []
+    acc: List[float] = []
+    total = 0.0
+    for o in range(date(year, 1, 1).toordinal(), date(year + 1, 1, 1).toordinal()):
+        if _weekday(o) not in BIZ_DAYS:
+            continue
+        _, ws, we, _ = day_bounds(date.fromordinal(o))
+        diff = max(0.0, we - ws) - _NOMINAL
+        if diff:
+            total += diff
+            ords.append(o)
+            acc.append(total)
+    return tuple(ords), tuple(acc)
+
+def _biz_days(o1: int, o2: int) -> int:
+    """Quantos dias úteis há nos ordinais [o1, o2): semanas inteiras + resto (< 7 dias)."""
+    if o2 <= o1:
+        return 0
+    weeks, rem = divmod(o2 - o1, 7)
+    count = weeks * len(BIZ_DAYS)
+    base = o1 + weeks * 7
+    for i in range(rem):
+        if _weekday(base + i) in BIZ_DAYS:
+            count += 1
+    return count
+
+def _dst_correction(o1: int, o2: int) -> float:
+    """Soma de (duração real - _NOMINAL) dos dias úteis irregulares em [o1, o2)."""
+    if o2 <= o1:
+        return 0.0
+    total = 0.0
+    for year in range(date.fromordinal(o1).year, date.fromordinal(o2 - 1).year + 1):
+        ords, acc = _irregular_days(year)
+        if not ords:
+            continue
+        i = bisect_left(ords, o1)
+        j = bisect_left(ords, o2)
+        if j > i:
+            total += acc[j - 1] - (acc[i - 1] if i else 0.0)
+    return total
+
+def _day_overlap(d: date, a: float, b: float) -> float:
+    if d.weekday() not in BIZ_DAYS:
+        return 0.0
+    _, ws, we, _ = day_bounds(d)
+    return max(0.0, min(b, we) - max(a, ws))
+
+def business_overlap_seconds(start_utc: datetime, end_utc: datetime) -> float:
+    """Quantos segundos de [start_utc, end_utc] caem em dias/horários úteis."""
+    if end_utc <= start_utc:
+        return 0.0
+
+    s, e = start_utc.timestamp(), end_utc.timestamp()
+    d1 = start_utc.astimezone(TZ).date()
+    d2 = end_utc.astimezone(TZ).date()
+
+    if d1 == d2:
+        return _day_overlap(d1, s, e)
+
+    total = _day_overlap(d1, s, e) + _day_overlap(d2, s, e)
+    o1, o2 = d1.toordinal(), d2.toordinal()
+    if o2 - o1 > 1:
+        total += _biz_days(o1 + 1, o2) * _NOMINAL + _dst_correction(o1 + 1, o2)
+    return total
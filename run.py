@@ -1,5 +1,10 @@
 import os
 import asyncio
+import logging
+import math
+import multiprocessing
+import time
+from typing import List, Optional
 import discord
 from discord.ext import commands
 from discord.ext.commands import when_mentioned_or
@@ -8,7 +13,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from bot.config import Config
-from bot import db
+from bot import cache, chunking, db, ingest, livecounts, logs, metrics
 
 # cogs
 from bot.cogs.sampler import Sampler
@@ -18,9 +23,18 @@ from bot.cogs.reports import Reports
 from bot.cogs.basic import Basic
 from bot.cogs.presence import Presence
 from bot.cogs.stats import Stats
+from bot.cogs.rollup import Rollup
+from bot.cogs.retention import Retention
 
+log = logging.getLogger("bot.run")
+log_msg = logging.getLogger("bot.msg")
+log_cmd = logging.getLogger("bot.cmd-err")
+log_shards = logging.getLogger("bot.shards")
 
-def build_bot(config: Config) -> commands.Bot:
+
+def build_bot(
+    config: Config, shard_ids: Optional[List[int]] = None, shard_count: Optional[int] = None
+) -> commands.Bot:
     intents = discord.Intents.default()
     intents.message_content = True
     intents.members = True
@@ -28,25 +42,37 @@ def build_bot(config: Config) -> commands.Bot:
 
     member_cache_flags = discord.MemberCacheFlags.all()
 
-    bot = commands.Bot(
+    # modo com shards: este processo conecta só os shards de `shard_ids`
+    shard_kwargs = {} if shard_ids is None else {"shard_ids": shard_ids, "shard_count": shard_count}
+    bot_cls = commands.Bot if shard_ids is None else commands.AutoShardedBot
+
+    bot = bot_cls(
         command_prefix=when_mentioned_or(config.prefix),  # aceita "!" e @BotStatus
         intents=intents,
         member_cache_flags=member_cache_flags,
-        chunk_guilds_at_startup=True,
+        # lazy: o on_ready não espera o download dos membros (ver chunking.StartupChunker)
+        chunk_guilds_at_startup=config.startup_chunking == "eager",
+        **shard_kwargs,
     )
 
 
     @bot.event
     async def on_ready():
-        print(f"✅ Logado como {bot.user} (id: {bot.user.id})")
-        print(f"Prefixo: {config.prefix} | DB: {config.database_file}")
+        log.info(f"✅ Logado como {bot.user} (id: {bot.user.id})")
+        log.info(f"Prefixo: {config.prefix} | DB: {config.database_file}")
 
-        # garante membros no cache (bom para presença)
-        for g in bot.guilds:
-            try:
-                await g.chunk(cache=True)
-            except Exception as e:
-                print(f"[on_ready] chunk {g.id} falhou: {e}")
+        # nova sessão no gateway: reavalia o cache de cada servidor e só faz
+        # chunk onde a biblioteca ainda não carregou todos os membros
+        chunking.invalidate()
+        if config.startup_chunking == "eager":
+            for g in bot.guilds:
+                await chunking.ensure_chunked(g)
+                livecounts.seed(g)  # contadores ao vivo do !status_servidor
+            chunking.mark_all_chunked()
+        else:
+            # em segundo plano, por prioridade e com concorrência limitada;
+            # cada servidor carregado semeia seus contadores ao vivo
+            chunking.start_startup(bot.guilds, livecounts.seed)
 
         # status do bot
         await bot.change_presence(
@@ -56,28 +82,53 @@ def build_bot(config: Config) -> commands.Bot:
             ),
             status=discord.Status.online,
         )
+        chunking.mark_ready()
+        log.info(
+            f"pronto em {chunking.chunk_stats()['ready_s']:.1f}s com {len(bot.guilds)} servidor(es) "
+            f"(chunk {config.startup_chunking})"
+        )
 
         # mostra canais liberados encontrados
         allowed = {
             int(x) for x in os.getenv("ALLOWED_CHANNELS", "").split(",")
             if x.strip().isdigit()
         }
-        print("ALLOWED_CHANNELS ->", allowed)
+        log.info(f"ALLOWED_CHANNELS -> {allowed}")
         for g in bot.guilds:
             hit  = [cid for cid in allowed if g.get_channel(cid)]
             miss = [cid for cid in allowed if not g.get_channel(cid)]
-            print(f"- {g.name} ({g.id}) | canais OK: {hit} | NÃO ENCONTRADOS: {miss}")
+            log.info(f"- {g.name} ({g.id}) | canais OK: {hit} | NÃO ENCONTRADOS: {miss}")
 
-    # DEBUG: loga tudo que o bot enxerga e erros de comando
+    @bot.before_invoke
+    async def label_command(ctx: commands.Context):
+        # rótulo das métricas de latência do banco (db.arun) durante o comando
+        metrics.current_command.set(ctx.command.qualified_name)
+
+    @bot.event
+    async def on_guild_remove(guild: discord.Guild):
+        chunking.invalidate(guild.id)
+        livecounts.forget(guild.id)
+        cache.invalidate(guild.id)
+
+    # DEBUG: loga tudo que o bot enxerga (categoria "msg", limitada em LOG_RATE_LIMITS) e erros de comando
     @bot.event
     async def on_message(message: discord.Message):
-        where = f"{message.guild.name if message.guild else 'DM'} | #{getattr(message.channel,'name','?')} ({message.channel.id})"
-        print(f"[msg] {where} :: {message.author} -> {message.content!r}")
+        if log_msg.isEnabledFor(logging.INFO):
+            guild = message.guild.name if message.guild else "DM"
+            channel = getattr(message.channel, "name", "?")
+            log_msg.info(
+                "%s | #%s (%s) :: %s -> %r", guild, channel, message.channel.id, message.author, message.content,
+                extra={"fields": {
+                    "guild_id": message.guild.id if message.guild else None,
+                    "channel_id": message.channel.id,
+                    "author_id": message.author.id,
+                }},
+            )
         await bot.process_commands(message)
 
     @bot.event
     async def on_command_error(ctx, error):
-        print("[cmd-err]", type(error).__name__, error)
+        log_cmd.warning(f"{type(error).__name__} {error}", extra={"fields": {"command": str(ctx.command)}})
         try:
             await ctx.reply(f"❌ {type(error).__name__}: {error}")
         except Exception:
@@ -86,11 +137,66 @@ def build_bot(config: Config) -> commands.Bot:
     return bot
 
 
-async def amain():
+def _runtime_collector(bot: commands.Bot):
+    """Coletor de /metrics com as estatísticas que os módulos já mantêm."""
+    def collect():
+        fams = []
+        fams += metrics.stats_family("writer", db.writer_stats(), "Escritor de presença")
+        fams += metrics.stats_family("chunk", chunking.chunk_stats(), "Coordenador de chunk")
+        fams += metrics.stats_family("query_cache", cache.cache_stats(), "Cache de consultas")
+        fams += metrics.stats_family("livecounts", livecounts.live_stats(), "Contadores ao vivo")
+        fams += metrics.stats_family("logs", logs.log_stats(), "Fila de logs")
+        presence = bot.get_cog("Presence")
+        if presence is not None:
+            fams += metrics.stats_family("activity", presence.activity.stats(), "Rastreador de atividade")
+        sampler = bot.get_cog("Sampler")
+        if sampler is not None:
+            for gid, s in sampler.lag_stats().items():
+                fams += metrics.stats_family("sampler", {
+                    "interval_seconds": s["interval"],
+                    "churn": s["churn"],
+                    "last_lag_seconds": s["last_lag"],
+                    "max_lag_seconds": s["max_lag"],
+                }, "Agenda do sampler por servidor", {"guild": str(gid)})
+        if math.isfinite(bot.latency):
+            fams.append(("gateway_latency_seconds", "gauge", "Latência do heartbeat do gateway", [({}, bot.latency)]))
+        return fams
+    return collect
+
+
+def _db_options(config: Config) -> dict:
+    return dict(
+        journal_mode=config.db_journal_mode,
+        synchronous=config.db_synchronous,
+        mmap_size=config.db_mmap_size,
+        cache_size=config.db_cache_size,
+        busy_timeout_ms=config.db_busy_timeout_ms,
+        readers=config.db_readers,
+        query_timeout=config.db_query_timeout,
+    )
+
+
+async def amain(
+    shard_ids: Optional[List[int]] = None,
+    shard_count: Optional[int] = None,
+    sink_address: Optional[ingest.Address] = None,
+    authkey: Optional[bytes] = None,
+):
     config = Config.from_env()
-    db.init_db(config.database_file)
+    # com shards, quem grava e migra é o processo gravador: aqui só leitura
+    db.init_db(config.database_file, read_only=sink_address is not None, **_db_options(config))
 
-    bot = build_bot(config)
+    bot = build_bot(config, shard_ids, shard_count)
+    # com shards, o lote vai para o processo gravador em vez do SQLite local
+    sink = ingest.RemoteSink(sink_address, authkey) if sink_address is not None else None
+    db.start_writer(
+        batch_size=config.writer_batch_size,
+        flush_interval=config.writer_flush_seconds,
+        max_queue=config.writer_max_queue,
+        sink=sink,
+    )
+    # cada lote gravado suja o cache de consultas dos servidores envolvidos
+    db.add_write_listener(cache.on_presence_written)
 
     # add_cog: na sua versão do discord.py provavelmente é **async** → use await
     await bot.add_cog(Basic(bot, config))
@@ -100,12 +206,106 @@ async def amain():
     await bot.add_cog(Reports(bot, config))
     await bot.add_cog(WorkCheck(bot, config))
     await bot.add_cog(Sampler(bot, config))
+    if sink_address is None:
+        # com shards, rollup e retenção rodam no processo gravador (ingest.run_sink)
+        await bot.add_cog(Rollup(bot, config))
+        await bot.add_cog(Retention(bot, config))
+
+    metrics_server = None
+    if config.metrics_port > 0:
+        port = config.metrics_port + (shard_ids[0] if shard_ids else 0)
+        metrics.add_collector(_runtime_collector(bot))
+        metrics_server = await metrics.serve(config.metrics_host, port)
+        log.info(f"métricas em http://{config.metrics_host}:{port}/metrics")
 
-    await bot.start(config.token)
+    try:
+        await bot.start(config.token)
+    finally:
+        if metrics_server is not None:
+            await metrics_server.close()
+        if not bot.is_closed():
+            await bot.close()
+        # grava o que ainda estiver na fila antes de sair
+        await db.stop_writer()
+        if sink is not None:
+            sink.close()
+        db.close_db()
+
+
+def shard_main(shard_ids: List[int], shard_count: int, sink_address: ingest.Address, authkey: bytes):
+    """Ponto de entrada de um processo de shard (multiprocessing)."""
+    logs.setup_logging(f"shards-{shard_ids[0]}-{shard_ids[-1]}")
+    try:
+        asyncio.run(amain(shard_ids, shard_count, sink_address, authkey))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_sharded(config: Config):
+    """
+    Supervisor do modo com shards: sobe o processo gravador, espera ele
+    aceitar conexões e sobe SHARD_PROCESSES processos, cada um com uma faixa
+    contígua dos SHARD_COUNT shards. Shard que cair é reiniciado (com espera
+    crescente); no Ctrl+C os shards descarregam as filas e só então o
+    gravador é encerrado.
+    """
+    procs_n = max(1, config.shard_processes)
+    total = max(config.shard_count or procs_n, procs_n)
+    groups = [list(range(total))[i * total // procs_n:(i + 1) * total // procs_n] for i in range(procs_n)]
+
+    ctx = multiprocessing.get_context("spawn")
+    authkey = os.urandom(32)
+    address = ingest.parse_address(config.ingest_address)
+
+    sink = ctx.Process(
+        target=ingest.run_sink,
+        args=(address, authkey, config.database_file, _db_options(config)),
+        name="presence-sink",
+    )
+    sink.start()
+    ingest.wait_for_sink(address, authkey)
+
+    def spawn(ids: List[int]):
+        p = ctx.Process(target=shard_main, args=(ids, total, address, authkey), name=f"shards-{ids[0]}-{ids[-1]}")
+        p.start()
+        log_shards.info(f"processo {p.pid} com shards {ids[0]}–{ids[-1]} de {total}")
+        return p
+
+    procs = [spawn(ids) for ids in groups]
+    backoff = [5.0] * procs_n
+    try:
+        while True:
+            time.sleep(5)
+            if not sink.is_alive():
+                log_shards.error(f"gravador saiu (código {sink.exitcode}); encerrando")
+                break
+            for i, p in enumerate(procs):
+                if p.is_alive():
+                    continue
+                log_shards.error(f"processo dos shards {groups[i]} saiu (código {p.exitcode}); reiniciando em {backoff[i]:g}s")
+                time.sleep(backoff[i])
+                backoff[i] = min(backoff[i] * 2, 300.0)
+                procs[i] = spawn(groups[i])
+    except KeyboardInterrupt:
+        log_shards.info("Encerrando shards...")
+    finally:
+        for p in procs:
+            p.join(timeout=30)
+            if p.is_alive():
+                p.terminate()
+        ingest.stop_sink(address, authkey)
+        sink.join(timeout=30)
+        if sink.is_alive():
+            sink.terminate()
 
 
 if __name__ == "__main__":
+    config = Config.from_env()
+    logs.setup_logging("supervisor" if config.shard_processes > 1 else "bot")
     try:
-        asyncio.run(amain())
+        if config.shard_processes > 1:
+            run_sharded(config)
+        else:
+            asyncio.run(amain())
     except KeyboardInterrupt:
-        print("\nEncerrando...")
+        log.info("Encerrando...")
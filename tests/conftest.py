@@ -0,0 +1,14 @@
+import pytest
+
+from bot import cache, db
+
+
+@pytest.fixture
+def tmp_db(tmp_path):
+    """Banco novo (schema + migrações) num diretório temporário; fechado no fim do teste."""
+    path = str(tmp_path / "presence.db")
+    db.init_db(path, readers=2)
+    cache.invalidate()
+    yield path
+    cache.invalidate()
+    db.close_db()
@@ -0,0 +1,136 @@
+"""
+worktime.business_overlap_seconds (fórmula fechada) contra o laço dia a dia
+que ela substituiu, com intervalos aleatórios (semente fixa).
+"""
+import random
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from bot import worktime
+
+
+def _configure(monkeypatch, tz, start, end, days=(0, 1, 2, 3, 4)):
+    sh, sm = worktime.parse_hhmm(start)
+    eh, em = worktime.parse_hhmm(end)
+    monkeypatch.setattr(worktime, "TZ", ZoneInfo(tz))
+    monkeypatch.setattr(worktime, "BIZ_DAYS", set(days))
+    monkeypatch.setattr(worktime, "START_HM", (sh, sm))
+    monkeypatch.setattr(worktime, "END_HM", (eh, em))
+    monkeypatch.setattr(worktime, "_NOMINAL", max(0, ((eh * 60 + em) - (sh * 60 + sm)) * 60))
+    worktime.day_bounds.cache_clear()
+    worktime._irregular_days.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def _reset_caches():
+    yield
+    worktime.day_bounds.cache_clear()
+    worktime._irregular_days.cache_clear()
+
+
+def _baseline(start_utc, end_utc, wall_clock):
+    """
+    O laço antigo de duration.py. Com wall_clock=True subtrai datetimes
+    locais como antes (horário de parede); com False subtrai em epoch, que é
+    o que a versão nova promete em dias com mudança de horário no expediente.
+    """
+    tz = worktime.TZ
+    (sh, sm), (eh, em) = worktime.START_HM, worktime.END_HM
+    start_local = start_utc.astimezone(tz)
+    end_local = end_utc.astimezone(tz)
+    total = 0.0
+    cur = start_local
+    while cur < end_local:
+        day_start = cur.replace(hour=sh, minute=sm, second=0, microsecond=0)
+        day_end = cur.replace(hour=eh, minute=em, second=0, microsecond=0)
+        if cur.weekday() in worktime.BIZ_DAYS:
+            if wall_clock:
+                seg_ini = max(cur, day_start)
+                seg_fim = min(end_local, day_end)
+                if seg_fim > seg_ini:
+                    total += (seg_fim - seg_ini).total_seconds()
+            else:
+                seg_ini = max(cur.timestamp(), day_start.timestamp())
+                seg_fim = min(end_local.timestamp(), day_end.timestamp())
+                if seg_fim > seg_ini:
+                    total += seg_fim - seg_ini
+        nxt = (cur + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        if nxt <= cur:
+            nxt = cur + timedelta(hours=24)
+        cur = nxt
+    return total
+
+
+def _utc(tz, *args):
+    return datetime(*args, tzinfo=ZoneInfo(tz)).astimezone(timezone.utc)
+
+
+def _random_ranges(rng, lo, hi, n):
+    """Intervalos curtos (cruzam meia-noite), de algumas semanas e de meses."""
+    lo_ts, hi_ts = lo.timestamp(), hi.timestamp()
+    for _ in range(n):
+        a = rng.uniform(lo_ts, hi_ts)
+        span = rng.choice((6 * 3600, 30 * 3600, 9 * 86400, 75 * 86400))
+        b = a + rng.uniform(0, span)
+        yield (datetime.fromtimestamp(a, timezone.utc), datetime.fromtimestamp(b, timezone.utc))
+
+
+def test_random_ranges_match_baseline(monkeypatch):
+    # Sao_Paulo até 2019 mudava o horário à meia-noite (fora do expediente)
+    _configure(monkeypatch, "America/Sao_Paulo", "08:00", "18:00")
+    rng = random.Random(20240509)
+    lo = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    hi = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for a, b in _random_ranges(rng, lo, hi, 2000):
+        assert worktime.business_overlap_seconds(a, b) == pytest.approx(
+            _baseline(a, b, wall_clock=True), abs=1e-6), (a, b)
+
+
+def test_dst_inside_window_counts_real_seconds(monkeypatch):
+    # janela 01:00-05:00: as mudanças de New York (02:00) caem dentro dela
+    _configure(monkeypatch, "America/New_York", "01:00", "05:00", days=range(7))
+    rng = random.Random(7)
+    lo = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    hi = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for a, b in _random_ranges(rng, lo, hi, 2000):
+        assert worktime.business_overlap_seconds(a, b) == pytest.approx(
+            _baseline(a, b, wall_clock=False), abs=1e-6), (a, b)
+
+    # domingo de início do horário de verão: 01:00-05:00 dura 3h reais
+    tz = "America/New_York"
+    assert worktime.business_overlap_seconds(
+        _utc(tz, 2023, 3, 12, 0, 0), _utc(tz, 2023, 3, 12, 23, 0)) == 3 * 3600
+    # domingo de fim do horário de verão: 01:00-05:00 dura 5h reais
+    assert worktime.business_overlap_seconds(
+        _utc(tz, 2023, 11, 5, 0, 0), _utc(tz, 2023, 11, 5, 23, 0)) == 5 * 3600
+
+
+@pytest.mark.parametrize("start, end, expected_hours", [
+    # sexta 17:00 -> sábado 10:00: só a última hora da sexta
+    ((2024, 3, 8, 17, 0), (2024, 3, 9, 10, 0), 1),
+    # sábado 12:00 -> segunda 09:00: só a primeira hora da segunda
+    ((2024, 3, 9, 12, 0), (2024, 3, 11, 9, 0), 1),
+    # começa e termina no fim de semana, atravessando uma semana útil inteira
+    ((2024, 3, 9, 12, 0), (2024, 3, 17, 12, 0), 50),
+    # domingo inteiro
+    ((2024, 3, 10, 0, 0), (2024, 3, 10, 23, 59), 0),
+    # quarta 20:00 -> quinta 02:00 (cruza meia-noite fora do expediente)
+    ((2024, 3, 13, 20, 0), (2024, 3, 14, 2, 0), 0),
+    # terça 12:00 -> quarta 12:00
+    ((2024, 3, 12, 12, 0), (2024, 3, 13, 12, 0), 10),
+])
+def test_weekend_and_midnight_edges(monkeypatch, start, end, expected_hours):
+    tz = "America/Sao_Paulo"
+    _configure(monkeypatch, tz, "08:00", "18:00")
+    a, b = _utc(tz, *start), _utc(tz, *end)
+    got = worktime.business_overlap_seconds(a, b)
+    assert got == expected_hours * 3600
+    assert got == _baseline(a, b, wall_clock=True)
+
+
+def test_empty_or_reversed_range():
+    now = datetime(2024, 3, 12, 12, 0, tzinfo=timezone.utc)
+    assert worktime.business_overlap_seconds(now, now) == 0.0
+    assert worktime.business_overlap_seconds(now, now - timedelta(hours=1)) == 0.0
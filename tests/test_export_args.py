@@ -0,0 +1,93 @@
+"""!export_csv bruto: datas opcionais não engolem as menções dos membros."""
+import asyncio
+from datetime import date, datetime
+
+import pytest
+
+pytest.importorskip("discord")
+view_mod = pytest.importorskip("discord.ext.commands.view")
+
+from discord.ext import commands
+
+from bot import db, worktime
+from bot.cogs.reports import Reports
+
+ANA, BETO = 123456789012345678, 223456789012345678
+
+
+class _Member:
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+class _Message:
+    attachments = []
+    _state = None
+
+
+@pytest.fixture
+def parse(monkeypatch):
+    async def member(self, ctx, argument):
+        if not argument.startswith("<@"):
+            raise commands.MemberNotFound(argument)
+        return _Member(int(argument.strip("<@!>")))
+
+    monkeypatch.setattr(commands.MemberConverter, "convert", member)
+
+    def run(text):
+        cmd = Reports.export_csv
+        ctx = commands.Context(
+            message=_Message(), bot=None, view=view_mod.StringView(text),
+            prefix="!", command=cmd, invoked_with=cmd.name,
+        )
+        asyncio.run(cmd._parse_arguments(ctx))
+        return [getattr(a, "id", a) for a in ctx.args[1:]]
+
+    return run
+
+
+def test_mention_only(parse):
+    assert parse(f"bruto <@{ANA}>") == ["bruto", None, None, ANA]
+
+
+def test_one_date_then_mentions(parse):
+    assert parse(f"bruto 2024-05-01 <@{ANA}> <@!{BETO}>") == ["bruto", date(2024, 5, 1), None, ANA, BETO]
+
+
+def test_both_dates_and_plain_days(parse):
+    assert parse(f"bruto 2024-05-01 2024-05-03 <@{ANA}>") == ["bruto", date(2024, 5, 1), date(2024, 5, 3), ANA]
+    assert parse("30") == ["30", None, None]
+
+
+class _Guild:
+    id = 10
+    filesize_limit = 8 * 1024 * 1024
+
+
+class _Ctx:
+    guild = _Guild()
+
+    def __init__(self):
+        self.replies = []
+
+    async def reply(self, content=None, **kwargs):
+        self.replies.append(content)
+
+
+def test_one_date_exports_until_today(monkeypatch):
+    calls = []
+
+    async def arun(fn, *args, timeout=None):
+        calls.append(args)
+        return [], 0
+
+    monkeypatch.setattr(db, "arun", arun)
+    ctx = _Ctx()
+    asyncio.run(Reports.export_csv.callback(Reports(None, None), ctx, "bruto", date(2024, 5, 1), None, _Member(ANA)))
+
+    guild_id, start, end, users = calls[0][:4]
+    hoje = datetime.now(worktime.TZ).date()
+    assert (guild_id, users) == (10, [ANA])
+    assert start == worktime.day_bounds(date(2024, 5, 1))[0]
+    assert end == worktime.day_bounds(hoje)[3]
+    assert ctx.replies and "sem dados" in ctx.replies[0]
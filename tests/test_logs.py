@@ -0,0 +1,25 @@
+"""setup_logging/stop_logging podem ser repetidos no mesmo processo."""
+import json
+import logging
+
+from bot import logs
+
+
+def test_restart_after_stop(tmp_path, monkeypatch):
+    monkeypatch.setattr(logs, "LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(logs, "LOG_CONSOLE", False)
+    root = logging.getLogger()
+    level = root.level
+    try:
+        for name in ("primeiro", "segundo"):
+            logs.setup_logging(name)
+            assert logs.log_stats()["dropped"] == 0
+            logging.getLogger("bot.teste").warning("olá %s", name)
+            logs.stop_logging()
+            assert logs.log_stats() == {}
+            assert not any(isinstance(h, logs.NonBlockingQueueHandler) for h in root.handlers)
+            line = (tmp_path / f"{name}.jsonl").read_text(encoding="utf-8").splitlines()[-1]
+            assert json.loads(line)["msg"] == f"olá {name}"
+    finally:
+        logs.stop_logging()
+        root.setLevel(level)
@@ -0,0 +1,65 @@
+"""Migrações de um banco no layout original (TEXT) sem reconstruir índices à toa."""
+import sqlite3
+
+import pytest
+
+from bot import db
+
+ROWS = [
+    (1, "ana", "online", "2024-03-04 11:00:00", 10),
+    (2, "beto", "idle", "2024-03-04 11:05:00", 10),
+    (1, "ana", "offline", "2024-03-04 20:00:00", 10),
+    (2, "beto", "dnd", "lixo", 10),
+]
+INDEXES = {name for name, _ in db._PRESENCE_INDEXES}
+
+
+def _old_db(path, with_indexes=False):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE presence_log (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, "
+        "username TEXT NOT NULL, status TEXT NOT NULL, timestamp DATETIME NOT NULL, guild_id INTEGER NOT NULL)"
+    )
+    conn.executemany(
+        "INSERT INTO presence_log (user_id, username, status, timestamp, guild_id) VALUES (?, ?, ?, ?, ?)", ROWS
+    )
+    if with_indexes:
+        # banco que já passou pelas migrações 1 e 2 numa versão anterior do bot
+        conn.execute("CREATE TABLE schema_version (version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at TEXT NOT NULL)")
+        conn.executemany("INSERT INTO schema_version VALUES (?, 'x', '2024-01-01')", [(1,), (2,)])
+        db._create_presence_indexes(conn)
+    conn.commit()
+    conn.close()
+
+
+def _indexes(path):
+    with sqlite3.connect(path) as conn:
+        return {r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'presence_log'")} & INDEXES
+
+
+@pytest.mark.parametrize("with_indexes", [False, True])
+def test_text_rewrite_runs_without_indexes(tmp_path, monkeypatch, with_indexes):
+    path = str(tmp_path / "old.db")
+    _old_db(path, with_indexes)
+
+    # só até a conversão de timestamps: os índices ainda não podem existir
+    monkeypatch.setattr(db, "_MIGRATIONS", db._MIGRATIONS[:3])
+    db.init_db(path, readers=1)
+    db.close_db()
+    assert _indexes(path) == set()
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT typeof(timestamp), COUNT(*) FROM presence_log GROUP BY 1").fetchall() == [("integer", 3)]
+
+    monkeypatch.undo()
+    db.init_db(path, readers=1)
+    try:
+        assert _indexes(path) == INDEXES
+        assert db.status_before(10, 1, 1_709_600_000) == "offline"
+        assert db.fetch_all("SELECT user_id, username FROM users ORDER BY 1") == [(1, "ana"), (2, "beto")]
+    finally:
+        db.close_db()
+
+
+def test_new_database_gets_indexes(tmp_db):
+    assert _indexes(tmp_db) == INDEXES
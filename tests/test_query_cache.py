@@ -0,0 +1,61 @@
+"""Gerações do QueryCache: só mudança de status suja o servidor."""
+import asyncio
+
+from bot.cache import QueryCache
+
+GUILD = 10
+
+
+def _run(cache, loads):
+    async def loader():
+        loads.append(1)
+        return [("linha",)]
+    return asyncio.run(cache.get(GUILD, "stats", (), loader))
+
+
+def _row(user_id, status, ts=0, guild_id=GUILD):
+    return (user_id, f"u{user_id}", status, ts, guild_id)
+
+
+def test_repeated_samples_keep_entry_fresh():
+    cache = QueryCache(ttl=60, max_stale=0)
+    cache.written([_row(1, "online"), _row(2, "idle")])
+    loads = []
+    _run(cache, loads)
+
+    # ciclo do sampler sem mudanças: a entrada continua valendo
+    cache.written([_row(1, "online", 60), _row(2, "idle", 60)])
+    _run(cache, loads)
+    assert len(loads) == 1
+    assert cache.stats()["repeated_rows"] == 2
+
+    # uma troca de status suja o servidor
+    cache.written([_row(1, "online", 120), _row(2, "dnd", 120)])
+    _run(cache, loads)
+    assert len(loads) == 2
+
+
+def test_new_member_and_other_guild():
+    cache = QueryCache(ttl=60, max_stale=0)
+    cache.written([_row(1, "online")])
+    loads = []
+    _run(cache, loads)
+
+    # outro servidor mudando não afeta este
+    cache.written([_row(1, "idle", guild_id=GUILD + 1)])
+    _run(cache, loads)
+    assert len(loads) == 1
+
+    # membro visto pela primeira vez conta como mudança
+    cache.written([_row(3, "online")])
+    _run(cache, loads)
+    assert len(loads) == 2
+
+
+def test_invalidate_forgets_last_status():
+    cache = QueryCache(ttl=60, max_stale=0)
+    cache.written([_row(1, "online")])
+    cache.invalidate(GUILD)
+    gen = cache._generation.get(GUILD)
+    cache.written([_row(1, "online")])
+    assert cache._generation.get(GUILD) == gen + 1
@@ -0,0 +1,110 @@
+"""rollup.daily_business_durations (presence_daily + bordas) contra o log bruto."""
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from bot import db, rollup, timeline, worktime
+
+GUILD, USER = 10, 1
+FIRST = date(2024, 3, 4)  # segunda-feira; sem horário de verão em São Paulo
+DAYS = 14
+
+
+def _populate(rng, start_ts, end_ts, user_id=USER):
+    rows, t = [], start_ts
+    while t < end_ts:
+        rows.append((user_id, f"u{user_id}", rng.choice(("online", "idle", "dnd", "offline")), t, GUILD))
+        t += rng.randint(120, 3 * 3600)
+    db.log_presence_many(rows)
+    return rows
+
+
+def _raw(start_ts, end_ts):
+    """Mesmo cálculo, dia a dia, só com o log bruto."""
+    out = {}
+    d = worktime.local_date(start_ts)
+    while d <= worktime.local_date(end_ts):
+        _, ws, we, _ = worktime.day_bounds(d)
+        out[d] = timeline.durations_between(GUILD, USER, max(start_ts, ws), min(end_ts, we))
+        d += timedelta(days=1)
+    return out
+
+
+def _assert_same(got, ref):
+    assert got.keys() == ref.keys()
+    for d in ref:
+        for k in timeline.STATUS_KEYS:
+            assert got[d][k] == pytest.approx(ref[d][k], abs=1e-6), (d, k)
+
+
+@pytest.fixture
+def history(tmp_db):
+    """Duas semanas em ordem, consolidadas, e mais dois dias depois do cursor."""
+    rng = random.Random(11)
+    begin = worktime.day_bounds(FIRST)[0] + 6 * 3600
+    rolled_end = worktime.day_bounds(FIRST + timedelta(days=DAYS - 2))[0]
+    _populate(rng, begin, rolled_end)
+    rollup.catch_up()
+    _populate(rng, rolled_end + 60, worktime.day_bounds(FIRST + timedelta(days=DAYS))[0])
+    frontier = db.fetch_one("SELECT ts FROM rollup_cursor WHERE guild_id = ? AND user_id = ?", (GUILD, USER))[0]
+    return begin, frontier
+
+
+def test_random_ranges_agree_with_raw(history):
+    begin, _ = history
+    span_end = worktime.day_bounds(FIRST + timedelta(days=DAYS))[0]
+    rng = random.Random(3)
+    for _ in range(200):
+        a = rng.uniform(begin - 2 * 86400, span_end)
+        b = a + rng.uniform(0, 9 * 86400)
+        _assert_same(rollup.daily_business_durations(GUILD, USER, a, b), _raw(a, b))
+
+
+def test_edges_read_only_missing_days(history, monkeypatch):
+    _, frontier = history
+    # começa no meio do 2º dia e termina no meio do expediente de um dia já
+    # consolidado (antes do cursor): os dois dias cortados vão ao bruto
+    start = worktime.day_bounds(FIRST + timedelta(days=1))[1] + 3600
+    end = worktime.day_bounds(worktime.local_date(frontier) - timedelta(days=1))[1] + 2 * 3600
+    assert worktime.local_date(end) > worktime.local_date(start) + timedelta(days=5)
+
+    spans = []
+
+    def spy(fn):
+        def wrapper(guild_id, user, a, b):
+            spans.append((a, b))
+            return fn(guild_id, user, a, b)
+        return wrapper
+
+    monkeypatch.setattr(db, "guild_events", spy(db.guild_events))
+    monkeypatch.setattr(db, "events_between", spy(db.events_between))
+    got = rollup.daily_business_durations(GUILD, USER, start, end)
+    monkeypatch.undo()
+
+    _assert_same(got, _raw(start, end))
+    # uma consulta por borda, cada uma dentro do seu dia
+    assert len(spans) == 2
+    for a, b in spans:
+        assert worktime.local_date(a) == worktime.local_date(b)
+
+
+def test_user_without_rollup_uses_raw(tmp_db):
+    begin = worktime.day_bounds(FIRST)[1]
+    _populate(random.Random(5), begin, begin + 3 * 86400)
+    a, b = begin - 3600, begin + 3 * 86400
+    _assert_same(rollup.daily_business_durations(GUILD, USER, a, b), _raw(a, b))
+
+
+def test_out_of_order_insert_counts_from_cursor(tmp_db):
+    # documentado em process_pending: evento que chega atrasado vale a partir
+    # do cursor, então os dias já consolidados divergem do log bruto
+    _, ws, we, _ = worktime.day_bounds(FIRST)
+    db.log_presence_many([(USER, "u1", "online", ws, GUILD), (USER, "u1", "offline", we + 3600, GUILD)])
+    rollup.catch_up()
+    db.log_presence_many([(USER, "u1", "idle", ws + 3600, GUILD)])
+    rollup.catch_up()
+
+    day = rollup.daily_business_durations(GUILD, USER, ws, we)[FIRST]
+    assert day["online"] == we - ws
+    assert _raw(ws, we)[FIRST]["idle"] == we - ws - 3600
@@ -0,0 +1,61 @@
+"""Modo com shards: shards só leem; o gravador grava, migra e roda o rollup."""
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from bot import db, ingest
+
+
+def test_read_only_init_has_no_writer(tmp_db):
+    db.log_presence_many([(1, "ana", "online", 1_700_000_000, 10)])
+    version = db.fetch_one("SELECT MAX(version) FROM schema_version")[0]
+    db.close_db()
+
+    db.init_db(tmp_db, readers=1, read_only=True)
+    assert db.fetch_one("SELECT COUNT(*) FROM presence_log")[0] == 1
+    assert db.fetch_one("SELECT MAX(version) FROM schema_version")[0] == version
+    with pytest.raises(RuntimeError):
+        with db.write_conn():
+            pass
+    with pytest.raises(RuntimeError):
+        db.log_presence_many([(1, "ana", "idle", 1_700_000_100, 10)])
+
+
+def test_sink_process_writes_and_rolls_up(tmp_path, monkeypatch):
+    # o processo filho (spawn) herda o ambiente: rollup a cada 1s, logs no tmp
+    monkeypatch.setenv("ROLLUP_EVERY_SECONDS", "1")
+    monkeypatch.setenv("LOG_DIR", str(tmp_path / "logs"))
+    monkeypatch.setenv("LOG_CONSOLE", "0")
+    path = str(tmp_path / "presence.db")
+    address = str(tmp_path / "ingest.sock") if os.name != "nt" else ("127.0.0.1", 0)
+    authkey = os.urandom(16)
+
+    ctx = multiprocessing.get_context("spawn")
+    proc = ctx.Process(target=ingest.run_sink, args=(address, authkey, path, {"readers": 1}))
+    proc.start()
+    try:
+        ingest.wait_for_sink(address, authkey, timeout=30)
+        db.init_db(path, readers=1, read_only=True)
+        sink = ingest.RemoteSink(address, authkey)
+        t0 = int(time.time()) - 3600
+        sink([(1, "ana", "online", t0, 10), (1, "ana", "idle", t0 + 600, 10)])
+        sink.close()
+
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            if db.fetch_one("SELECT COUNT(*) FROM rollup_cursor")[0]:
+                break
+            time.sleep(0.2)
+        assert db.fetch_one("SELECT COUNT(*) FROM presence_log")[0] == 2
+        assert db.fetch_one("SELECT status, ts FROM rollup_cursor WHERE user_id = 1") == (
+            db.status_code("idle"), t0 + 600)
+        assert db.fetch_one("SELECT SUM(inside_s + outside_s) FROM presence_daily")[0] == 600
+    finally:
+        db.close_db()
+        ingest.stop_sink(address, authkey)
+        proc.join(timeout=30)
+        if proc.is_alive():
+            proc.terminate()
+    assert proc.exitcode == 0
@@ -0,0 +1,84 @@
+"""Smoke test dos comandos do cog Stats (chamam o callback direto, sem gateway)."""
+import asyncio
+
+import pytest
+
+pytest.importorskip("discord")
+
+from bot import db, livecounts
+from bot.cogs.stats import Stats
+from bot.config import Config
+
+GUILD = 10
+
+
+class _Member:
+    def __init__(self, user_id, name, status="online", bot=False):
+        self.id = user_id
+        self.display_name = name
+        self.status = status
+        self.bot = bot
+
+
+class _Guild:
+    id = GUILD
+    name = "teste"
+    chunked = True
+
+    def __init__(self, members):
+        self.members = members
+        self.member_count = len(members)
+
+
+class _Ctx:
+    def __init__(self, guild, author):
+        self.guild = guild
+        self.author = author
+        self.replies = []
+
+    async def reply(self, content=None, **kwargs):
+        self.replies.append(content)
+
+
+@pytest.fixture
+def ctx(tmp_db):
+    now = db.now_ts()
+    db.log_presence_many([
+        (1, "ana", "online", now - 3600, GUILD),
+        (1, "ana", "idle", now - 1800, GUILD),
+        (1, "ana", "online", now - 600, GUILD),
+        (2, "bia", "dnd", now - 1200, GUILD),
+        (3, "outro", "online", now - 100, GUILD + 1),  # outro servidor: não conta
+    ])
+    members = [_Member(1, "ana"), _Member(2, "bia", "dnd"), _Member(9, "robo", bot=True)]
+    guild = _Guild(members)
+    yield _Ctx(guild, members[0])
+    livecounts.forget(GUILD)
+
+
+def _run(command, cog, ctx, *args):
+    asyncio.run(command.callback(cog, ctx, *args))
+    return ctx.replies[-1]
+
+
+def test_stats_command(ctx):
+    cog = Stats(None, Config(token="x"))
+    reply = _run(Stats.stats, cog, ctx)
+    assert "ana" in reply
+    assert "ONLINE: 2" in reply
+    assert "AUSENTE: 1" in reply
+
+
+def test_leaderboard_command(ctx):
+    cog = Stats(None, Config(token="x"))
+    reply = _run(Stats.leaderboard, cog, ctx)
+    assert reply.splitlines()[1].startswith("1. `ana` — 3")
+    assert "outro" not in reply
+
+
+def test_status_servidor_command(ctx):
+    cog = Stats(None, Config(token="x"))
+    livecounts.seed(ctx.guild)
+    reply = _run(Stats.status_servidor, cog, ctx)
+    assert "ONLINE: 1" in reply
+    assert "NÃO PERTURBE: 1" in reply
@@ -0,0 +1,81 @@
+"""_durations_by_window: dias fora do rollup não viram uma consulta por dia."""
+import random
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("discord")
+
+from bot import db, rollup, timeline, worktime
+from bot.cogs import workcheck
+
+GUILD, USER = 10, 1
+FIRST = date(2024, 3, 4)
+DAYS = 5
+
+
+def _windows():
+    out = []
+    for i in range(DAYS):
+        _, ws, we, _ = worktime.day_bounds(FIRST + timedelta(days=i))
+        out.append((datetime.fromtimestamp(ws, timezone.utc), datetime.fromtimestamp(we, timezone.utc)))
+    return out
+
+
+@pytest.fixture
+def events(tmp_db):
+    rng = random.Random(2)
+    t, end = worktime.day_bounds(FIRST)[0] - 86400, worktime.day_bounds(FIRST + timedelta(days=DAYS))[0]
+    rows = []
+    while t < end:
+        rows.append((USER, "ana", rng.choice(("online", "idle", "dnd", "offline")), t, GUILD))
+        t += rng.randint(300, 4 * 3600)
+    db.log_presence_many(rows)
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    calls = []
+    for name in ("guild_events", "events_between", "status_before"):
+        fn = getattr(db, name)
+
+        def spy(*args, _fn=fn, _name=name):
+            calls.append(_name)
+            return _fn(*args)
+
+        monkeypatch.setattr(db, name, spy)
+    return calls
+
+
+def _by_window(janelas):
+    return workcheck._durations_by_window(
+        GUILD, USER, janelas, worktime.TZ, worktime.START_HM, worktime.END_HM
+    )
+
+
+def _raw(janelas):
+    return [timeline.durations_between(GUILD, USER, a.timestamp(), b.timestamp()) for a, b in janelas]
+
+
+def test_without_rollup_one_raw_read(events, reads):
+    # banco novo: nada consolidado ainda, todos os dias vêm do bruto
+    janelas = _windows()
+    got = _by_window(janelas)
+    assert reads == ["guild_events"]
+    assert got == pytest.approx(_raw(janelas))
+
+
+def test_days_missing_from_rollup_share_one_read(events, reads, monkeypatch):
+    janelas = _windows()
+    real = rollup.daily_business_durations
+
+    def partial(*args):
+        out = real(*args)
+        for i in (1, 2, 4):
+            out.pop(FIRST + timedelta(days=i))
+        return out
+
+    monkeypatch.setattr(rollup, "daily_business_durations", partial)
+    got = _by_window(janelas)
+    assert reads == ["guild_events", "guild_events"]  # rollup (bruto) + uma para as 3 que faltam
+    assert got == pytest.approx(_raw(janelas))
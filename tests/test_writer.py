@@ -0,0 +1,54 @@
+"""PresenceWriter.stop com um lote ainda em gravação na thread do sink."""
+import asyncio
+import threading
+
+from bot import db
+
+ROWS = [(1, "ana", "online", 100, 10), (2, "beto", "idle", 101, 10)]
+
+
+def test_stop_waits_for_inflight_batch(monkeypatch):
+    entered, release = threading.Event(), threading.Event()
+    stored, seen = [], []
+
+    def sink(batch):
+        entered.set()
+        release.wait(5)
+        stored.extend(batch)
+
+    monkeypatch.setattr(db, "_write_listeners", [seen.append])
+
+    async def main():
+        writer = db.PresenceWriter(batch_size=2, flush_interval=0, sink=sink)
+        writer.start()
+        for row in ROWS:
+            await writer.put(row)
+        assert await asyncio.to_thread(entered.wait, 5)
+
+        stopping = asyncio.ensure_future(writer.stop())
+        await asyncio.sleep(0.05)
+        assert not stopping.done()  # o lote ainda está na thread
+        release.set()
+        await stopping
+        return writer
+
+    writer = asyncio.run(main())
+    assert stored == ROWS
+    assert seen == [ROWS]
+    assert writer.written == 2 and writer.flushes == 1 and writer.depth == 0
+
+
+def test_stop_flushes_queue(monkeypatch):
+    stored = []
+    monkeypatch.setattr(db, "_write_listeners", [])
+
+    async def main():
+        writer = db.PresenceWriter(batch_size=1000, flush_interval=60, sink=stored.extend)
+        writer.start()
+        for row in ROWS:
+            await writer.put(row)
+        await writer.stop()
+        return writer
+
+    writer = asyncio.run(main())
+    assert stored == ROWS and writer.written == 2